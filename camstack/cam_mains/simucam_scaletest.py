@@ -0,0 +1,342 @@
+'''
+    Multi-camera scale test: N SimulatedCam, each in its own process,
+    running the same control script in lockstep.
+
+    Usage:
+        simucam_scaletest.py [options]
+
+    Options:
+        -n <n_cams>      Number of cameras [default: 6]
+        -S <scene>       Scene of the simulated cameras (see simcam_framegen) [default: psf]
+        -c <csets>       Cpusets of the takers, comma-separated, cycled over
+                         the cameras. Needs -p. [default: system]
+        -p <rtprio>      RT priority of the takers and dependents [default: none]
+        -a <cpus>        CPU affinity of the camera control processes,
+                         semicolon-separated, cycled over the cameras
+                         (e.g. "0-1;2-3"). [default: none]
+        -d <dep_cmd>     Dependent process per camera, %s is the stream name
+                         (e.g. "shmimmon %s"). [default: none]
+        -s <script>      JSON control script: [[action, argument], ...]
+                         actions: set_camera_mode (mode ID), set_fps (Hz),
+                         measure (sec.). [default: none]
+        -o <json_file>   Write all the results to a json file.
+
+    Measured, per camera and per step:
+        - control steps: duration of the call, then delay until a new frame.
+        - measure steps: frame rate seen by a consumer vs. the taker rate,
+          frames missed by the consumer, publish-to-consume latency,
+          CPU of the taker and dependents (% of a core), pacing jitter and
+          overruns of the taker (simcam_framegen keywords).
+    Plus the host CPU over the whole run.
+'''
+from typing import Any, Dict, List, Optional as Op, Tuple
+
+import os
+import json
+import time
+import queue
+import multiprocessing as mp
+
+import numpy as np
+
+from pyMilk.interfacing.isio_shmlib import SHM
+
+from camstack.cams.simulatedcam import SimulatedCam
+from camstack.core import tmux as tmux_util
+from camstack.core import utilities as util
+from camstack.core.logger import init_camstack_logger
+
+StepType = Tuple[str, Any]
+
+# (action, argument)
+DEFAULT_SCRIPT: List[StepType] = [
+        ('set_fps', 200.),
+        ('measure', 5.),
+        ('set_camera_mode', 1),
+        ('set_fps', 1000.),
+        ('measure', 5.),
+        ('set_camera_mode', 2),
+        ('set_fps', 2000.),
+        ('measure', 5.),
+        ('set_camera_mode', 0),
+        ('set_fps', 100.),
+        ('measure', 5.),
+]
+
+LATENCY_SAMPLING = 10  # Latency (keyword read) on one frame out of N
+NEW_FRAME_TIMEOUT = 10.  # sec.
+RESULTS_POLL = 1.  # sec. - checks for dead workers in between
+
+
+class ScaleTestCam(SimulatedCam):
+
+    # yapf: disable
+    MODES = {
+            0: util.CameraMode(x0=0, x1=1023, y0=0, y1=1023),
+            1: util.CameraMode(x0=0, x1=511, y0=0, y1=511),
+            2: util.CameraMode(x0=0, x1=255, y0=0, y1=255),
+    }
+    # yapf: enable
+
+
+def parse_cpus(cpus: str) -> List[int]:
+    '''
+        "0-2,5" -> [0, 1, 2, 5]
+    '''
+    ret: List[int] = []
+    for part in cpus.split(','):
+        lo, _, hi = part.partition('-')
+        ret += list(range(int(lo), int(hi or lo) + 1))
+    return ret
+
+
+def proc_cpu_time(pid: Op[int]) -> float:
+    '''
+        User + system CPU time of a process (sec.), 0 if it's gone.
+    '''
+    if pid is None:
+        return 0.
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            # comm may contain spaces: split after its closing parenthesis.
+            fields = f.read().rsplit(')', 1)[1].split()
+    except (OSError, IndexError):
+        return 0.
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def host_cpu_times() -> Tuple[float, float]:
+    '''
+        (busy, total) jiffies of the host.
+    '''
+    with open('/proc/stat') as f:
+        vals = [int(v) for v in f.readline().split()[1:]]
+    idle = vals[3] + vals[4]  # idle + iowait
+    return sum(vals) - idle, sum(vals)
+
+
+def wait_new_frame(cam: SimulatedCam, timeout: float) -> float:
+    '''
+        Returns the time (sec.) until the camera SHM counter moves, or nan.
+    '''
+    t_start = time.monotonic()
+    cnt0 = cam.camera_shm.IMAGE.md.cnt0
+    while time.monotonic() - t_start < timeout:
+        if cam.camera_shm.IMAGE.md.cnt0 != cnt0:
+            return time.monotonic() - t_start
+        time.sleep(1e-4)
+    return float('nan')
+
+
+def measure(cam: SimulatedCam, consumer: SHM,
+            duration: float) -> Dict[str, Any]:
+    taker_pid = tmux_util.find_pane_running_pid(cam.take_tmux_pane)
+    dep_pids = [dep.get_pid() for dep in cam.dependent_processes]
+
+    cpu_taker = proc_cpu_time(taker_pid)
+    cpu_deps = sum(proc_cpu_time(pid) for pid in dep_pids)
+
+    n_recv = 0
+    cnt_first, cnt_last = -1, -1
+    t_first, t_last = 0., 0.
+    latencies: List[float] = []
+
+    t_start = time.time()
+    while time.time() - t_start < duration:
+        try:
+            consumer.get_data(check=True, timeout=1.0)
+        except Exception:  # Timeout
+            continue
+        t_recv = time.time()
+        cnt = consumer.IMAGE.md.cnt0
+        if n_recv == 0:
+            cnt_first, t_first = cnt, t_recv
+        cnt_last, t_last = cnt, t_recv
+        n_recv += 1
+
+        if n_recv % LATENCY_SAMPLING == 0:
+            latencies += [t_recv * 1e6 - consumer.get_keywords()['_MAQTIME']]
+
+    elapsed = time.time() - t_start
+    kws = consumer.get_keywords()
+    lat = np.asarray(latencies) if latencies else np.asarray([np.nan])
+    fps = (cnt_last - cnt_first) / max(t_last - t_first, 1e-9)
+    cpu_taker = proc_cpu_time(taker_pid) - cpu_taker
+    cpu_deps = sum(proc_cpu_time(pid) for pid in dep_pids) - cpu_deps
+
+    return {
+            'fps_consumer': fps,
+            'fps_taker': kws.get('MFRATE', np.nan),
+            'fps_target': 1e6 / kws['_ETIMEUS'],
+            'missed': max(0, cnt_last - cnt_first + 1 - n_recv),
+            'latency_us_p50': float(np.percentile(lat, 50)),
+            'latency_us_p99': float(np.percentile(lat, 99)),
+            'cpu_taker': cpu_taker / elapsed * 100,
+            'cpu_deps': cpu_deps / elapsed * 100,
+            'jitter_rms_us': kws.get('_JITRMS', np.nan),
+            'overruns': kws.get('_OVRRUNS', -1),
+    }
+
+
+def camera_worker(index: int, config: Dict[str, Any], script: List[StepType],
+                  barrier, results) -> None:
+    '''
+        One camera, in its own process.
+    '''
+    init_camstack_logger(os.environ['HOME'] +
+                         f'/logs/camstack-scaletest-{index}.log')
+
+    if config['cpus']:
+        cpus = config['cpus'][index % len(config['cpus'])]
+        os.sched_setaffinity(0, parse_cpus(cpus))
+
+    name = f'scaletest{index}'
+    cset = config['csets'][index % len(config['csets'])]
+
+    deps: List[util.DependentProcess] = []
+    if config['dep_cmd'] is not None:
+        deps += [
+                util.DependentProcess(tmux_name=f'{name}_dep',
+                                      cli_cmd=config['dep_cmd'],
+                                      cli_args=[name], cset=cset,
+                                      rtprio=config['rtprio'])
+        ]
+
+    cam = None
+    consumer: Op[SHM] = None  # Reopened after a mode change only
+    try:
+        cam = ScaleTestCam(name, name, mode_id=0, scene=config['scene'],
+                           taker_cset_prio=(cset, config['rtprio']),
+                           dependent_processes=deps)
+
+        for step_idx, (action, arg) in enumerate(script):
+            barrier.wait()  # All cameras step together.
+
+            record: Dict[str, Any] = {
+                    'cam': index,
+                    'step': step_idx,
+                    'action': action,
+                    'arg': arg
+            }
+            if action == 'measure':
+                if consumer is None:
+                    consumer = SHM(cam.STREAMNAME)
+                record.update(measure(cam, consumer, float(arg)))
+            else:
+                if action == 'set_camera_mode' and consumer is not None:
+                    consumer.close()  # The taker recreates the SHM
+                    consumer = None
+                t_start = time.monotonic()
+                getattr(cam, action)(arg)
+                record['call_s'] = time.monotonic() - t_start
+                record['new_frame_s'] = wait_new_frame(cam, NEW_FRAME_TIMEOUT)
+            results.put(record)
+    except:
+        barrier.abort()  # Don't leave the other cameras hanging.
+        raise
+    finally:
+        if consumer is not None:
+            consumer.close()
+        if cam is not None:
+            cam.close()
+        results.put(index)  # Done
+
+
+def print_report(records: List[Dict[str, Any]]) -> None:
+    records = sorted(records, key=lambda r: (r['step'], r['cam']))
+
+    print(f'{"step":>4s} {"cam":>3s} {"action":<16s}{"arg":>8s}'
+          f'{"call ms":>10s}{"frame ms":>10s}')
+    for r in records:
+        if r['action'] != 'measure':
+            print(f'{r["step"]:4d} {r["cam"]:3d} {r["action"]:<16s}'
+                  f'{r["arg"]:>8}{r["call_s"] * 1e3:10.1f}'
+                  f'{r["new_frame_s"] * 1e3:10.1f}')
+
+    print()
+    print(f'{"step":>4s} {"cam":>3s}{"target":>9s}{"taker":>9s}{"consumr":>9s}'
+          f'{"missed":>8s}{"lat50us":>9s}{"lat99us":>9s}{"cpu%":>7s}'
+          f'{"deps%":>7s}{"jit us":>8s}{"ovrrun":>8s}')
+    for r in records:
+        if r['action'] == 'measure':
+            print(f'{r["step"]:4d} {r["cam"]:3d}{r["fps_target"]:9.1f}'
+                  f'{r["fps_taker"]:9.1f}{r["fps_consumer"]:9.1f}'
+                  f'{r["missed"]:8d}{r["latency_us_p50"]:9.0f}'
+                  f'{r["latency_us_p99"]:9.0f}{r["cpu_taker"]:7.1f}'
+                  f'{r["cpu_deps"]:7.1f}{r["jitter_rms_us"]:8.1f}'
+                  f'{r["overruns"]:8d}')
+
+
+def run_scale_test(n_cams: int, config: Dict[str, Any],
+                   script: List[StepType]) -> Dict[str, Any]:
+
+    ctx = mp.get_context('spawn')
+    barrier = ctx.Barrier(n_cams)
+    results = ctx.Queue()
+
+    busy_0, total_0 = host_cpu_times()
+
+    procs = [
+            ctx.Process(target=camera_worker,
+                        args=(kk, config, script, barrier, results))
+            for kk in range(n_cams)
+    ]
+    for proc in procs:
+        proc.start()
+
+    records: List[Dict[str, Any]] = []
+    done = set()
+    while len(done) < n_cams:
+        try:
+            rec = results.get(timeout=RESULTS_POLL)
+        except queue.Empty:
+            # A worker killed hard never reports: free the others.
+            for kk, proc in enumerate(procs):
+                if kk not in done and not proc.is_alive():
+                    print(f'Camera {kk} worker died '
+                          f'(exit code {proc.exitcode}).')
+                    barrier.abort()
+                    done.add(kk)
+            continue
+        if isinstance(rec, int):
+            done.add(rec)
+        else:
+            records += [rec]
+
+    for proc in procs:
+        proc.join()
+
+    busy_1, total_1 = host_cpu_times()
+    host_cpu = (busy_1 - busy_0) / max(total_1 - total_0, 1) * 100
+
+    print_report(records)
+    print(f'\nHost CPU over the run: {host_cpu:.1f} %')
+
+    return {'config': config, 'host_cpu': host_cpu, 'records': records}
+
+
+if __name__ == "__main__":
+    import docopt
+
+    args = docopt.docopt(__doc__)
+
+    os.makedirs(os.environ['HOME'] + "/logs", exist_ok=True)
+
+    config = {
+            'scene': args['-S'],
+            'csets': args['-c'].split(','),
+            'rtprio': None if args['-p'] == 'none' else int(args['-p']),
+            'cpus': [] if args['-a'] == 'none' else args['-a'].split(';'),
+            'dep_cmd': None if args['-d'] == 'none' else args['-d'],
+    }
+
+    script = DEFAULT_SCRIPT
+    if args['-s'] != 'none':
+        with open(args['-s']) as f:
+            script = [tuple(step) for step in json.load(f)]
+
+    report = run_scale_test(int(args['-n']), config, script)
+
+    if args['-o'] is not None:
+        with open(args['-o'], 'w') as f:
+            json.dump(report, f, indent=1, default=float)
@@ -5,6 +5,7 @@ import time
 import subprocess
 import threading
 import logging as logg
+from concurrent.futures import ThreadPoolExecutor
 
 from camstack.core import utilities as util
 from camstack.core import tmux as tmux_util
@@ -92,6 +93,11 @@ class BaseCamera:
 
     N_WCS: int = 0  # Number of WCS keyword sets to allocate on top of the dictionary above.
 
+    # Ring buffer (cube) output - only for the python takers (src/*_usbtake,
+    # src/simcam_framegen), see camstack.core.shm_ring
+    # 0: plain 2D output. May be overridden per instance (self.ring_depth)
+    RING_DEPTH: int = 0
+
     def __init__(self, name: str, stream_name: str,
                  mode_id_or_hw: util.ModeIDorHWType, no_start: bool = False,
                  taker_cset_prio: util.CsetPrioType = ('system', None),
@@ -126,11 +132,15 @@ class BaseCamera:
         self.dependent_processes_manager.initialize_tmux()
 
         self.taker_cset_prio = taker_cset_prio
+        self.ring_depth = self.RING_DEPTH
 
         # Thread:
         self.event: Op[threading.Event] = None
         self.thread: Op[threading.Thread] = None
 
+        # Control executor, for the asyncio facade - see get_control_executor
+        self._control_executor: Op[ThreadPoolExecutor] = None
+
         #=======================
         # TMUX TAKE SESSION MGMT
         #=======================
@@ -153,12 +163,18 @@ class BaseCamera:
         # Now we have a serial link, in case prepare camera needs it.
         self.prepare_camera_for_size()
 
+        self.camera_shm: Op[SHM] = None
+
         if no_start:
             # We need to quit now
             # That also means not starting will not create the SHM
             # And this __init__ will not populate the keywords :(.
+            # Subclasses may call _start_acquisition later.
             return
 
+        self._start_acquisition()
+
+    def _start_acquisition(self) -> None:
         # ====================
         # START THE TAKE - and thus expect the SHM to be created
         # - we only start the take because we want the keywords to be populated ASAP
@@ -169,7 +185,6 @@ class BaseCamera:
         # =================
         # ALLOCATE KEYWORDS
         # =================
-        self.camera_shm: Op[SHM] = None
         self.grab_shm_fill_keywords()
         self.redis_push_values()
         # Maybe we can use a class variable as well to define what the expected keywords are ?
@@ -306,6 +321,21 @@ class BaseCamera:
         '''
         self.release()
 
+        if self._control_executor is not None:
+            # No wait: close may be called from the executor itself.
+            self._control_executor.shutdown(wait=False)
+            self._control_executor = None
+
+    def get_control_executor(self) -> ThreadPoolExecutor:
+        '''
+            Single-worker executor on which control calls can be offloaded
+            See camstack.core.asyncio_control.AsyncCamera
+        '''
+        if self._control_executor is None:
+            from camstack.core.asyncio_control import make_control_executor
+            self._control_executor = make_control_executor(self.NAME)
+        return self._control_executor
+
     def _start_taker_no_dependents(self, reuse_shm: bool = False, *,
                                    bypass_aux_thread: bool = False) -> None:
         # We have to prepare self.taker_tmux_command
@@ -346,8 +376,14 @@ class BaseCamera:
         self._start_taker_no_dependents()
 
     def _prepare_backend_cmdline(self, reuse_shm: bool = False) -> None:
+        # Subclasses with a python taker append self._ring_cmdline_option()
         raise NotImplementedError("Must be subclassed from the base class")
 
+    def _ring_cmdline_option(self) -> str:
+        if self.ring_depth > 1:
+            return f' -z {self.ring_depth}'
+        return ''
+
     def _ensure_backend_restarted(self) -> None:
         raise NotImplementedError("Must be subclassed from the base class")
 
@@ -1,13 +1,16 @@
 '''
     Apapane
 '''
-from typing import Union, Optional as Op, Tuple, List
+from typing import Any, Callable, Dict, Union, Optional as Op, Tuple, List
 
 import os
 import time
+import threading
 import logging as logg
+from concurrent.futures import Future
 
 from camstack.cams.edtcam import EDTCamera
+from camstack.cams.fli_cropping import FLICropEngine
 
 from camstack.core.utilities import (CameraMode, ModeIDType, CsetPrioType,
                                      DependentProcess)
@@ -24,11 +27,140 @@ class ROMODES:
     cds = 'globalresetcds'
     bursts = 'globalresetbursts'
 
+    @staticmethod
+    def for_NDR(NDR: int) -> str:
+        return (ROMODES.single, ROMODES.cds, ROMODES.bursts)[min(3, NDR) - 1]
+
+
+ROStateType = Tuple[str, int]  # (readout mode, NDR)
+
+
+def readout_transition(current: Op[ROStateType], NDR: int) -> List[str]:
+    '''
+        Readout state machine of the CRED1: the readout mode follows the NDR
+        (1: single, 2: cds, 3+: bursts).
+
+        Returns the minimal command sequence from the current state (None if
+        unknown) to the target NDR. The NDR goes first: setting the mode
+        before the NDR has been seen to revert the NDR.
+    '''
+    target = (ROMODES.for_NDR(NDR), NDR)
+    if current == target:
+        return []
+
+    cmds = []
+    if current is None or current[1] != NDR:
+        cmds += [f'set nbreadworeset {NDR}']
+    if current is None or current[0] != target[0]:
+        cmds += [f'set mode {target[0]}']
+    return cmds
+
+
+class InitializationError(Exception):
+    pass
+
+
+class CooldownMonitor:
+    '''
+        Background watch of a CRED1 in status "isbeingcooled".
+
+        Water temperature, cryostat temperature and status are polled on a
+        fixed cadence (absolute deadlines, whatever the serial latency),
+        and cooling is stopped if the water gets too hot.
+
+        future resolves to "operational" - after on_operational has run - or
+        to an InitializationError.
+    '''
+
+    PERIOD = 2.0  # sec.
+
+    def __init__(self, cam: 'CRED1', on_operational: Op[Callable[[],
+                                                                 None]] = None,
+                 period: Op[float] = None) -> None:
+
+        self.cam = cam
+        self.on_operational = on_operational
+        self.period = self.PERIOD if period is None else period
+
+        self.future: Future = Future()
+        self.status = 'isbeingcooled'
+        self.cryo_temp = float('nan')
+        self.water_temp = float('nan')
+        self.n_polls = 0
+        self.t_start = time.monotonic()
+
+        self._stop = threading.Event()
+        self.thread = threading.Thread(target=self._run,
+                                       name=f'{cam.NAME}_cooldown', daemon=True)
+
+    def start(self) -> None:
+        self.future.set_running_or_notify_cancel()
+        self.thread.start()
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def wait(self, timeout: Op[float] = None) -> str:
+        return self.future.result(timeout)
+
+    def cancel(self) -> None:
+        self._stop.set()
+
+    def progress(self) -> Dict[str, Any]:
+        return {
+                'status': self.status,
+                'cryo_temp': self.cryo_temp,
+                'water_temp': self.water_temp,
+                'elapsed': time.monotonic() - self.t_start,
+                'n_polls': self.n_polls,
+                'done': self.done(),
+        }
+
+    def _poll(self) -> None:
+        self.water_temp = self.cam.get_water_temperature()
+        if self.water_temp > 40.0:
+            self.cam._emergency_abort()
+            raise InitializationError('Water too hot - cooling stopped.')
+
+        self.cryo_temp = self.cam.get_temperature(shm_write=False)
+        self.status = self.cam.get_camera_status()
+        self.n_polls += 1
+        logg.warning(f'status = {self.status} - Cryo temp = '
+                     f'{self.cryo_temp:.1f} - Water temp = '
+                     f'{self.water_temp:.1f}')
+
+    def _run(self) -> None:
+        deadline = time.monotonic()
+        try:
+            while True:
+                self._poll()
+                if self.status == 'operational':
+                    break
+                if self.status != 'isbeingcooled':
+                    raise InitializationError(
+                            f'Camera status "{self.status}" during cooldown.')
+
+                deadline += self.period
+                if self._stop.wait(max(0., deadline - time.monotonic())):
+                    raise InitializationError('Cooldown watch cancelled. '
+                                              'Camera is still cooling tho!')
+
+            logg.warning(f'Camera now cold - status: {self.status}.')
+            if self.on_operational is not None:
+                self.on_operational()
+
+        except Exception as exc:
+            logg.critical(f'CooldownMonitor: {exc}')
+            self.future.set_exception(exc)
+        else:
+            self.future.set_result(self.status)
+
 
 class CRED1(EDTCamera):
 
     INTERACTIVE_SHELL_METHODS = [
-        'set_synchro', 'set_readout_mode',
+        'set_synchro', 'set_readout_mode', 'get_cooldown_progress',
+        'wait_operational',
         'get_readout_mode', 'set_gain', 'get_gain',
         'set_NDR', 'get_NDR', 'set_fps',
         'get_fps', 'set_tint', 'get_tint',
@@ -68,6 +200,8 @@ class CRED1(EDTCamera):
     EDTTAKE_UNSIGNED = True
     EDTTAKE_EMBEDMICROSECOND = True
 
+    SERIAL_EMULATOR = 'cred1'
+
     def __init__(self, name: str, stream_name: str,
                  mode_id: ModeIDType = 'full', unit: int = 1, channel: int = 0,
                  basefile=None, taker_cset_prio: CsetPrioType = ('system',
@@ -79,14 +213,42 @@ class CRED1(EDTCamera):
         if basefile is None:
             basefile = os.environ['HOME'] + '/src/camstack/config/cred1_16bit.cfg'
         self.NDR: Op[int] = None  # Grabbed in prepare_camera_finalize
+        # Cached readout state, and gain (which set mode may reset)
+        self._ro_state: Op[ROStateType] = None
+        self._gain: Op[int] = None
+
+        # CRED1 crops columns by blocks of 32, and is 1-base indexed.
+        self.crop_engine = FLICropEngine(self.send_command, col_block=32,
+                                         index_base=1)
+
+        # Set in process_camera_status if the camera is not cold yet
+        self.cooldown: Op[CooldownMonitor] = None
+        self._start_pending = True
+        # Control is ours until the constructor returns - see send_command
+        self._init_thread: Op[threading.Thread] = threading.current_thread()
 
         # Call EDT camera init
         # This should pre-kill dependent sessions
         # But we should be able to "prepare" the camera before actually starting
+        # Do not start: if the camera is cooling down, the start is deferred
+        # until it is operational, and the constructor returns right away.
         EDTCamera.__init__(self, name, stream_name, mode_id, unit, channel,
-                           basefile, taker_cset_prio=taker_cset_prio,
+                           basefile, no_start=True,
+                           taker_cset_prio=taker_cset_prio,
                            dependent_processes=dependent_processes)
 
+        self._init_thread = None
+
+        if self.cooldown is None:
+            self._start_acquisition()
+        else:
+            logg.warning('CRED1 cooling down - acquisition will start '
+                         'once operational. Control is unavailable until '
+                         'then, see get_cooldown_progress.')
+
+    def _start_acquisition(self) -> None:
+        EDTCamera._start_acquisition(self)
+
         # ======
         # AD HOC
         # ======
@@ -100,6 +262,8 @@ class CRED1(EDTCamera):
 
         self._constructor_finalize()
 
+        self._start_pending = False
+
     # =====================
     # AD HOC PREPARE CAMERA
     # =====================
@@ -109,6 +273,54 @@ class CRED1(EDTCamera):
                 'Calling _constructor_finalize on base CRED1 class. Must subclass.'
         )
 
+    def _check_control_allowed(self) -> None:
+        '''
+            Until the deferred start has completed, the camera is only
+            driven by the constructor and the cooldown monitor.
+        '''
+        cooldown = self.cooldown
+        if cooldown is None or not self._start_pending:
+            return
+        if threading.current_thread() in (cooldown.thread, self._init_thread):
+            return
+
+        if not cooldown.done():
+            raise InitializationError(
+                    f'{self.NAME} cooling down ({cooldown.status}) - '
+                    'control unavailable until operational, '
+                    'see get_cooldown_progress / wait_operational.')
+        raise InitializationError(f'{self.NAME} failed to initialize: '
+                                  f'{cooldown.future.exception()}')
+
+    def set_camera_mode(self, mode_id: ModeIDType) -> None:
+        self._check_control_allowed()
+        EDTCamera.set_camera_mode(self, mode_id)
+
+    def get_cooldown_progress(self) -> Dict[str, Any]:
+        if self.cooldown is None:
+            return {'status': 'operational', 'done': True}
+        return self.cooldown.progress()
+
+    def wait_operational(self, timeout: Op[float] = None) -> str:
+        '''
+            Blocks until the cooldown is over and the acquisition started.
+            Ctrl + C aborts: the camera is released (but still cooling).
+        '''
+        if self.cooldown is None:
+            return 'operational'
+        try:
+            return self.cooldown.wait(timeout)
+        except KeyboardInterrupt:
+            self.cooldown.cancel()
+            self.cooldown.thread.join()  # Incl. the release by _cooldown_done
+            raise InitializationError('CRED1 not cold yet.')
+
+    def _cooldown_done(self, future: Future) -> None:
+        if future.exception() is not None and self._start_pending:
+            logg.error(
+                    'Abort during cooling wait. Camera is still cooling tho!')
+            self.release()
+
     def prepare_camera_for_size(self, mode_id: Op[ModeIDType] = None) -> None:
         # Note: when called the first time, this immediately follows
         # self.init_framegrab_backend()
@@ -122,14 +334,9 @@ class CRED1(EDTCamera):
         if mode_id is None:
             mode_id = self.current_mode_id
 
-        # Not really handling fps/tint for the OCAM, we just assume an ext trigger
-        if mode_id == 'full':  #TODO
-            self.send_command('set cropping off')
-        else:
-            self.send_command('set cropping on')
-
         mode = self.MODES[mode_id]
-        self._set_check_cropping(mode.x0, mode.x1, mode.y0, mode.y1)
+        self._set_check_cropping(mode.x0, mode.x1, mode.y0, mode.y1,
+                                 on=mode_id != self.FULL)
 
         EDTCamera.prepare_camera_for_size(self, mode_id=mode_id)
 
@@ -156,6 +363,7 @@ class CRED1(EDTCamera):
     def send_command(self, cmd: str, base_timeout: float = 100.0) -> str:
         # Just a little bit of parsing to handle the CRED1 format
         # FLI has *decided* to end all their answers with a return prompt "\r\nfli-cli>"
+        self._check_control_allowed()
         logg.debug(f'CRED1 send_command: "{cmd}"')
         res = EDTCamera.send_command(self, cmd, base_timeout=base_timeout)[:-10]
 
@@ -203,38 +411,15 @@ class CRED1(EDTCamera):
 
     def _get_cropping(self) -> Tuple[int, int, int, int]:
         # We mimicked the definition of the cropmodes from the CRED2
-        # BUT the CRED1 is 1-base indexed.... remove 1
+        # BUT the CRED1 is 1-base indexed, with column blocks of 32
+        # The engine handles the conversion.
         logg.debug('_get_cropping @ CRED1')
-        _, xx, yy = self.send_command('cropping raw').split(
-                ':')  # return is "(on|off):x0-x1:y0-y1"
-        # The line below will crash if cropping is set to a single column such that xx, yy = 10, 1-256
-        x0, x1 = [(int(xxx) - 1) for xxx in xx.split('-')]
-        x0 = 32 * x0
-        x1 = 32 * x1 + 31  # column blocks of 32
-        y0, y1 = [int(yyy) - 1 for yyy in yy.split('-')]
-        return x0, x1, y0, y1
-
-    def _set_check_cropping(self, x0: int, x1: int, y0: int,
-                            y1: int) -> Tuple[int, int, int, int]:
-        for _ in range(3):
-            logg.debug('_set_check_cropping attempt @ CRED1')
-            gx0, gx1, gy0, gy1 = self._get_cropping()
-            if gx0 == x0 and gx1 == x1 and gy0 == y0 and gy1 == y1:
-                return x0, x1, y0, y1
-            if gx0 != x0 or gx1 != x1:
-                # BUT the CRED1 is 1-base indexed.... add 1
-                self.send_command('set cropping columns %u-%u' %
-                                  (x0 // 32 + 1, x1 // 32 + 1))
-                # CRED2s are finnicky with cropping, we'll add a wait
-                time.sleep(.5)
-            if gy0 != y0 or gy1 != y1:
-                # BUT the CRED1 is 1-base indexed.... add 1
-                self.send_command('set cropping rows %u-%u' % (y0 + 1, y1 + 1))
-                time.sleep(.5)
-
-        msg = f'Cannot set desired crop {x0}-{x1} {y0}-{y1} after 3 tries'
-        logg.error(msg)
-        raise AssertionError(msg)
+        return self.crop_engine.pixels_from_state(self.crop_engine.readback())
+
+    def _set_check_cropping(self, x0: int, x1: int, y0: int, y1: int,
+                            on: bool = True) -> Tuple[int, int, int, int]:
+        logg.debug('_set_check_cropping @ CRED1')
+        return self.crop_engine.apply(x0, x1, y0, y1, on=on)
 
     def _emergency_abort(self) -> None:
         # Doing this automatically avoids falling in safe mode
@@ -265,9 +450,6 @@ class CRED1(EDTCamera):
 
     def process_camera_status(self, status: str) -> None:
 
-        class InitializationError(Exception):
-            pass
-
         if status == 'operational':
             return
 
@@ -294,41 +476,37 @@ class CRED1(EDTCamera):
             status = self.get_camera_status()
 
         if status == 'isbeingcooled':
-            # Start a temperature capture loop.
-            logg.warning(
-                    'Starting temperature watch loop... Ctrl + C to interrupt and abort.'
-            )
-            try:
-                while status == 'isbeingcooled':
-                    # self.poll... will ask for water temperature AND trigger and emergency shutdown if needed.
-                    # Just calling get_water_temp() is not enough to trigger cooling stop.
-                    self.poll_camera_for_keywords(shm_write=False)
-                    status = self.get_camera_status()
-                    logg.warning(
-                            f'status = {status} - Cryo temp = {self.get_temperature(shm_write=False):.1f} - Water temp = {self.get_water_temperature():.1f}'
-                    )
-
-            except KeyboardInterrupt:
-                logg.error(
-                        'Abort during cooling wait. Camera is still cooling tho!'
-                )
-                self.release()
-
-                raise InitializationError('CRED1 not cold yet.')
+            # Start a background temperature watch - if not already running.
+            # It checks the water temperature and triggers an emergency
+            # shutdown if need be.
+            if self.cooldown is None or self.cooldown.done():
+                logg.warning('Starting temperature watch thread... '
+                             'cam.cooldown.cancel() to abort.')
+                self.cooldown = CooldownMonitor(
+                        self, on_operational=self._start_acquisition
+                        if self._start_pending else None)
+                self.cooldown.future.add_done_callback(self._cooldown_done)
+                self.cooldown.start()
+            return
 
         if status != 'operational':
             logg.critical(f'Camera status "{status}" - fatal.')
             raise InitializationError('Take actions by hand and restart.')
 
-        assert status == 'operational'
-        logg.warning(f'Camera now cold - status: {status}.')
-
     def set_readout_mode(self, mode: str) -> str:
         self.send_command(f'set mode {mode}')
         return self.get_readout_mode()
 
-    def get_readout_mode(self) -> str:
+    def _get_readout_mode_raw(self) -> str:
         res = self.send_command('mode raw')
+        if self.NDR is not None:
+            self._ro_state = (res, self.NDR)
+        return res
+
+    def get_readout_mode(self) -> str:
+        return self._readout_mode_keyword(self._get_readout_mode_raw())
+
+    def _readout_mode_keyword(self, res: str) -> str:
         res = res[:6] + res[
                 11:]  # Removing "reset" after "global", otherwise too long for shm keywords
         self._set_formatted_keyword('DET-SMPL', res)
@@ -341,6 +519,7 @@ class CRED1(EDTCamera):
 
     def get_gain(self) -> int:
         res = int(self.send_command('gain raw'))
+        self._gain = res
         self._set_formatted_keyword('DETGAIN', res)
         logg.info(f'get_gain: {res}')
         return res
@@ -352,42 +531,84 @@ class CRED1(EDTCamera):
         if NDR < 1 or not type(NDR) is int:
             raise AssertionError(f'Illegal NDR value: {NDR}')
 
-        gain_now = self.get_gain(
-        )  # Setting detmode seems to reset the EM gain to 1.
-
-        # Attempt: stabilize by re-setting always readout mode and maxfps
-        clippedNDR = min(3, NDR)
-        currentNDR = min(3, self.get_NDR())
-        readout_modes = {1: ROMODES.single, 2: ROMODES.cds, 3: ROMODES.bursts}
-
-        readout_mode = readout_modes[clippedNDR]
-        curr_readout_mode = readout_modes[currentNDR]
-
-        # DO NOT set the mode, this reverts setting the NDR... or does it ? Getting the mode seems to unlock the weird behavior.
-        self.send_command(f'set nbreadworeset {NDR}')
-
-        if readout_mode != curr_readout_mode:
-            # These two lines to help iron out firmware glitches at mode/ndr changes
-            self.get_readout_mode()
-            self.get_NDR()
-
-            time.sleep(1.)
-            self._kill_taker_no_dependents()
-            self._start_taker_no_dependents(reuse_shm=True)
-
-        time.sleep(1.)
-        self.set_readout_mode(readout_mode)
-
-        # Systematically - because AUTO rescaling of fps occurs when changing NDR...
-        assert self.current_mode.fps is not None  # FIXME we should actually define fps when modesetting - OR use maxfps.
-        self.set_fps(self.current_mode.fps)
-
-        self.set_gain(gain_now)
+        if self._gain is None:
+            self.get_gain()
+        gain_now = self._gain
+        assert gain_now is not None  # mypy happy assert
+
+        cmds = readout_transition(self._ro_state, NDR)
+        logg.info(f'set_NDR: {self._ro_state} -> {NDR}: {cmds}')
+        for cmd in cmds:
+            self.send_command(cmd)
+
+        # Verify - a firmware glitch may swallow either command.
+        target = (ROMODES.for_NDR(NDR), NDR)
+        mode = self._query_readout_state()
+        if self._ro_state != target:
+            logg.warning(f'set_NDR: camera reports {mode}, NDR {self.NDR}'
+                         ' - resending.')
+            resend = readout_transition(None, NDR)
+            for cmd in resend:
+                self.send_command(cmd)
+            cmds += resend
+            mode = self._query_readout_state()
+        self._readout_mode_keyword(mode)
+
+        if self._ro_state != target:
+            state = self._ro_state
+            # Nothing known is to be trusted - a mode change resets the gain.
+            self._ro_state = None
+            self._gain = None
+            msg = f'set_NDR: camera rejected {target}, still in {state}.'
+            logg.error(msg)
+            raise AssertionError(msg)
+
+        if any(cmd.startswith('set mode') for cmd in cmds):
+            # Setting detmode seems to reset the EM gain to 1.
+            if self.get_gain() != gain_now:
+                self.set_gain(gain_now)
+            # The grabber may lose sync across a mode family change.
+            if not self._wait_frames_flowing():
+                logg.warning('set_NDR: no frames after mode change - '
+                             'restarting the taker.')
+                self._kill_taker_no_dependents()
+                self._start_taker_no_dependents(reuse_shm=True)
+
+        if cmds:
+            # AUTO rescaling of fps occurs when changing NDR...
+            assert self.current_mode.fps is not None  # FIXME we should actually define fps when modesetting - OR use maxfps.
+            fps = self.current_mode.fps
+            if abs(self.get_fps() - fps) > 1e-4 * fps:
+                self.set_fps(self.current_mode.fps)
+
+        assert self.NDR is not None  # mypy happy assert
+        return self.NDR
 
-        return self.get_NDR()
+    def _query_readout_state(self) -> str:
+        '''
+            Re-reads NDR and readout mode into self._ro_state.
+            Returns the raw readout mode.
+        '''
+        self._ro_state = None
+        self.get_NDR()
+        return self._get_readout_mode_raw()
+
+    def _wait_frames_flowing(self, timeout: float = 0.3) -> bool:
+        if self.camera_shm is None or not self.is_taker_running():
+            return True  # Nothing to check yet
+
+        cnt0 = self.camera_shm.IMAGE.md.cnt0
+        t_end = time.monotonic() + timeout + 5. / self.get_fps()
+        while time.monotonic() < t_end:
+            time.sleep(0.01)
+            if self.camera_shm.IMAGE.md.cnt0 != cnt0:
+                return True
+        return False
 
     def get_NDR(self) -> int:
         self.NDR = int(self.send_command('nbreadworeset raw'))
+        if self._ro_state is not None:
+            self._ro_state = (self._ro_state[0], self.NDR)
         self._set_formatted_keyword('DET-NSMP', self.NDR)
         self._set_formatted_keyword('DET-SMPL',
                                     ('globalsingle', 'globalcds')[self.NDR > 1])
@@ -8,6 +8,7 @@ import time
 import logging as logg
 
 from camstack.cams.edtcam import EDTCamera
+from camstack.cams.fli_cropping import FLICropEngine
 
 from camstack.core import utilities as util
 
@@ -60,6 +61,8 @@ class CRED2(EDTCamera):
 
     EDTTAKE_UNSIGNED = False
 
+    SERIAL_EMULATOR = 'cred2'
+
     def __init__(self, name: str, stream_name: str, mode_id: int = 0,
                  unit: int = 0, channel: int = 0,
                  taker_cset_prio: util.CsetPrioType = ('system', None),
@@ -70,6 +73,8 @@ class CRED2(EDTCamera):
         basefile = os.environ['HOME'] + '/src/camstack/config/cred2_16bit.cfg'
         self.NDR: Op[int] = None  # Grabbed in prepare_camera_finalize
 
+        self.crop_engine = FLICropEngine(self.send_command)
+
         # Call EDT camera init
         # This should pre-kill dependent sessions
         # But we should be able to "prepare" the camera before actually starting
@@ -99,8 +104,6 @@ class CRED2(EDTCamera):
                                 mode_id: Op[util.ModeIDType] = None) -> None:
         logg.debug('prepare_camera_for_size @ CRED2')
 
-        self.send_command('set cropping on')
-
         if mode_id is None:
             mode_id = self.current_mode_id
 
@@ -181,31 +184,13 @@ class CRED2(EDTCamera):
 
     def _get_cropping(self) -> Tuple[int, int, int, int]:
         logg.debug('_get_cropping @ CRED2')
-        _, xx, yy = self.send_command('cropping raw').split(
-                ':')  # return is "(on|off):x0-x1:y0-y1"
-        x0, x1 = [int(xxx) for xxx in xx.split('-')]
-        y0, y1 = [int(yyy) for yyy in yy.split('-')]
-        return x0, x1, y0, y1
+        return self.crop_engine.pixels_from_state(self.crop_engine.readback())
 
     def _set_check_cropping(self, x0: int, x1: int, y0: int,
                             y1: int) -> Tuple[int, int, int, int]:
-        for _ in range(3):
-            logg.debug('_set_check_cropping attempt @ CRED2')
-            gx0, gx1, gy0, gy1 = self._get_cropping()
-            if gx0 == x0 and gx1 == x1 and gy0 == y0 and gy1 == y1:
-                return x0, x1, y0, y1
-
-            if gx0 != x0 or gx1 != x1:
-                self.send_command('set cropping columns %u-%u' % (x0, x1))
-                # CRED2s are finnicky with cropping, we'll add a wait
-                time.sleep(.2)
-            if gy0 != y0 or gy1 != y1:
-                self.send_command('set cropping rows %u-%u' % (y0, y1))
-                time.sleep(.2)
-
-        msg = f'Cannot set desired crop {x0}-{x1} {y0}-{y1} after 3 tries'
-        logg.error(msg)
-        raise AssertionError(msg)
+        # Cropping is always on, even in FULL.
+        logg.debug('_set_check_cropping @ CRED2')
+        return self.crop_engine.apply(x0, x1, y0, y1, on=True)
 
     def set_synchro(self, synchro: bool) -> bool:
         val = ('off', 'on')[synchro]
@@ -1,10 +1,13 @@
-from typing import Union, Tuple, List, Any, Optional as Op, Dict
+from typing import Union, Tuple, List, Any, Optional as Op, Dict, Iterator
 
 import os
+import contextlib
 import logging as logg
+from concurrent.futures import Future
 
 from camstack.cams.base import BaseCamera
 from camstack.core import utilities as util
+from camstack.core.dcam_mailbox import DCAMMailbox, DCAMCoalescer, CMD_ABORT
 
 from hwmain.dcam import dcamprop
 
@@ -15,6 +18,126 @@ import time
 import threading
 
 
+class DCAMPropCache:
+    '''
+        Cache of the DCAM property values (raw feedback floats).
+
+        STATIC: fixed for a given mode - subarray, readout speed, readout
+            time... Cached on first read. Setting one invalidates everything,
+            since the others may depend on it.
+        SETTABLE: only change when we set them - exposure time, triggers...
+            Cached from the feedback of sets and gets.
+        DYNAMIC: never cached - sensor temperature. Also the default for
+            unclassified properties.
+
+        Everything is invalidated in DCAMCamera.prepare_camera_for_size.
+    '''
+
+    STATIC, SETTABLE, DYNAMIC = 'static', 'settable', 'dynamic'
+
+    INVALID = -8.0085  # Arbitrary MAGIC number for "Invalid property"
+
+    def __init__(self, classification: Dict[int, str]) -> None:
+        self.classification = classification
+
+        self._lock = threading.Lock()
+        self._values: Dict[int, float] = {}
+
+        self.n_hits = 0
+        self.n_misses = 0
+
+    def kind(self, dcam_key: int) -> str:
+        return self.classification.get(dcam_key, self.DYNAMIC)
+
+    def lookup(self, dcam_key: int) -> Op[float]:
+        if self.kind(dcam_key) == self.DYNAMIC:
+            return None
+        with self._lock:
+            val = self._values.get(dcam_key)
+            if val is None:
+                self.n_misses += 1
+            else:
+                self.n_hits += 1
+            return val
+
+    def store(self, dcam_key: int, value: float, is_set: bool) -> None:
+        kind = self.kind(dcam_key)
+        with self._lock:
+            if is_set and kind == self.STATIC:
+                self._values.clear()
+            if kind != self.DYNAMIC and value != self.INVALID:
+                self._values[dcam_key] = value
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+def _dcam_prop_classification() -> Dict[int, str]:
+    EProp = dcamprop.EProp
+    classification = {
+            EProp.SENSORTEMPERATURE: DCAMPropCache.DYNAMIC,
+            EProp.EXPOSURETIME: DCAMPropCache.SETTABLE,
+            EProp.TRIGGERSOURCE: DCAMPropCache.SETTABLE,
+    }
+    for key in (EProp.SUBARRAYHPOS, EProp.SUBARRAYVPOS, EProp.SUBARRAYHSIZE,
+                EProp.SUBARRAYVSIZE, EProp.SUBARRAYMODE, EProp.READOUTSPEED,
+                EProp.TIMING_READOUTTIME, EProp.TRIGGERACTIVE,
+                EProp.TRIGGERPOLARITY, EProp.CONVERSIONFACTOR_COEFF):
+        classification[key] = DCAMPropCache.STATIC
+    # Output triggers 1 to 3, see OrcaQuest.set_output_trigger_options
+    for num in range(3):
+        key_offset = EProp._OUTPUTTRIGGER * num
+        classification[EProp.OUTPUTTRIGGER_KIND +
+                       key_offset] = DCAMPropCache.SETTABLE
+        classification[EProp.OUTPUTTRIGGER_POLARITY +
+                       key_offset] = DCAMPropCache.SETTABLE
+
+    return classification
+
+
+class DCAMBatch:
+    '''
+        Property transaction builder - see DCAMCamera.dcam_batch
+        set and get return futures, resolved when the batch is committed.
+    '''
+
+    def __init__(self, cam: 'DCAMCamera') -> None:
+        self.cam = cam
+        self._values: List[Any] = []
+        self._fits_keys: List[Op[str]] = []
+        self._dcam_keys: List[int] = []
+        self._getonly_flags: List[bool] = []
+        self._futures: List[Future] = []
+
+    def _add(self, value: Any, fits_key: Op[str], dcam_key: int,
+             getonly_flag: bool) -> Future:
+        self._values.append(value)
+        self._fits_keys.append(fits_key)
+        self._dcam_keys.append(dcam_key)
+        self._getonly_flags.append(getonly_flag)
+        self._futures.append(Future())
+        return self._futures[-1]
+
+    def set(self, dcam_key: int, value: Any,
+            fits_key: Op[str] = None) -> Future:
+        return self._add(1.0 * value, fits_key, dcam_key, False)
+
+    def get(self, dcam_key: int, fits_key: Op[str] = None) -> Future:
+        return self._add(0.0, fits_key, dcam_key, True)
+
+    def commit(self) -> List[float]:
+        if not self._futures:
+            return []
+
+        fb_values = self.cam._dcam_prm_transact(self._values, self._fits_keys,
+                                                self._dcam_keys,
+                                                self._getonly_flags)
+        for fut, val in zip(self._futures, fb_values):
+            fut.set_result(val)
+        return fb_values
+
+
 class DCAMCamera(BaseCamera):
 
     INTERACTIVE_SHELL_METHODS = [] + BaseCamera.INTERACTIVE_SHELL_METHODS
@@ -24,6 +147,12 @@ class DCAMCamera(BaseCamera):
     KEYWORDS = {}
     KEYWORDS.update(BaseCamera.KEYWORDS)
 
+    # Property requests from several threads within this window (sec.)
+    # are merged into a single mailbox transaction.
+    DCAM_COALESCE_WINDOW = 0.002
+    # Max wait for the take process to abort in place (sec.)
+    ABORT_TIMEOUT = 0.5
+
     def __init__(
             self,
             name: str,
@@ -39,6 +168,10 @@ class DCAMCamera(BaseCamera):
         self.dcam_number = dcam_number
         self.control_shm: Op[SHM] = None
         self.control_shm_lock = threading.Lock()
+        self.control_mailbox: Op[DCAMMailbox] = None
+        self.control_coalescer = DCAMCoalescer(self._dcam_transact,
+                                               window=self.DCAM_COALESCE_WINDOW)
+        self.prop_cache = DCAMPropCache(_dcam_prop_classification())
 
         super().__init__(
                 name,
@@ -64,6 +197,7 @@ class DCAMCamera(BaseCamera):
         if self.control_shm is None:
             self.control_shm = SHM(self.STREAMNAME + "_params_fb",
                                    np.zeros((1, ), dtype=np.int16))
+            self.control_mailbox = DCAMMailbox(self.control_shm)
 
     def prepare_camera_for_size(
             self,
@@ -75,6 +209,9 @@ class DCAMCamera(BaseCamera):
 
         logg.debug("prepare_camera_for_size @ DCAMCamera")
 
+        # New mode, new static properties.
+        self.prop_cache.invalidate()
+
         super().prepare_camera_for_size(mode_id=None)
 
         x0, x1 = self.current_mode.x0, self.current_mode.x1
@@ -122,7 +259,37 @@ class DCAMCamera(BaseCamera):
         # Find a way to (prepare to) feed to the camera
 
     def abort_exposure(self) -> None:
-        # Basically restart the stack. Hacky way to abort a very long exposure.
+        '''
+            Abort the exposure in progress, and set a 0.1 s exposure time.
+
+            Fast path, if the take process answers the mailbox protocol
+            version 2 (CMD_ABORT, see camstack.core.dcam_mailbox): it stops
+            and restarts the capture in place, no process restart.
+
+            Otherwise - including the current hwacq-dcamtake, which does not
+            implement the mailbox - the take process is killed and restarted
+            with the short exposure time injected: a few seconds, without
+            restarting the dependent processes.
+        '''
+        assert self.control_mailbox
+        if self.control_mailbox.can_abort():
+            exptime_key = f"{dcamprop.EProp.EXPOSURETIME:08x}"
+            request = {exptime_key: 0.1}
+            try:
+                with self.control_shm_lock:
+                    answer = self.control_mailbox.transact(
+                            request, command=CMD_ABORT,
+                            timeout=self.ABORT_TIMEOUT)
+            except TimeoutError:
+                logg.error("abort_exposure: no answer to the abort command - "
+                           "restarting the taker.")
+            else:
+                self.prop_cache.store(dcamprop.EProp.EXPOSURETIME,
+                                      answer[exptime_key], is_set=True)
+                self._set_formatted_keyword("EXPTIME", answer[exptime_key])
+                return
+
+        # Fallback: basically restart the stack. Hacky way to abort a very long exposure.
         # This will kill the fgrab process, and re-init
         # We're reinjecting a short exposure time to reset a potentially very long exposure mode.
 
@@ -137,6 +304,11 @@ class DCAMCamera(BaseCamera):
 
     def _prepare_backend_cmdline(self, reuse_shm: bool = False) -> None:
 
+        # The new process must advertise the mailbox anew - see probe()
+        assert self.control_mailbox
+        with self.control_shm_lock:
+            self.control_mailbox.reset()
+
         # Prepare the cmdline for starting up!
         exec_path = os.environ["SCEXAO_HW"] + "/bin/hwacq-dcamtake"
         self.taker_tmux_command = (f"{exec_path} -s {self.STREAMNAME} "
@@ -152,6 +324,11 @@ class DCAMCamera(BaseCamera):
         self.control_shm.get_data(check=True, checkSemAndFlush=True,
                                   timeout=None)
 
+        # The new process tells whether it answers the mailbox protocol
+        assert self.control_mailbox
+        with self.control_shm_lock:
+            self.control_mailbox.probe()
+
     def _dcam_prm_setvalue(self, value: Any, fits_key: Op[str],
                            dcam_key: int) -> float:
         return self._dcam_prm_setmultivalue([value], [fits_key], [dcam_key])[0]
@@ -177,46 +354,78 @@ class DCAMCamera(BaseCamera):
             fits_keys: List[Op[str]],
             dcam_keys: List[int],
             getonly_flag: bool,
+    ) -> List[float]:
+        return self._dcam_prm_transact(values, fits_keys, dcam_keys,
+                                       [getonly_flag] * len(values))
+
+    @contextlib.contextmanager
+    def dcam_batch(self) -> Iterator[DCAMBatch]:
+        '''
+            Group property sets and gets into a single exchange:
+
+                with cam.dcam_batch() as b:
+                    tint = b.get(dcamprop.EProp.EXPOSURETIME, 'EXPTIME')
+                    b.set(dcamprop.EProp.TRIGGERSOURCE, 1.0)
+                print(tint.result())
+
+            Nothing is sent if the block raises.
+        '''
+        batch = DCAMBatch(self)
+        yield batch
+        batch.commit()
+
+    def _dcam_transact(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        assert self.control_mailbox
+        with self.control_shm_lock:
+            return self.control_mailbox.transact(request)
+
+    def _dcam_prm_transact(
+            self,
+            values: List[Any],
+            fits_keys: List[Op[str]],
+            dcam_keys: List[int],
+            getonly_flags: List[bool],
     ) -> List[float]:
         """
             Setter - implements a quick feedback between this code and dcamusbtake
 
-            The C code overwrites the values of keywords
-            before posting the data anew.
-            To avoid a race, we need to wait twice for a full loop
+            The exchange goes through the sequence-numbered mailbox
+            (see camstack.core.dcam_mailbox), or the legacy 3-loop
+            wait if the take process does not support it.
+            Requests from concurrent threads are coalesced.
+            Gets are served from self.prop_cache when possible.
 
             To perform set-gets and just gets with the same procedure... we leverage the hexmasks
             All parameters (see Eprop in dcamprop.py) are 32 bit starting with 0x0
-            We set the first bit to 1 if it's a set.
+            We set the first bit to 1 if it's a get.
         """
 
         logg.debug(
-                f"DCAMCamera _dcam_prm_setgetmultivalue [getonly: {getonly_flag}]: {list(zip(fits_keys, values))}"
+                f"DCAMCamera _dcam_prm_transact [getonly: {getonly_flags}]: {list(zip(fits_keys, values))}"
         )
-        assert self.control_shm
 
-        n_keywords = len(values)
-
-        if getonly_flag:
-            dcam_string_keys = [
-                    f"{dcam_key | 0x80000000:08x}" for dcam_key in dcam_keys
-            ]
-        else:
-            dcam_string_keys = [f"{dcam_key:08x}" for dcam_key in dcam_keys]
-
-        with self.control_shm_lock:
-            self.control_shm.reset_keywords({
-                    dk: v
-                    for dk, v in zip(dcam_string_keys, values)
-            })
-            self.control_shm.set_data(self.control_shm.get_data() * 0 +
-                                      n_keywords)  # Toggle grabber process
-            self.control_shm.multi_recv_data(3, True)  # Ensure re-sync
-
-            fb_values: List[float] = [
-                    self.control_shm.get_keywords()[dk]
-                    for dk in dcam_string_keys
-            ]  # Get back the cam value
+        dcam_string_keys = [
+                f"{dcam_key | 0x80000000:08x}" if getonly else f"{dcam_key:08x}"
+                for dcam_key, getonly in zip(dcam_keys, getonly_flags)
+        ]
+
+        fb_values: List[Any] = [None] * len(values)
+        to_send: List[int] = []
+        for idx, (dcamk, getonly) in enumerate(zip(dcam_keys, getonly_flags)):
+            cached = self.prop_cache.lookup(dcamk) if getonly else None
+            if cached is None:
+                to_send.append(idx)
+            else:
+                fb_values[idx] = cached
+
+        if to_send:
+            answers = self.control_coalescer.submit([
+                    (dcam_string_keys[idx], values[idx]) for idx in to_send
+            ])  # Get back the cam value
+            for idx, val in zip(to_send, answers):
+                fb_values[idx] = val
+                self.prop_cache.store(dcam_keys[idx], val,
+                                      is_set=not getonly_flags[idx])
 
         for idx, (fk, dcamk) in enumerate(zip(fits_keys, dcam_keys)):
             if fk is not None:
@@ -226,9 +435,7 @@ class DCAMCamera(BaseCamera):
             if dcamk in dcamprop.PROP_ENUM_MAP and fb_values[idx]:
                 # Response type of requested prop is described by a proper enumeration.
                 # Instantiate the Enum class for the return value.
-                if fb_values[idx] != -8.0085:
-                    # Arbitrary MAGIC number
-                    # encodes a "Invalid property"
+                if fb_values[idx] != DCAMPropCache.INVALID:
                     fb_values[idx] = dcamprop.PROP_ENUM_MAP[dcamk](
                             fb_values[idx])
 
@@ -296,7 +503,13 @@ class OrcaQuest(DCAMCamera):
         self._dcam_prm_getvalue("GAIN", dcamprop.EProp.CONVERSIONFACTOR_COEFF)
 
     def poll_camera_for_keywords(self) -> None:
-        self.get_temperature()
+        # One exchange for the temperature, tint and fps
+        with self.dcam_batch() as b:
+            b.get(dcamprop.EProp.SENSORTEMPERATURE, "DET-TMP")
+            exp_time = b.get(dcamprop.EProp.EXPOSURETIME, "EXPTIME")
+            read_time = b.get(dcamprop.EProp.TIMING_READOUTTIME)
+        self._set_formatted_keyword(
+                "FRATE", 1 / max(exp_time.result(), read_time.result()))
 
     def get_temperature(self) -> float:
         # Let's try and play: it's readonly
@@ -3,9 +3,12 @@ from typing import Union, Tuple, List, Any, TYPE_CHECKING, Optional as Op
 import os
 import subprocess
 import time
+import threading
 import logging as logg
 
 from camstack.cams.base import BaseCamera
+from camstack.cams import simulatedcam
+from camstack.core import serial_replay, serial_emulators
 from hwmain.edt.edtinterface import EdtInterfaceSerial
 
 from camstack.core.utilities import (ModeIDorHWType, CsetPrioType,
@@ -27,6 +30,9 @@ class EDTCamera(BaseCamera):
     EDTTAKE_UNSIGNED = True
     EDTTAKE_EMBEDMICROSECOND = False  # We want this for CRED1 / 2 but not elsewhere
 
+    # Key into camstack.core.serial_emulators.EMULATORS, for hardware-free runs
+    SERIAL_EMULATOR: Op[str] = None
+
     def __init__(self, name: str, stream_name: str,
                  mode_id_or_hw: ModeIDorHWType, pdv_unit: int, pdv_channel: int,
                  pdv_basefile: str, no_start: bool = False,
@@ -41,6 +47,13 @@ class EDTCamera(BaseCamera):
 
         # See self.init_framegrab_backend
         self.edt_iface: Op[EdtInterfaceSerial] = None
+        # Hardware-free operation (serial replay or emulation),
+        # see camstack.core.serial_replay and camstack.core.serial_emulators
+        # Then the taker is a simcam_framegen instead of an edttake
+        self.edt_offline: bool = False
+        # One command / reply exchange at a time on the serial, whatever the
+        # thread (cam_main, Pyro, background monitors).
+        self._serial_lock = threading.Lock()
 
         BaseCamera.__init__(self, name, stream_name, mode_id_or_hw,
                             no_start=no_start, taker_cset_prio=taker_cset_prio,
@@ -55,6 +68,26 @@ class EDTCamera(BaseCamera):
 
         self.width_fg = self.width * (1, 2)[self.EDTTAKE_CAST]
 
+        if isinstance(self.edt_iface, serial_replay.RecordingSerial):
+            self.edt_iface.close()
+
+        if self.edt_offline:
+            # Keep the stand-in serial (and its state) across mode changes.
+            return
+
+        offline_iface = serial_emulators.emulator_from_env(
+                self.NAME, self.SERIAL_EMULATOR)
+        if offline_iface is not None:
+            offline_iface.fps_callback = self._offline_set_frame_period
+        else:
+            offline_iface = serial_replay.offline_serial_from_env(self.NAME)
+
+        if offline_iface is not None:
+            # No framegrabber to configure.
+            self.edt_offline = True
+            self.edt_iface = offline_iface
+            return
+
         # Prepare a cfg file like the base one + width and height amended
 
         tmp_config = '/tmp/' + os.environ['USER'] + '_' + self.NAME + '.cfg'
@@ -89,10 +122,15 @@ class EDTCamera(BaseCamera):
 
         # Open a serial handle
         # It's possible initcam messed with it so we reopen it
-        self.edt_iface = EdtInterfaceSerial(self.pdv_unit, self.pdv_channel)
+        self.edt_iface = serial_replay.wrap_recording_from_env(
+                self.NAME, EdtInterfaceSerial(self.pdv_unit, self.pdv_channel))
 
     def _prepare_backend_cmdline(self, reuse_shm: bool = False) -> None:
 
+        if self.edt_offline:
+            self._prepare_offline_cmdline(reuse_shm=reuse_shm)
+            return
+
         # Prepare the cmdline for starting up!
         exec_path = os.environ['SCEXAO_HW'] + '/bin/hwacq-edttake'
         self.taker_tmux_command = f'{exec_path} -s {self.STREAMNAME} -u {self.pdv_unit} -c {self.pdv_channel} -l 0 -N 4'
@@ -105,6 +143,22 @@ class EDTCamera(BaseCamera):
         if reuse_shm:
             self.taker_tmux_command += ' -R'  # Do not overwrite the SHM.
 
+    def _prepare_offline_cmdline(self, reuse_shm: bool = False) -> None:
+        # No EDT: a simulated framegen stands in for edttake
+        # Same output size as edttake (after -8 casting, for the OCAM)
+        exec_path = simulatedcam.CAMSTACK_HOME + '/src/simcam_framegen'
+        self.taker_tmux_command = (f'{exec_path} {self.STREAMNAME} '
+                                   f'{self.height} {self.width} -t u16')
+        self.taker_tmux_command += self._ring_cmdline_option()
+        if reuse_shm:
+            self.taker_tmux_command += ' -R'  # Do not overwrite the SHM.
+
+    def _offline_set_frame_period(self, fps: float) -> None:
+        # Pace the simcam_framegen on the fps of the emulated camera
+        camera_shm = getattr(self, 'camera_shm', None)
+        if camera_shm is not None and fps > 0.:
+            camera_shm.update_keyword('_ETIMEUS', max(1, int(1e6 / fps)))
+
     def _ensure_backend_restarted(self) -> None:
         # Plenty simple enough for EDT, never failed me
         time.sleep(1.0)
@@ -118,7 +172,8 @@ class EDTCamera(BaseCamera):
 
         logg.debug(f'EDTCamera: send_command: "{cmd}"')
 
-        return self.edt_iface.send_command(cmd, base_timeout=base_timeout)
+        with self._serial_lock:
+            return self.edt_iface.send_command(cmd, base_timeout=base_timeout)
 
     def raw(self, cmd: str) -> str:
         '''
@@ -0,0 +1,118 @@
+'''
+    Cropping engine for the First Light Imaging cameras (CRED1, CRED2)
+
+    Computes the target cropping registers from the pixel window,
+    sends only the commands that differ from the readback, and polls
+    the readback at short intervals until it matches (or times out).
+'''
+from typing import Callable, Optional as Op, Tuple
+
+import time
+import logging as logg
+
+RegType = Tuple[int, int]
+
+
+class FLICropState:
+
+    def __init__(self, on: bool, cols: RegType, rows: RegType) -> None:
+        self.on = on
+        self.cols = cols  # In register units (column blocks for the CRED1)
+        self.rows = rows
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, FLICropState):
+            return NotImplemented
+        return (self.on == other.on and self.cols == other.cols and
+                self.rows == other.rows)
+
+    def __str__(self) -> str:
+        return (f'{("off", "on")[self.on]}:{self.cols[0]}-{self.cols[1]}:'
+                f'{self.rows[0]}-{self.rows[1]}')
+
+
+class FLICropEngine:
+    '''
+        col_block: column quantization of the camera (32 for the CRED1)
+        index_base: 1 if the camera counts blocks and rows from 1 (CRED1)
+    '''
+
+    def __init__(self, send_command: Callable[[str], str], col_block: int = 1,
+                 index_base: int = 0, poll_interval: float = 0.02,
+                 timeout: float = 2.0) -> None:
+
+        self.send_command = send_command
+        self.col_block = col_block
+        self.index_base = index_base
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+
+    def target_state(self, x0: int, x1: int, y0: int, y1: int,
+                     on: bool = True) -> FLICropState:
+        b = self.col_block
+        if x0 % b != 0 or (x1 + 1) % b != 0:
+            msg = (f'Cropping columns {x0}-{x1} not aligned '
+                   f'on {b}-column blocks')
+            logg.error(msg)
+            raise AssertionError(msg)
+
+        ib = self.index_base
+        return FLICropState(on, (x0 // b + ib, x1 // b + ib),
+                            (y0 + ib, y1 + ib))
+
+    def pixels_from_state(self,
+                          state: FLICropState) -> Tuple[int, int, int, int]:
+        b, ib = self.col_block, self.index_base
+        return ((state.cols[0] - ib) * b, (state.cols[1] - ib) * b + b - 1,
+                state.rows[0] - ib, state.rows[1] - ib)
+
+    def readback(self) -> FLICropState:
+        # return is "(on|off):x0-x1:y0-y1" - or "x0" for a single column.
+        onoff, xx, yy = self.send_command('cropping raw').split(':')
+
+        def parse_range(rr: str) -> RegType:
+            vals = [int(v) for v in rr.split('-')]
+            return vals[0], vals[-1]
+
+        return FLICropState(onoff.strip() == 'on', parse_range(xx),
+                            parse_range(yy))
+
+    def _send_diff(self, target: FLICropState, current: FLICropState) -> None:
+        if current.on != target.on:
+            self.send_command(f'set cropping {("off", "on")[target.on]}')
+        if current.cols != target.cols:
+            self.send_command('set cropping columns %u-%u' % target.cols)
+        if current.rows != target.rows:
+            self.send_command('set cropping rows %u-%u' % target.rows)
+
+    def apply(self, x0: int, x1: int, y0: int, y1: int,
+              on: Op[bool] = True) -> Tuple[int, int, int, int]:
+        '''
+            on: None to leave the on/off state as is.
+            Returns the pixel window read back from the camera.
+        '''
+        current = self.readback()
+        target = self.target_state(x0, x1, y0, y1,
+                                   current.on if on is None else on)
+
+        # Two rounds: a re-send, in case the first was swallowed.
+        for _ in range(2):
+            if current == target:
+                return self.pixels_from_state(current)
+
+            logg.debug(f'FLICropEngine: {current} -> {target}')
+            self._send_diff(target, current)
+
+            t_end = time.monotonic() + self.timeout
+            while True:
+                current = self.readback()
+                if current == target or time.monotonic() > t_end:
+                    break
+                time.sleep(self.poll_interval)
+
+        if current == target:
+            return self.pixels_from_state(current)
+
+        msg = f'Cannot set desired crop {target} - camera reports {current}'
+        logg.error(msg)
+        raise AssertionError(msg)
@@ -78,6 +78,10 @@ class FlyCaptureUSBCamera(BaseCamera):
     KEYWORDS = {}
     KEYWORDS.update(BaseCamera.KEYWORDS)
 
+    # Embedded frame counter and timestamp, for the loss accounting and
+    # timing of the taker - at the price of the first 8 bytes of every image.
+    EMBEDDED_INFO = False
+
     MAX_GAIN = 0.
 
     def __init__(self, name: str, stream_name: str, mode_id: Union[CameraMode,
@@ -221,6 +225,9 @@ class FlyCaptureUSBCamera(BaseCamera):
         exec_path = os.environ['HOME'] + '/src/camstack/src/flycapture_usbtake'
         self.taker_tmux_command = (f'{exec_path} -s {self.STREAMNAME} '
                                    f'-u {self.fly_number} -l 0')
+        self.taker_tmux_command += self._ring_cmdline_option()
+        if self.EMBEDDED_INFO:
+            self.taker_tmux_command += ' -E'  # Zeroes 8 bytes of the image.
         if reuse_shm:
             self.taker_tmux_command += ' -R'  # Do not overwrite the SHM.
 
@@ -64,6 +64,8 @@ class NUVU(EDTCamera):
     EDTTAKE_UNSIGNED = True
     EDTTAKE_EMBEDMICROSECOND = False
 
+    SERIAL_EMULATOR = 'nuvu'
+
     class _ShutterExternal(Enum):
         NO = 0
         YES = 1
@@ -41,6 +41,8 @@ class OCAM2K(EDTCamera):
     EDTTAKE_CAST = True
     EDTTAKE_UNSIGNED = True
 
+    SERIAL_EMULATOR = 'ocam2k'
+
     REDIS_PUSH_ENABLED = True
     REDIS_PREFIX = 'x_P'
 
@@ -11,6 +11,7 @@ from numpy.typing import DTypeLike
 from camstack.cams.base import BaseCamera
 
 from camstack.core import utilities as util
+from camstack.core.scene_sim import parse_scene_mode
 
 CAMSTACK_HOME = os.environ['HOME'] + '/src/camstack'
 
@@ -43,7 +44,7 @@ class SimulatedCam(BaseCamera):
     def __init__(self, name: str, stream_name: str,
                  mode_id: util.ModeIDorHWType,
                  data_type: Union[str, DTypeLike] = np.uint16,
-                 no_start: bool = False,
+                 scene: str = 'sine', no_start: bool = False,
                  taker_cset_prio: util.CsetPrioType = ('system', None),
                  dependent_processes: List[util.DependentProcess] = []) -> None:
 
@@ -54,6 +55,12 @@ class SimulatedCam(BaseCamera):
             self.dtype_string = INV_NPTYPE_LOOKUP[data_type]
             self.dtype_np = data_type
 
+        # 'sine', or a camstack.core.scene_sim mode: 'psf', 'ndr<N>', 'ocam'
+        # Frame rate: the real camera rate, with set_fps.
+        if scene != 'sine':
+            parse_scene_mode(scene)  # Raises ValueError if unknown
+        self.scene = scene
+
         BaseCamera.__init__(self, name, stream_name, mode_id, no_start=no_start,
                             taker_cset_prio=taker_cset_prio,
                             dependent_processes=dependent_processes)
@@ -71,6 +78,9 @@ class SimulatedCam(BaseCamera):
         w = self.current_mode.y1 - self.current_mode.y0 + 1
         h = self.current_mode.x1 - self.current_mode.x0 + 1
         self.taker_tmux_command = f'{exec_path} {self.STREAMNAME} {w} {h} -t {self.dtype_string}'
+        self.taker_tmux_command += self._ring_cmdline_option()
+        if self.scene != 'sine':
+            self.taker_tmux_command += f' -S {self.scene}'
 
         if reuse_shm:
             self.taker_tmux_command += ' -R'  # Do not overwrite the SHM.
@@ -132,6 +132,7 @@ class SpinnakerUSBCamera(BaseCamera):
         exec_path = os.environ['HOME'] + '/src/camstack/src/spinnaker_usbtake'
         self.taker_tmux_command = (f'{exec_path} -s {self.STREAMNAME} '
                                    f'-u {self.spinn_number} -l 0')
+        self.taker_tmux_command += self._ring_cmdline_option()
         if reuse_shm:
             self.taker_tmux_command += ' -R'  # Do not overwrite the SHM.
 
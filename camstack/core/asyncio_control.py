@@ -0,0 +1,142 @@
+'''
+    asyncio facade over the (blocking) camera control methods
+
+    All camera control calls (set_fps, get_temperature, set_camera_mode...)
+    are synchronous: they hold the caller for the whole serial round trip or
+    SHM mailbox exchange. AsyncCamera runs them on the control executor of
+    the camera - a single worker thread per camera, so that commands to a
+    given camera are still serialized, but commands to different cameras
+    overlap.
+
+    Usage, from an orchestration script:
+
+        from camstack.core.asyncio_control import AsyncCamera, fan_out
+
+        pa, ap, ki = AsyncCamera(palila), AsyncCamera(apapane), AsyncCamera(kiwikiu)
+        await asyncio.gather(pa.set_fps(1000.), ap.set_fps(1000.), ki.set_fps(1000.))
+        # or
+        await fan_out([pa, ap, ki], 'set_fps', 1000.)
+
+    Works on local camera objects as well as on Pyro proxies. A Pyro proxy
+    is bound to a single thread: AsyncCamera gives its worker its own copy
+    of the proxy and leaves the caller's alone. Its worker thread is stopped
+    by close(), or by using the AsyncCamera as a context manager.
+'''
+from __future__ import annotations
+
+from typing import Any, Callable, Coroutine, List, Optional as Op
+
+import copy
+import asyncio
+import functools
+import logging as logg
+from concurrent.futures import ThreadPoolExecutor
+
+
+def make_control_executor(name: str,
+                          proxy: Op[Any] = None) -> ThreadPoolExecutor:
+    '''
+        Single-worker executor - one per camera.
+
+        If proxy is a Pyro proxy, the worker thread claims ownership of it
+        upon starting, since Pyro proxies are bound to a single thread: it
+        must not be used by any other thread afterwards.
+    '''
+    initializer: Op[Callable[[], None]] = None
+    if proxy is not None and hasattr(proxy, '_pyroClaimOwnership'):
+        initializer = proxy._pyroClaimOwnership
+
+    return ThreadPoolExecutor(max_workers=1, thread_name_prefix=f'{name}_ctrl',
+                              initializer=initializer)
+
+
+class AsyncCamera:
+    '''
+        Wraps a camera object (BaseCamera subclass or Pyro proxy thereof)
+        Every method becomes a coroutine function.
+    '''
+
+    def __init__(self, camera: Any,
+                 executor: Op[ThreadPoolExecutor] = None) -> None:
+
+        self._spec = camera  # The caller's object - introspection only
+        self._camera = camera  # The object the worker calls
+        self._owns_executor = False
+
+        if executor is None:
+            if hasattr(type(camera), 'get_control_executor'):
+                # Local camera object: share the camera's own executor
+                executor = camera.get_control_executor()
+            else:
+                # Pyro proxy or foreign object: own executor.
+                if hasattr(camera, '_pyroClaimOwnership'):
+                    # Same URI, new connection - for the worker only.
+                    self._camera = copy.copy(camera)
+                executor = make_control_executor(str(id(camera)), self._camera)
+                self._owns_executor = True
+        self._executor = executor
+
+    @property
+    def camera(self) -> Any:
+        return self._spec
+
+    def close(self) -> None:
+        '''
+            Stops the worker thread, if it is our own.
+        '''
+        if self._owns_executor:
+            self._executor.shutdown(wait=True)
+            self._owns_executor = False
+
+    def __enter__(self) -> AsyncCamera:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    async def call(self, method_name: str, *args, **kwargs) -> Any:
+        loop = asyncio.get_running_loop()
+        method = getattr(self._camera, method_name)
+        logg.debug(f'AsyncCamera call: {method_name} {args} {kwargs}')
+        return await loop.run_in_executor(
+                self._executor, functools.partial(method, *args, **kwargs))
+
+    def __getattr__(self, name: str) -> Callable[..., Coroutine[Any, Any, Any]]:
+        # Only called for attributes not found on AsyncCamera itself.
+        if name.startswith('__'):
+            raise AttributeError(name)
+
+        if not callable(getattr(self._spec, name)):
+            raise AttributeError(f'AsyncCamera: {name} is not a method '
+                                 f'(use .camera.{name})')
+
+        return functools.partial(self.call, name)
+
+
+async def fan_out(cameras: List[AsyncCamera], method_name: str, *args,
+                  **kwargs) -> List[Any]:
+    '''
+        Call the same method with the same arguments on several cameras
+        concurrently, and await all of them.
+        Exceptions are returned in place of the result, not raised.
+    '''
+    calls = [cam.call(method_name, *args, **kwargs) for cam in cameras]
+    return await asyncio.gather(*calls, return_exceptions=True)
+
+
+def run_on_all(cameras: List[Any], method_name: str, *args,
+               **kwargs) -> List[Any]:
+    '''
+        Blocking shorthand for fan_out, for use at an interactive prompt
+        (not from within a running event loop).
+    '''
+    async_cams = [
+            cam if isinstance(cam, AsyncCamera) else AsyncCamera(cam)
+            for cam in cameras
+    ]
+    try:
+        return asyncio.run(fan_out(async_cams, method_name, *args, **kwargs))
+    finally:
+        for cam, async_cam in zip(cameras, async_cams):
+            if async_cam is not cam:  # Ours to close
+                async_cam.close()
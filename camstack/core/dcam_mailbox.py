@@ -0,0 +1,314 @@
+'''
+    Sequence-numbered request / response mailbox over the DCAM parameter
+    feedback SHM (<stream>_params_fb)
+
+    The legacy exchange rewrites the keywords, toggles the data, then waits
+    for 3 full frame loops of the take process before reading the feedback.
+    At long exposure times, that's seconds for a simple get_temperature.
+
+    Protocol (version 1) - the take process answers between frames:
+
+    Request (this side, under the camera control lock):
+        - rewrite all keywords: the property keywords (hex strings, see
+          DCAMCamera._dcam_prm_setgetmultivalue), plus
+            _MBXREQ = request sequence number (1, 2, ... wraps at 2**31 - 1)
+            _MBXACK = last acknowledged sequence number, unchanged
+        - set the data to the number of property keywords (posts the
+          semaphores, as in the legacy protocol).
+
+    Response (take process, polled between two frames - not after them):
+        - if _MBXREQ != _MBXACK: process the property keywords, write back
+          the values and _MBXVER = its protocol version, then
+          _MBXACK = _MBXREQ, then post the semaphores.
+        - upon startup, publish _MBXVER so that we know it talks version 1.
+
+    _MBXVER is only ever written by the take process. It is a hint, not a
+    proof: it survives in the keywords of the SHM across a restart of the
+    take process, so it is cleared before any restart (see reset), and
+    probe confirms it with an empty request. The version is the one in the
+    answer to that request.
+
+    Version 2 adds commands: _MBXCMD in the request (0 / absent: none).
+        - CMD_ABORT (1): stop the capture (dcamcap_stop - aborts the exposure
+          in progress), apply the property keywords, restart the capture
+          (dcamcap_start), then answer. The take process must poll the
+          mailbox while waiting for a frame, not only between frames, for
+          this to be useful during long exposures.
+
+    This side waits on its semaphore of the SHM with a short timeout, and
+    checks _MBXACK after every wake-up or timeout - which makes it immune to
+    its own post and to a post lost to a flush. Latency is bounded by the
+    take process loop, not by the frame period.
+
+    A take process that does not publish _MBXVER, or does not answer the
+    probe, gets the legacy exchange.
+
+    DCAMCoalescer merges concurrent requests into single transactions.
+'''
+from typing import Any, Callable, Dict, List, Optional as Op, Tuple
+
+import time
+import threading
+import logging as logg
+from concurrent.futures import Future
+
+from pyMilk.interfacing.shm import SHM
+
+PROTOCOL_VERSION = 2
+
+KW_VERSION = '_MBXVER'
+KW_REQ = '_MBXREQ'
+KW_ACK = '_MBXACK'
+KW_CMD = '_MBXCMD'
+
+CMD_NONE = 0
+CMD_ABORT = 1  # Since version 2
+
+SEQ_WRAP = 0x7fffffff
+
+_PendingType = Tuple[str, Any, Future]  # hex key, value, future of the answer
+
+
+class DCAMMailbox:
+    '''
+        Not thread safe - calls must be serialized by the caller
+        (DCAMCamera.control_shm_lock).
+    '''
+
+    def __init__(self, control_shm: SHM, timeout: float = 10.0,
+                 poll_interval: float = 0.05) -> None:
+
+        self.control_shm = control_shm
+        self.timeout = timeout
+        self.poll_interval = poll_interval
+
+        self.version = 0  # Of the take process, see probe()
+        self.supported = False
+        self.seq = 0
+
+        self.n_transactions = 0
+        self.last_latency = float('nan')
+
+    def reset(self) -> None:
+        '''
+            To be called before the take process is (re)started, so that a
+            stale _MBXVER of the previous process is not taken for support.
+            The other keywords are kept: they are the startup parameters.
+        '''
+        self.version = 0
+        self.supported = False
+
+        kws = self.control_shm.get_keywords()
+        if KW_VERSION in kws:
+            del kws[KW_VERSION]
+            self.control_shm.reset_keywords(kws)
+
+    def probe(self) -> bool:
+        '''
+            To be called once the take process is (re)started.
+            If it advertises the mailbox, confirm with an empty request.
+        '''
+        self.version = 0
+        self.supported = False
+
+        kws = self.control_shm.get_keywords()
+        if int(kws.get(KW_VERSION, 0)) >= 1:
+            self.seq = int(kws.get(KW_ACK, 0))
+            try:
+                answer = self._transact_seq({}, CMD_NONE, self.timeout)
+            except TimeoutError:
+                logg.warning('DCAMMailbox: _MBXVER published but no answer '
+                             'to the probe - legacy exchange.')
+            else:
+                self.version = int(answer.get(KW_VERSION, 0))
+                self.supported = self.version >= 1
+
+        logg.info(f'DCAMMailbox: mailbox protocol version: {self.version}')
+        return self.supported
+
+    def can_abort(self) -> bool:
+        '''
+            From the version the take process answered with - never from
+            the keywords alone, see probe.
+        '''
+        return self.supported and self.version >= 2
+
+    def transact(self, request: Dict[str, Any], command: int = CMD_NONE,
+                 timeout: Op[float] = None) -> Dict[str, Any]:
+        '''
+            Post the request keywords, return all the keywords once the
+            take process has answered.
+            command requires the mailbox protocol (see can_abort).
+        '''
+        if command == CMD_ABORT and not self.can_abort():
+            raise AssertionError(f'DCAMMailbox: command {command} '
+                                 'unsupported by the take process.')
+
+        t_start = time.monotonic()
+        if self.supported:
+            answer = self._transact_seq(
+                    request, command,
+                    self.timeout if timeout is None else timeout)
+            # Answered by the take process, which echoes its version
+            self.version = int(answer.get(KW_VERSION, self.version))
+        elif command != CMD_NONE:
+            raise AssertionError(f'DCAMMailbox: command {command} '
+                                 'unsupported by the take process.')
+        else:
+            answer = self._transact_legacy(request)
+
+        self.n_transactions += 1
+        self.last_latency = time.monotonic() - t_start
+        logg.debug(f'DCAMMailbox: transaction {self.seq} in '
+                   f'{self.last_latency * 1e3:.1f} ms')
+        return answer
+
+    def _post(self, keywords: Dict[str, Any], n_request: int) -> None:
+        self.control_shm.reset_keywords(keywords)
+        self.control_shm.set_data(self.control_shm.get_data() * 0 +
+                                  n_request)  # Toggle grabber process
+
+    def _transact_seq(self, request: Dict[str, Any], command: int,
+                      timeout: float) -> Dict[str, Any]:
+        prev_seq = self.seq
+        self.seq = self.seq % SEQ_WRAP + 1
+
+        keywords = dict(request)
+        keywords[KW_REQ] = self.seq
+        keywords[KW_ACK] = prev_seq
+        if command != CMD_NONE:
+            keywords[KW_CMD] = command
+        self._post(keywords, len(request))
+
+        t_end = time.monotonic() + timeout
+        while True:
+            try:
+                self.control_shm.get_data(check=True, checkSemAndFlush=False,
+                                          timeout=self.poll_interval)
+            except TimeoutError:
+                pass
+
+            answer = self.control_shm.get_keywords()
+            if int(answer.get(KW_ACK, -1)) == self.seq:
+                return answer
+
+            if time.monotonic() > t_end:
+                msg = f'DCAMMailbox: no answer to request {self.seq}'
+                logg.error(msg)
+                raise TimeoutError(msg)
+
+    def _transact_legacy(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        # The C code overwrites the values of keywords
+        # before posting the data anew.
+        # To avoid a race, we need to wait twice for a full loop
+        self._post(request, len(request))
+        self.control_shm.multi_recv_data(3, True)  # Ensure re-sync
+
+        return self.control_shm.get_keywords()
+
+
+class DCAMCoalescer:
+    '''
+        Merges property requests from several threads into single mailbox
+        transactions.
+
+        Requests are (hex key, value) pairs as in the mailbox keywords.
+        The first caller becomes the leader: it waits for a short window,
+        then serves everything pending in as few transactions as possible -
+        including what piles up while a transaction is in flight.
+        Two requests on the same property go in the same transaction only
+        if both are gets; otherwise, order is kept across transactions.
+        If the leader dies (even on KeyboardInterrupt), everything pending
+        fails with its exception - so waiters have no timeout of their own:
+        a request that timed out here could still reach the camera later.
+    '''
+
+    GET_FLAG = 0x80000000
+
+    def __init__(self, transact: Callable[[Dict[str, Any]], Dict[str, Any]],
+                 window: float = 0.002) -> None:
+
+        self.transact = transact
+        self.window = window
+
+        self._lock = threading.Lock()
+        self._pending: List[_PendingType] = []
+        self._leader_active = False
+
+        self.n_requests = 0
+        self.n_transactions = 0
+
+    def submit(self, requests: List[Tuple[str, Any]]) -> List[Any]:
+        futures: List[Future] = [Future() for _ in requests]
+
+        with self._lock:
+            self._pending += [(key, val, fut)
+                              for (key, val), fut in zip(requests, futures)]
+            self.n_requests += len(requests)
+            lead = not self._leader_active
+            self._leader_active = True
+
+        if lead:
+            self._lead()
+
+        return [fut.result() for fut in futures]
+
+    def _lead(self) -> None:
+        try:
+            if self.window > 0.:
+                time.sleep(self.window)
+
+            while True:
+                with self._lock:
+                    batch, self._pending = self._cut(self._pending)
+                    if not batch:
+                        self._leader_active = False
+                        return
+                self._run(batch)
+        except BaseException as exc:
+            # Nobody else would serve them.
+            with self._lock:
+                pending, self._pending = self._pending, []
+                self._leader_active = False
+            self._fail(pending, exc)
+            raise
+
+    @staticmethod
+    def _fail(batch: List[_PendingType], exc: BaseException) -> None:
+        for _, _, fut in batch:
+            if not fut.done():
+                fut.set_exception(exc)
+
+    def _cut(
+            self, pending: List[_PendingType]
+    ) -> Tuple[List[_PendingType], List[_PendingType]]:
+        # prop -> whether it's set in this batch
+        props: Dict[int, bool] = {}
+        for idx, (key, _, _) in enumerate(pending):
+            hexkey = int(key, 16)
+            prop = hexkey & ~self.GET_FLAG
+            is_set = not hexkey & self.GET_FLAG
+            if prop in props and (props[prop] or is_set):
+                return pending[:idx], pending[idx:]
+            props[prop] = props.get(prop, False) or is_set
+
+        return pending, []
+
+    def _run(self, batch: List[_PendingType]) -> None:
+        request = {key: val for key, val, _ in batch}
+        try:
+            answer = self.transact(request)
+        except Exception as exc:
+            self._fail(batch, exc)
+            return
+        except BaseException as exc:
+            self._fail(batch, exc)
+            raise
+
+        self.n_transactions += 1
+        for key, _, fut in batch:
+            if key in answer:
+                fut.set_result(answer[key])
+            else:
+                fut.set_exception(
+                        KeyError(f'DCAMCoalescer: no answer for {key}'))
@@ -0,0 +1,72 @@
+'''
+    Low-jitter frame pacing on absolute deadlines
+
+    Deadlines are t0 + k * period on CLOCK_MONOTONIC, so that errors don't
+    accumulate. Waiting is a sleep until spin_margin before the deadline
+    (time.sleep is a clock_nanosleep on Linux), then a busy wait for the
+    rest - the margin trades CPU for jitter. 0 for no busy wait at all.
+'''
+from typing import Tuple
+
+import time
+
+
+class FramePacer:
+
+    def __init__(self, period_ns: int, spin_margin_ns: int = 200_000) -> None:
+
+        self.period_ns = period_ns
+        self.spin_margin_ns = spin_margin_ns
+
+        self.deadline_ns = time.monotonic_ns()
+
+        self.n_overruns = 0  # Deadlines missed by more than a period
+        self.reset_stats()
+
+    def reset_stats(self) -> None:
+        self.n_frames = 0
+        self._sum_ns = 0
+        self._sum_sq_ns2 = 0
+        self.max_late_ns = 0
+
+    def set_period(self, period_ns: int) -> None:
+        # Applies from the deadline after the upcoming one.
+        self.period_ns = period_ns
+
+    def wait(self) -> int:
+        '''
+            Waits for the next deadline, then schedules the following one.
+            Returns the lateness of the wake-up (ns).
+        '''
+        deadline = self.deadline_ns
+
+        remaining = deadline - self.spin_margin_ns - time.monotonic_ns()
+        if remaining > 0:
+            time.sleep(remaining * 1e-9)
+        now = time.monotonic_ns()
+        while now < deadline:
+            now = time.monotonic_ns()
+
+        late = now - deadline
+        self.n_frames += 1
+        self._sum_ns += late
+        self._sum_sq_ns2 += late * late
+        self.max_late_ns = max(self.max_late_ns, late)
+
+        self.deadline_ns = deadline + self.period_ns
+        if late > self.period_ns:
+            # Don't burst to catch up: restart the schedule from now.
+            self.n_overruns += 1
+            self.deadline_ns = now + self.period_ns
+
+        return late
+
+    def stats_us(self) -> Tuple[float, float, float]:
+        '''
+            (mean, rms, max) lateness since the last reset_stats (us).
+        '''
+        if self.n_frames == 0:
+            return 0., 0., 0.
+        mean = self._sum_ns / self.n_frames
+        rms = (self._sum_sq_ns2 / self.n_frames)**.5
+        return mean * 1e-3, rms * 1e-3, self.max_late_ns * 1e-3
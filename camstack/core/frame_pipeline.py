@@ -0,0 +1,171 @@
+'''
+    Two-stage acquisition / publication pipeline for the python frame takers
+
+    The acquisition thread (the caller of push) only dequeues the driver
+    buffer, copies it into a free slot of a small pool, and gives the buffer
+    back to the driver. Conversion, keywords and the SHM post happen in the
+    publisher thread. A stall of the publisher thus never delays the driver
+    dequeue: once the pool is exhausted, new frames are dropped - and counted.
+    The publisher should write the slot straight into the SHM buffer
+    (shm_ring.SHMFrameWriter), so that the pool costs no extra copy: one
+    copy out of the driver buffer, one unpack or copy into the SHM.
+
+    Also keeps the loss accounting of the acquisition: frames dropped here,
+    frames missed by the driver (gaps in the camera frame counter) and
+    incomplete frames.
+'''
+from typing import Callable, NamedTuple, Optional as Op
+
+import queue
+import threading
+import logging as logg
+
+import numpy as np
+
+from pyMilk.interfacing.shm import SHM
+
+
+class FrameInfo(NamedTuple):
+    t_us: int  # Host, CLOCK_REALTIME
+    t_mono_us: int  # Host, CLOCK_MONOTONIC
+    frame_id: int = -1  # Camera frame counter, -1 if unavailable
+    hw_time_us: int = -1  # Camera timestamp (camera clock), -1 if unavailable
+
+
+PublishType = Callable[[np.ndarray, FrameInfo], None]  # raw frame copy, info
+
+# To add to the keywords of the taker SHM.
+# Keywords cost too much to be written for every frame: only _MAQTIME is.
+# The others are throttled, with MFRATE - see update_throttled_keywords.
+# Exact per-frame values: the <stream>_ring SHM of the ring mode.
+FRAME_KEYWORDS = {
+        '_MAQMONO': (0, "Last frame acq time (us, CLOCK_MONOTONIC)"),
+        '_FRAMEID': (-1, "Last camera frame counter (-1: n/a)"),
+        '_HWTIME': (-1, "Last camera timestamp (us, cam clock; -1: n/a)"),
+        '_DROPCNT': (0, "Frames dropped, publisher too slow (count)"),
+        '_MISSCNT': (0, "Frames missed by the driver (count)"),
+        '_INCOCNT': (0, "Incomplete frames discarded (count)"),
+}
+
+
+class FramePipeline:
+    '''
+        depth: number of frames that may wait for the publisher.
+        publish: called in the publisher thread with a slot holding a copy of
+        the raw frame - valid until publish returns.
+    '''
+
+    def __init__(self, publish: PublishType, depth: int = 4) -> None:
+
+        self.publish = publish
+        self.depth = depth
+
+        # Slots are allocated upon first use, for the shape of the raw frames.
+        self._free: queue.Queue = queue.Queue()
+        for _ in range(depth):
+            self._free.put(None)
+        self._full: queue.Queue = queue.Queue()
+
+        self._stop = threading.Event()
+        self._thread: Op[threading.Thread] = None
+        self.error: Op[BaseException] = None
+
+        # Acquisition thread
+        self.n_pushed = 0
+        self.n_dropped = 0  # Publisher too slow
+        self.n_missed = 0  # Never delivered by the driver
+        self.n_incomplete = 0
+        self._last_frame_id = -1
+        # Publisher thread
+        self.n_published = 0
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 2.0) -> None:
+        '''
+            Frames already pushed are published before the thread exits.
+        '''
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _count_frame_id(self, frame_id: int) -> None:
+        if frame_id < 0:
+            return
+        # A counter going backwards is a reset (or a wrap): no accounting.
+        if self._last_frame_id >= 0 and frame_id > self._last_frame_id:
+            self.n_missed += frame_id - self._last_frame_id - 1
+        self._last_frame_id = frame_id
+
+    def mark_incomplete(self, frame_id: int = -1) -> None:
+        '''
+            Acquisition thread, for a frame discarded by the driver.
+        '''
+        self.n_incomplete += 1
+        self._count_frame_id(frame_id)
+
+    def push(self, raw: np.ndarray, info: FrameInfo) -> bool:
+        '''
+            Acquisition thread. Copies raw (the driver buffer may be released
+            as soon as this returns).
+            Returns False if the frame was dropped.
+        '''
+        if self.error is not None:
+            raise RuntimeError(f'FramePipeline: publisher failed: {self.error}')
+
+        self._count_frame_id(info.frame_id)
+
+        try:
+            slot = self._free.get_nowait()
+        except queue.Empty:
+            self.n_dropped += 1
+            return False
+
+        if slot is None or slot.shape != raw.shape or slot.dtype != raw.dtype:
+            slot = np.empty_like(raw)
+        np.copyto(slot, raw)
+
+        self._full.put((slot, info))
+        self.n_pushed += 1
+        return True
+
+    def update_frame_keywords(self, shm: SHM, info: FrameInfo) -> None:
+        '''
+            Publisher thread, for every frame.
+        '''
+        shm.update_keyword('_MAQTIME', info.t_us)
+
+    def update_throttled_keywords(self, shm: SHM, info: FrameInfo) -> None:
+        '''
+            Publisher thread, with the MFRATE updates.
+        '''
+        shm.update_keyword('_MAQMONO', info.t_mono_us)
+        shm.update_keyword('_FRAMEID', info.frame_id)
+        shm.update_keyword('_HWTIME', info.hw_time_us)
+        shm.update_keyword('_DROPCNT', self.n_dropped)
+        shm.update_keyword('_MISSCNT', self.n_missed)
+        shm.update_keyword('_INCOCNT', self.n_incomplete)
+
+    def backlog(self) -> int:
+        return self._full.qsize()
+
+    def _run(self) -> None:
+        while not (self._stop.is_set() and self._full.empty()):
+            try:
+                slot, info = self._full.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+            try:
+                self.publish(slot, info)
+            except Exception as exc:
+                logg.error(f'FramePipeline: publish error: {exc}')
+                self.error = exc
+                return
+            finally:
+                self._free.put(slot)
+
+            self.n_published += 1
@@ -0,0 +1,209 @@
+'''
+    Unpacking of packed pixel formats into uint16
+
+    GenICam Mono10p / Mono12p (BlackFly S), and Mono10Packed / Mono12Packed,
+    (BlackFly S, and the IIDC MONO12 of the Flea3 / Grasshopper3).
+
+    Everything is done with in-place numpy ufuncs, into preallocated buffers:
+    no per-frame allocation. Used by the USB takers (src/spinnaker_usbtake,
+    src/flycapture_usbtake) instead of the vendor conversions to Mono16.
+
+    Benchmark, at the max resolution of each of our cameras:
+        python -m camstack.core.pixel_unpack
+'''
+from typing import Callable, Dict, Optional as Op, Tuple
+
+import numpy as np
+
+U16 = np.uint16
+
+
+def _unpack_lsb_first(raw: np.ndarray, out: np.ndarray, scratch: np.ndarray,
+                      bits: int, group_bytes: int) -> None:
+    '''
+        LSB-first bit streams (Mono10p, Mono12p): each pixel group is read
+        at once as a little-endian word, through an overlapping strided view
+        of the raw buffer (scratch has the word dtype). Then pixel k of the
+        group is (word >> k * bits) & mask.
+        The last group is done separately, since its word would read past
+        the end of the buffer.
+    '''
+    o = out.reshape(-1, 8 * group_bytes // bits)
+    n_groups = o.shape[0] - 1
+    words = np.ndarray((n_groups, ), dtype=scratch.dtype, buffer=raw,
+                       strides=(group_bytes, ))
+    mask = (1 << bits) - 1
+
+    np.bitwise_and(words, mask, out=o[:-1, 0], casting='unsafe')
+    for k in range(1, o.shape[1]):
+        np.right_shift(words, k * bits, out=scratch[:n_groups])
+        np.bitwise_and(scratch[:n_groups], mask, out=o[:-1, k],
+                       casting='unsafe')
+
+    last = int.from_bytes(raw[-group_bytes:].tobytes(), 'little')
+    for k in range(o.shape[1]):
+        o[-1, k] = (last >> k * bits) & mask
+
+
+def _unpack_mono12p(raw: np.ndarray, out: np.ndarray,
+                    scratch: np.ndarray) -> None:
+    # 2 pixels in 3 bytes: p0 = b0 | (b1 & 0x0f) << 8 ; p1 = b1 >> 4 | b2 << 4
+    _unpack_lsb_first(raw, out, scratch, 12, 3)
+
+
+def _unpack_mono10p(raw: np.ndarray, out: np.ndarray,
+                    scratch: np.ndarray) -> None:
+    # 4 pixels in 5 bytes
+    _unpack_lsb_first(raw, out, scratch, 10, 5)
+
+
+def _unpack_mono12packed(raw: np.ndarray, out: np.ndarray,
+                         scratch: np.ndarray) -> None:
+    # 2 pixels in 3 bytes, MSBs in b0 and b2:
+    # p0 = b0 << 4 | (b1 & 0x0f) ; p1 = b2 << 4 | b1 >> 4
+    b = raw.reshape(-1, 3)
+    o = out.reshape(-1, 2)
+
+    o0 = o[:, 0]
+    np.left_shift(b[:, 0], 4, out=o0, dtype=U16)
+    np.bitwise_and(b[:, 1], 0x0f, out=scratch, dtype=U16)
+    np.bitwise_or(o0, scratch, out=o0)
+
+    o1 = o[:, 1]
+    np.left_shift(b[:, 2], 4, out=o1, dtype=U16)
+    np.right_shift(b[:, 1], 4, out=scratch, dtype=U16)
+    np.bitwise_or(o1, scratch, out=o1)
+
+
+def _unpack_mono10packed(raw: np.ndarray, out: np.ndarray,
+                         scratch: np.ndarray) -> None:
+    # 2 pixels in 3 bytes, MSBs in b0 and b2:
+    # p0 = b0 << 2 | (b1 & 0x03) ; p1 = b2 << 2 | (b1 >> 4) & 0x03
+    b = raw.reshape(-1, 3)
+    o = out.reshape(-1, 2)
+
+    o0 = o[:, 0]
+    np.left_shift(b[:, 0], 2, out=o0, dtype=U16)
+    np.bitwise_and(b[:, 1], 0x03, out=scratch, dtype=U16)
+    np.bitwise_or(o0, scratch, out=o0)
+
+    o1 = o[:, 1]
+    np.left_shift(b[:, 2], 2, out=o1, dtype=U16)
+    np.right_shift(b[:, 1], 4, out=scratch, dtype=U16)
+    np.bitwise_and(scratch, 0x03, out=scratch)
+    np.bitwise_or(o1, scratch, out=o1)
+
+
+UnpackFunc = Callable[[np.ndarray, np.ndarray, np.ndarray], None]
+
+# Format name: (unpacking function, bits per pixel, pixels per group,
+#               scratch dtype)
+UNPACKERS: Dict[str, Tuple[UnpackFunc, int, int, type]] = {
+        'Mono10p': (_unpack_mono10p, 10, 4, np.uint64),
+        'Mono12p': (_unpack_mono12p, 12, 2, np.uint32),
+        # 12 bits on the wire
+        'Mono10Packed': (_unpack_mono10packed, 12, 2, U16),
+        'Mono12Packed': (_unpack_mono12packed, 12, 2, U16),
+}
+# Significant bits, if not the bits on the wire
+DATA_BITS = {'Mono10Packed': 10}
+
+
+class PixelUnpacker:
+    '''
+        Unpacks frames of a given packed format and shape into a persistent
+        uint16 buffer.
+
+        msb_align: shift values to the top of the 16 bits, as the vendor
+        conversions to Mono16 do.
+    '''
+
+    def __init__(self, pixel_format: str, shape: Tuple[int, int],
+                 msb_align: bool = False) -> None:
+
+        if pixel_format not in UNPACKERS:
+            raise ValueError(f'Unsupported packed format {pixel_format}')
+
+        self.pixel_format = pixel_format
+        self.shape = shape
+        self._func, self.bits, group, scratch_dtype = UNPACKERS[pixel_format]
+        data_bits = DATA_BITS.get(pixel_format, self.bits)
+        self.shift = 16 - data_bits if msb_align else 0
+
+        n_pix = shape[0] * shape[1]
+        if n_pix % group != 0:
+            raise ValueError(f'{pixel_format}: {shape} not a multiple of '
+                             f'{group} pixels')
+        self.n_bytes = n_pix * self.bits // 8
+
+        self.out = np.zeros(shape, dtype=U16)
+        self._scratch = np.zeros(n_pix // group, dtype=scratch_dtype)
+
+    def __call__(self, raw: np.ndarray,
+                 out: Op[np.ndarray] = None) -> np.ndarray:
+        '''
+            raw: the packed buffer, as uint8 - it may be longer than a frame.
+            out: target array of self.shape, uint16 C-contiguous;
+                 defaults to the persistent buffer self.out.
+        '''
+        if out is None:
+            out = self.out
+        self._func(raw[:self.n_bytes], out, self._scratch)
+        if self.shift:
+            np.left_shift(out, self.shift, out=out)
+        return out
+
+
+def _pack_reference(pixels: np.ndarray, pixel_format: str) -> np.ndarray:
+    '''
+        Slow, obvious packing - to check the unpackers.
+    '''
+    p = pixels.ravel().astype(np.uint32)
+    if pixel_format in ('Mono10p', 'Mono12p'):
+        bits = UNPACKERS[pixel_format][1]
+        # LSB-first bit stream
+        bitstream = (p[:, None] >> np.arange(bits)) & 1
+        return np.packbits(bitstream.ravel().astype(np.uint8),
+                           bitorder='little')
+
+    low_bits = DATA_BITS.get(pixel_format, 12) - 8
+    p0, p1 = p[0::2], p[1::2]
+    mask = (1 << low_bits) - 1
+    packed = np.empty((len(p0), 3), dtype=np.uint8)
+    packed[:, 0] = p0 >> low_bits
+    packed[:, 1] = (p0 & mask) | (p1 & mask) << 4
+    packed[:, 2] = p1 >> low_bits
+    return packed.ravel()
+
+
+# Max resolution (rows, cols) of our USB cameras
+BENCHMARK_CAMERAS = {
+        'Flea3 FL3-U3-13S2M': (1048, 1328),
+        'Grasshopper3 GS3-U3-23S6M': (1200, 1920),
+        'BlackFly S BFS-U3-51S5M': (2048, 2448),
+}
+
+if __name__ == "__main__":
+    import time
+
+    n_iter = 50
+    rng = np.random.default_rng(0)
+
+    print(f'{"Camera":<28s}{"Format":<14s}{"ms/frame":>10s}'
+          f'{"Mpix/s":>10s}{"max fps":>10s}')
+    for cam_name, shape in BENCHMARK_CAMERAS.items():
+        for fmt in UNPACKERS:
+            bits = DATA_BITS.get(fmt, UNPACKERS[fmt][1])
+            pixels = rng.integers(0, 1 << bits, shape, dtype=U16)
+            raw = _pack_reference(pixels, fmt)
+
+            unpacker = PixelUnpacker(fmt, shape)
+            assert np.array_equal(unpacker(raw), pixels), fmt
+
+            t_start = time.perf_counter()
+            for _ in range(n_iter):
+                unpacker(raw)
+            dt = (time.perf_counter() - t_start) / n_iter
+
+            print(f'{cam_name:<28s}{fmt:<14s}{dt * 1e3:10.2f}'
+                  f'{pixels.size / dt / 1e6:10.1f}{1 / dt:10.1f}')
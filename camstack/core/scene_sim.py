@@ -0,0 +1,244 @@
+'''
+    Scene and detector simulation for the simulated cameras
+
+    Modes:
+        - 'psf': a few jittering gaussian PSFs on a sky background; dark
+          current map with hot pixels, dead pixels, photon and read noise,
+          gain, bias, saturation.
+        - 'ndr<N>' (e.g. 'ndr8'): same scene, as the raw non-destructive
+          reads of up-the-ramp exposures of N reads (CRED1 raw stream,
+          e.g. apapane_raw). N = 2 is CDS.
+        - 'ocam': same scene, in a scrambled readout order like the OCAM2K
+          raw stream: 8 amplifiers (2 x 4 blocks, read from the center rows
+          outwards and from the center columns outwards), interleaved pixel
+          by pixel. It has the structure, not the exact LUT, of ocam_decode.
+
+    Everything is vectorized into preallocated buffers. Noise is drawn as
+    random windows into a pool of gaussian samples drawn once, which is
+    the only way to keep up with the camera rates in numpy.
+
+    Benchmark, at the size of the cameras:
+        python -m camstack.core.scene_sim
+'''
+from typing import Optional as Op, Tuple
+
+import numpy as np
+
+
+def parse_scene_mode(mode: str) -> Tuple[str, int]:
+    '''
+        'psf' -> ('psf', 1); 'ndr8' -> ('ndr', 8); 'ocam' -> ('ocam', 1)
+    '''
+    if mode.startswith('ndr'):
+        n_reads = int(mode[3:]) if mode[3:] else 2
+        if n_reads < 2:
+            raise ValueError(f'Scene mode {mode}: needs 2 reads or more')
+        return 'ndr', n_reads
+    if mode in ('psf', 'ocam'):
+        return mode, 1
+    raise ValueError(f'Unknown scene mode {mode}')
+
+
+def ocam_scramble_index(shape: Tuple[int, int]) -> np.ndarray:
+    '''
+        Flat index, for each pixel of the raw (scrambled) stream, of the
+        image pixel it holds.
+    '''
+    rows, cols = shape
+    if rows % 2 != 0 or cols % 4 != 0:
+        raise ValueError(f'OCAM scrambling: {shape} not a multiple of (2, 4)')
+
+    index = np.arange(rows * cols).reshape(rows, cols)
+    hr, qc = rows // 2, cols // 4
+
+    amps = []
+    for half in (index[:hr][::-1], index[hr:]):  # Center rows first
+        for q in range(4):
+            block = half[:, q * qc:(q + 1) * qc]
+            if q < 2:  # Center columns first
+                block = block[:, ::-1]
+            amps += [block.ravel()]
+
+    # Pixel k of every amplifier, in turn.
+    return np.stack(amps, axis=1).ravel()
+
+
+class SceneGenerator:
+    '''
+        Frames are computed in ADU, in float32, then clipped and cast.
+        exptime (sec. - per read for ndr) may be changed between frames.
+    '''
+
+    N_SOURCES = 3
+    PSF_FWHM = 4.0  # pix
+    JITTER_RMS = 0.5  # pix, frame to frame
+    SOURCE_FLUX = 3e8  # e-/s - the brightest saturate at 10 ms.
+    SKY = 200.  # e-/s/pix
+    DARK = 20.  # e-/s/pix, median
+    HOT_FRACTION = 1e-3
+    HOT_DARK = 2e4  # e-/s/pix
+    DEAD_FRACTION = 5e-4
+    READ_NOISE = 10.  # e- per read
+    GAIN = 2.  # e- / ADU
+    BIAS = 1000.  # ADU
+    SATURATION = 60000.  # ADU, or the max of the integer output type.
+
+    NOISE_EXTRA = 1 << 16  # Extra noise samples, to take random windows from
+
+    def __init__(self, shape: Tuple[int, int], mode: str = 'psf',
+                 dtype: type = np.uint16, exptime: float = 0.01,
+                 seed: Op[int] = None) -> None:
+
+        self.shape = shape
+        self.mode, self.n_reads = parse_scene_mode(mode)
+        self.dtype = np.dtype(dtype)
+        self.exptime = exptime
+        self.rng = np.random.default_rng(seed)
+
+        self.saturation = self.SATURATION
+        if self.dtype.kind in 'iu':
+            self.saturation = min(self.saturation, np.iinfo(self.dtype).max)
+
+        rows, cols = shape
+        n_pix = rows * cols
+        rng = self.rng
+
+        self.src_y = rng.uniform(0.2, 0.8, self.N_SOURCES) * rows
+        self.src_x = rng.uniform(0.2, 0.8, self.N_SOURCES) * cols
+        self.src_flux = self.SOURCE_FLUX * rng.uniform(0.1, 1., self.N_SOURCES)
+        self._yy = np.arange(rows, dtype=np.float32)
+        self._xx = np.arange(cols, dtype=np.float32)
+
+        # Fixed pattern: sky + dark (lognormal, plus hot pixels), dead pixels.
+        dark = self.DARK * rng.lognormal(0., 0.5, shape)
+        dark[rng.random(shape) < self.HOT_FRACTION] = self.HOT_DARK
+        self._live = (rng.random(shape) >=
+                      self.DEAD_FRACTION).astype(np.float32)
+        self._background_rate = ((self.SKY + dark) * self._live /
+                                 self.GAIN).astype(np.float32)  # ADU/s
+        self._background = np.zeros(shape, dtype=np.float32)  # ADU
+        self._background_exptime = -1.
+
+        # Scaled for the noise in ADU: std(e-) / GAIN = sqrt(ADU / GAIN)
+        self._noise_pool = (rng.standard_normal(n_pix + self.NOISE_EXTRA) /
+                            self.GAIN**.5).astype(np.float32)
+
+        self._signal = np.zeros(shape, dtype=np.float32)
+        self._tmp = np.zeros(shape, dtype=np.float32)
+        self._frame = np.zeros(shape, dtype=self.dtype)
+
+        # ndr: ADU per read, and photon noise of the current ramp.
+        self._rate = np.zeros(shape, dtype=np.float32)
+        self._ramp_noise: Op[np.ndarray] = None
+
+        self._scramble: Op[np.ndarray] = None
+        if self.mode == 'ocam':
+            self._scramble = ocam_scramble_index(shape)
+            self._out = np.zeros(shape, dtype=self.dtype)
+
+        self.n_frames = 0
+
+    def _noise(self) -> np.ndarray:
+        n_pix = self._signal.size
+        off = self.rng.integers(0, self.NOISE_EXTRA)
+        return self._noise_pool[off:off + n_pix].reshape(self.shape)
+
+    def _expected(self, out: np.ndarray) -> None:
+        '''
+            Noiseless ADU (without bias), PSFs at jittered positions.
+        '''
+        if self.exptime != self._background_exptime:
+            np.multiply(self._background_rate, self.exptime,
+                        out=self._background)
+            self._background_exptime = self.exptime
+        np.copyto(out, self._background)
+
+        sigma = self.PSF_FWHM / 2.355
+        half = int(5 * sigma) + 1
+        amp = self.src_flux * self.exptime / (2 * np.pi * sigma**2 * self.GAIN)
+        jitter = self.rng.normal(0., self.JITTER_RMS, 2)
+        rows, cols = self.shape
+
+        # PSF stamps only - the rest of the frame is untouched.
+        for cy, cx, a in zip(self.src_y + jitter[0], self.src_x + jitter[1],
+                             amp):
+            y0, y1 = max(0, int(cy) - half), min(rows, int(cy) + half + 1)
+            x0, x1 = max(0, int(cx) - half), min(cols, int(cx) + half + 1)
+            if y0 >= y1 or x0 >= x1:
+                continue
+            gy = np.exp(-0.5 * ((self._yy[y0:y1] - cy) / sigma)**2)
+            gx = np.exp(-0.5 * ((self._xx[x0:x1] - cx) / sigma)**2)
+            out[y0:y1, x0:x1] += (a * gy[:, None] * gx[None, :] *
+                                  self._live[y0:y1, x0:x1])
+
+    def _to_frame(self, sig: np.ndarray) -> np.ndarray:
+        sig += self.BIAS
+        np.clip(sig, 0., self.saturation, out=self._frame, casting='unsafe')
+        return self._frame
+
+    def render(self, out: Op[np.ndarray] = None) -> np.ndarray:
+        '''
+            Next frame (next read for ndr).
+            out: target array of self.shape and dtype, C-contiguous;
+                 defaults to a persistent buffer.
+        '''
+        if out is None:
+            out = self._frame if self._scramble is None else self._out
+        sig, tmp = self._signal, self._tmp
+        rn2 = self.READ_NOISE**2 / self.GAIN  # (ADU) x GAIN
+
+        if self.mode == 'ndr':
+            read = self.n_frames % self.n_reads
+            if read == 0:  # Reset: new ramp
+                self._expected(self._rate)
+                self._ramp_noise = self._noise()
+            np.multiply(self._rate, read + 1, out=sig)
+            # Photon noise: cumulated along the ramp. Read noise: per read.
+            np.sqrt(sig, out=tmp)
+            tmp *= self._ramp_noise
+            sig += tmp
+            np.multiply(self._noise(), rn2**.5, out=tmp)
+            sig += tmp
+        else:
+            self._expected(sig)
+            # Photon and read noise at once.
+            np.add(sig, rn2, out=tmp)
+            np.sqrt(tmp, out=tmp)
+            tmp *= self._noise()
+            sig += tmp
+
+        frame = self._to_frame(sig)
+        self.n_frames += 1
+
+        if self._scramble is not None:
+            np.take(frame.ravel(), self._scramble, out=out.ravel())
+        elif out is not frame:
+            np.copyto(out, frame)
+        return out
+
+
+# (rows, cols), scene mode of our cameras
+BENCHMARK_CAMERAS = {
+        'CRED1 (apapane_raw)': ((256, 320), 'ndr8'),
+        'OCAM2K': ((240, 240), 'ocam'),
+        'CRED2': ((512, 640), 'psf'),
+        'OrcaQuest': ((2304, 4096), 'psf'),
+}
+
+if __name__ == "__main__":
+    import time
+
+    n_iter = 50
+
+    print(f'{"Camera":<24s}{"Mode":<8s}{"ms/frame":>10s}{"max fps":>10s}')
+    for cam_name, (shape, mode) in BENCHMARK_CAMERAS.items():
+        gen = SceneGenerator(shape, mode, seed=0)
+        out = np.empty(shape, dtype=gen.dtype)
+        gen.render(out)
+
+        t_start = time.perf_counter()
+        for _ in range(n_iter):
+            gen.render(out)
+        dt = (time.perf_counter() - t_start) / n_iter
+
+        print(f'{cam_name:<24s}{mode:<8s}{dt * 1e3:10.2f}{1 / dt:10.1f}')
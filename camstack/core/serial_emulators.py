@@ -0,0 +1,752 @@
+'''
+    Protocol-level serial emulators for the EDT cameras
+
+    Stateful, local stand-ins for the command languages of the
+    CRED1, CRED2, OCAM2K and NUVU, answering in the exact formats that the
+    corresponding camstack classes parse.
+
+    Picked up by EDTCamera.init_framegrab_backend from the environment
+    (see also camstack.core.serial_replay):
+        CAMSTACK_SERIAL_EMULATE=1                emulate, model chosen by the
+                                                 SERIAL_EMULATOR class attribute
+        CAMSTACK_SERIAL_EMULATE_LATENCY=<float>  seconds per exchange [default: 0.01]
+        CAMSTACK_SERIAL_EMULATE_QUIRKS=<a,b,..>  firmware quirks to enable, see
+                                                 the QUIRKS of each emulator.
+
+    The taker is then simcam_framegen, and the emulated fps is forwarded to
+    it - so that the whole stack runs hardware-free, e.g. to measure end-to-end
+    mode-switch time.
+'''
+from typing import (Callable, Dict, List, Optional as Op, Pattern, Set, Tuple)
+
+import os
+import re
+import time
+import random
+import threading
+import logging as logg
+from abc import ABC, abstractmethod
+
+ENV_EMULATE = 'CAMSTACK_SERIAL_EMULATE'
+ENV_EMULATE_LATENCY = 'CAMSTACK_SERIAL_EMULATE_LATENCY'
+ENV_EMULATE_QUIRKS = 'CAMSTACK_SERIAL_EMULATE_QUIRKS'
+
+HandlerType = Callable[..., str]
+
+
+class SerialEmulator:
+    '''
+        Base class: dispatches commands through (regex, handler) pairs.
+        Handlers get the regex groups as arguments and return the payload;
+        _format_reply wraps it as the camera would.
+    '''
+
+    QUIRKS: Dict[str, str] = {}  # Name: description
+
+    def __init__(self, latency: float = 0.01,
+                 quirks: Op[Set[str]] = None) -> None:
+
+        self.latency = latency
+        self.quirks: Set[str] = set() if quirks is None else set(quirks)
+        for quirk in self.quirks:
+            if quirk not in self.QUIRKS:
+                logg.warning(f'{type(self).__name__}: unknown quirk {quirk}')
+
+        self._lock = threading.Lock()
+        self._handlers: List[Tuple[Pattern, HandlerType]] = []
+
+        self.n_commands = 0
+
+        # Called with the new fps upon changes, to pace a frame generator
+        self.fps_callback: Op[Callable[[float], None]] = None
+
+    def _register(self, regex: str, handler: HandlerType) -> None:
+        self._handlers.append((re.compile(regex + '$'), handler))
+
+    def _notify_fps(self, fps: float) -> None:
+        if self.fps_callback is not None:
+            try:
+                self.fps_callback(fps)
+            except Exception as exc:
+                logg.error(f'{type(self).__name__}: fps_callback error {exc}')
+
+    def send_command(self, cmd: str, base_timeout: float = 100.) -> str:
+        with self._lock:
+            if self.latency > 0.:
+                time.sleep(self.latency)
+            self.n_commands += 1
+
+            cmd = cmd.strip()
+            for regex, handler in self._handlers:
+                match = regex.match(cmd)
+                if match:
+                    return self._format_reply(handler(*match.groups()))
+
+            return self._format_unknown(cmd)
+
+    def _format_reply(self, payload: str) -> str:
+        return payload
+
+    def _format_unknown(self, cmd: str) -> str:
+        logg.warning(f'{type(self).__name__}: unknown command "{cmd}"')
+        return ''
+
+    def close(self) -> None:
+        pass
+
+
+class _FLIEmulator(SerialEmulator, ABC):
+    '''
+        Common grounds for the First Light Imaging CRED1 and CRED2
+        Answers end with the "\\r\\nfli-cli>" prompt.
+    '''
+
+    QUIRKS = {
+            'crop_settle':
+                    'cropping readback lags the set command by CROP_SETTLE_TIME',
+            'double_prompt':
+                    'randomly prepend a stale prompt to the answers',
+            'ndr_fps_rescale':
+                    'changing the NDR rescales the fps to the max fps',
+    }
+
+    PROMPT = '\r\nfli-cli>'
+    CROP_SETTLE_TIME = 0.3
+
+    FULL_COLS = 640
+    FULL_ROWS = 512
+
+    def __init__(self, latency: float = 0.01,
+                 quirks: Op[Set[str]] = None) -> None:
+        super().__init__(latency, quirks)
+
+        self.cropping = False
+        # Column and row cropping in camera units (what 'cropping raw' reports)
+        self.crop_cols: Tuple[int, int] = (0, 0)
+        self.crop_rows: Tuple[int, int] = (0, 0)
+        self._crop_pending: List[Tuple[float, str, Tuple[int, int]]] = []
+
+        self.extsynchro = False
+        self.ndr = 1
+        self.fps = 100.
+        self.led = 'off'
+        self.rawimages = 'off'
+
+        self._register(r'set led (on|off)', self._set_led)
+        self._register(r'set rawimages (on|off)', self._set_rawimages)
+        self._register(r'set cropping (on|off)', self._set_cropping)
+        self._register(r'set cropping columns (\d+)-(\d+)',
+                       self._set_crop_columns)
+        self._register(r'set cropping rows (\d+)-(\d+)', self._set_crop_rows)
+        self._register(r'cropping raw', self._get_cropping)
+        self._register(r'set extsynchro (on|off)', self._set_extsynchro)
+        self._register(r'extsynchro raw', self._get_extsynchro)
+        self._register(r'set nbreadworeset (\d+)', self._set_ndr)
+        self._register(r'nbreadworeset raw', lambda: str(self.ndr))
+        self._register(r'set fps ([-+.e\d]+)', self._set_fps)
+        self._register(r'fps raw', lambda: f'{self.fps:.6f}')
+        self._register(r'maxfps raw', lambda: f'{self.max_fps():.6f}')
+        self._register(r'shutdown', lambda: 'OK')
+
+    # Geometry
+    @abstractmethod
+    def _crop_size(self) -> Tuple[int, int]:
+        '''
+            (columns, rows) of the current readout, in pixels
+        '''
+
+    @abstractmethod
+    def max_fps(self) -> float:
+        '''
+            Max fps at the current cropping / readout mode
+        '''
+
+    def _format_reply(self, payload: str) -> str:
+        if 'double_prompt' in self.quirks and random.random() < 0.05:
+            payload = 'fli-cli>' + payload
+        return payload + self.PROMPT
+
+    def _format_unknown(self, cmd: str) -> str:
+        logg.warning(f'{type(self).__name__}: unknown command "{cmd}"')
+        return 'Unknown command' + self.PROMPT
+
+    def _set_led(self, val: str) -> str:
+        self.led = val
+        return 'OK'
+
+    def _set_rawimages(self, val: str) -> str:
+        self.rawimages = val
+        return 'OK'
+
+    def _set_cropping(self, val: str) -> str:
+        self.cropping = val == 'on'
+        self._clamp_fps()
+        return 'OK'
+
+    def _crop_apply(self, which: str, value: Tuple[int, int]) -> None:
+        if 'crop_settle' in self.quirks:
+            self._crop_pending.append(
+                    (time.monotonic() + self.CROP_SETTLE_TIME, which, value))
+        else:
+            setattr(self, which, value)
+            self._clamp_fps()
+
+    def _crop_settle(self) -> None:
+        now = time.monotonic()
+        for pending in [p for p in self._crop_pending if p[0] <= now]:
+            setattr(self, pending[1], pending[2])
+            self._crop_pending.remove(pending)
+        self._clamp_fps()
+
+    def _set_crop_columns(self, c0: str, c1: str) -> str:
+        self._crop_apply('crop_cols', (int(c0), int(c1)))
+        return 'OK'
+
+    def _set_crop_rows(self, r0: str, r1: str) -> str:
+        self._crop_apply('crop_rows', (int(r0), int(r1)))
+        return 'OK'
+
+    def _get_cropping(self) -> str:
+        self._crop_settle()
+        return (f'{("off", "on")[self.cropping]}:'
+                f'{self.crop_cols[0]}-{self.crop_cols[1]}:'
+                f'{self.crop_rows[0]}-{self.crop_rows[1]}')
+
+    def _set_extsynchro(self, val: str) -> str:
+        self.extsynchro = val == 'on'
+        return 'OK'
+
+    def _get_extsynchro(self) -> str:
+        return ('off', 'on')[self.extsynchro]
+
+    def _set_ndr(self, ndr: str) -> str:
+        self.ndr = max(1, int(ndr))
+        if 'ndr_fps_rescale' in self.quirks:
+            self.fps = self.max_fps()
+            self._notify_fps(self.fps)
+        return 'OK'
+
+    def _set_fps(self, fps: str) -> str:
+        self.fps = min(float(fps), self.max_fps())
+        self._notify_fps(self.fps)
+        return 'OK'
+
+    def _clamp_fps(self) -> None:
+        if self.fps > self.max_fps():
+            self.fps = self.max_fps()
+            self._notify_fps(self.fps)
+
+
+class CRED1Emulator(_FLIEmulator):
+    '''
+        CRED1: 320x256, columns cropped by blocks of 32, 1-indexed.
+    '''
+
+    QUIRKS = dict(_FLIEmulator.QUIRKS)
+    QUIRKS.update({
+            'mode_resets_gain': 'set mode resets the gain to 1',
+            'cold_start':
+                    'start warm ("ready"), cool down in COOLDOWN_TIME after '
+                    '"set cooling on"',
+    })
+
+    FULL_COLS = 320
+    FULL_ROWS = 256
+    COOLDOWN_TIME = 20.
+
+    def __init__(self, latency: float = 0.01,
+                 quirks: Op[Set[str]] = None) -> None:
+        super().__init__(latency, quirks)
+
+        self.crop_cols = (1, self.FULL_COLS // 32)
+        self.crop_rows = (1, self.FULL_ROWS)
+        self.fps = self.max_fps()
+
+        self.readout_mode = 'globalresetcds'
+        self.ndr = 2
+        self.gain = 1
+        self.max_gain = 30
+        self.imagetags = 'off'
+        self.events = 'on'
+
+        self.cooling = 'cold_start' not in self.quirks
+        self.cooling_start: Op[float] = None
+        self.status = 'operational' if self.cooling else 'ready'
+
+        self._register(r'set events (on|off)', self._set_events)
+        self._register(r'set imagetags (on|off)', self._set_imagetags)
+        self._register(r'set gain (\d+)', self._set_gain)
+        self._register(r'gain raw', lambda: str(self.gain))
+        self._register(r'maxpossiblegain raw', lambda: str(self.max_gain))
+        self._register(r'set mode (\w+)', self._set_mode)
+        self._register(r'mode raw', lambda: self.readout_mode)
+        self._register(r'status raw', self._get_status)
+        self._register(r'continue', lambda: 'OK')
+        self._register(r'set cooling (on|off)', self._set_cooling)
+        self._register(r'pressure raw', lambda: '0.00001234')
+        self._register(r'temp cryostat diode raw',
+                       lambda: f'{self._cryo_temp():.2f}')
+        self._register(r'temp water raw', lambda: '18.50')
+
+    def _crop_size(self) -> Tuple[int, int]:
+        if not self.cropping:
+            return self.FULL_COLS, self.FULL_ROWS
+        return (32 * (self.crop_cols[1] - self.crop_cols[0] + 1),
+                self.crop_rows[1] - self.crop_rows[0] + 1)
+
+    def max_fps(self) -> float:
+        # Fitted on the CRED1 MODES: ~10.7 us overhead + 0.109 us per 32-px row chunk
+        cols, rows = self._crop_size()
+        return 1. / (10.7e-6 + 0.1087e-6 * (cols // 32) * rows)
+
+    def _set_events(self, val: str) -> str:
+        self.events = val
+        return 'OK'
+
+    def _set_imagetags(self, val: str) -> str:
+        self.imagetags = val
+        return 'OK'
+
+    def _set_gain(self, gain: str) -> str:
+        self.gain = min(int(gain), self.max_gain)
+        return 'OK'
+
+    def _set_mode(self, mode: str) -> str:
+        if mode not in ('globalresetsingle', 'globalresetcds',
+                        'globalresetbursts'):
+            return 'Unknown mode'
+        self.readout_mode = mode
+        if 'mode_resets_gain' in self.quirks:
+            self.gain = 1
+        return 'OK'
+
+    def _set_cooling(self, val: str) -> str:
+        self.cooling = val == 'on'
+        if self.cooling and self.status == 'ready':
+            self.status = 'isbeingcooled'
+            self.cooling_start = time.monotonic()
+        return 'OK'
+
+    def _get_status(self) -> str:
+        if (self.status == 'isbeingcooled' and
+                    self.cooling_start is not None and
+                    time.monotonic() - self.cooling_start > self.COOLDOWN_TIME):
+            self.status = 'operational'
+        return self.status
+
+    def _cryo_temp(self) -> float:
+        if self.status == 'ready':
+            return 290.
+        if self.status == 'isbeingcooled':
+            assert self.cooling_start is not None
+            frac = min(1., (time.monotonic() - self.cooling_start) /
+                       self.COOLDOWN_TIME)
+            return 290. - frac * (290. - 80.)
+        return 80.
+
+
+class CRED2Emulator(_FLIEmulator):
+    '''
+        CRED2: 640x512, 0-indexed column and row cropping
+    '''
+
+    CRED2_SENSIBILITIES = ('low', 'medium', 'high')
+
+    def __init__(self, latency: float = 0.01,
+                 quirks: Op[Set[str]] = None) -> None:
+        super().__init__(latency, quirks)
+
+        self.cropping = True
+        self.crop_cols = (0, self.FULL_COLS - 1)
+        self.crop_rows = (0, self.FULL_ROWS - 1)
+        self.fps = self.max_fps()
+        self.tint = 0.9 / self.fps
+
+        self.sensibility = 'low'
+        self.temp_setpoint = 20.
+        self.fan_mode = 'automatic'
+        self.fan_speed = 100
+
+        self._register(r'set sensibility (\w+)', self._set_sensibility)
+        self._register(r'sensibility raw', lambda: self.sensibility)
+        self._register(r'set tint ([-+.e\d]+)', self._set_tint)
+        self._register(r'tint raw', lambda: f'{self.tint:.9f}')
+        self._register(r'maxtint raw', lambda: f'{self.max_tint():.9f}')
+        self._register(r'temp raw', self._get_temps)
+        self._register(r'set temp snake ([-+.\d]+)', self._set_setpoint)
+        self._register(r'temp snake setpoint raw',
+                       lambda: f'{self.temp_setpoint:.1f}')
+        self._register(r'set fan mode (\w+)', self._set_fan_mode)
+        self._register(r'set fan speed (\d+)', self._set_fan_speed)
+
+    def _crop_size(self) -> Tuple[int, int]:
+        return (self.crop_cols[1] - self.crop_cols[0] + 1,
+                self.crop_rows[1] - self.crop_rows[0] + 1)
+
+    def max_fps(self) -> float:
+        # Fitted on the Palila MODES: ~79 us overhead + 7.16 ns per pixel
+        cols, rows = self._crop_size()
+        return 1. / (79.3e-6 + 7.16e-9 * cols * rows) / self.ndr
+
+    def max_tint(self) -> float:
+        return 1. / self.fps - 5e-6
+
+    def _set_sensibility(self, sens: str) -> str:
+        if sens not in self.CRED2_SENSIBILITIES:
+            return 'Unknown sensibility'
+        self.sensibility = sens
+        return 'OK'
+
+    def _set_fps(self, fps: str) -> str:
+        ret = super()._set_fps(fps)
+        self.tint = min(self.tint, self.max_tint())
+        return ret
+
+    def _set_tint(self, tint: str) -> str:
+        self.tint = min(float(tint), self.max_tint())
+        return 'OK'
+
+    def _get_temps(self) -> str:
+        # motherboard, frontend, powerboard, sensor, peltier, heatsink
+        return (f'32.10, 35.40, 38.20, {self.temp_setpoint:.2f}, '
+                f'{self.temp_setpoint + 5.:.2f}, 25.00')
+
+    def _set_setpoint(self, temp: str) -> str:
+        self.temp_setpoint = float(temp)
+        return 'OK'
+
+    def _set_fan_mode(self, mode: str) -> str:
+        self.fan_mode = mode
+        return 'OK'
+
+    def _set_fan_speed(self, speed: str) -> str:
+        self.fan_speed = int(speed)
+        return 'OK'
+
+
+class OCAM2KEmulator(SerialEmulator):
+    '''
+        OCAM2K: answers formatted as <n>[val0][val1]...
+    '''
+
+    QUIRKS = {
+            'binning_trips_synchro': 'changing the binning disables synchro',
+    }
+
+    MAX_FPS = {False: 2000., True: 3600.}  # Unbinned, binned
+
+    def __init__(self, latency: float = 0.01,
+                 quirks: Op[Set[str]] = None) -> None:
+        super().__init__(latency, quirks)
+
+        self.verbose = True
+        self.binning = False
+        self.synchro = False
+        self.fps = self.MAX_FPS[self.binning]
+        self.gain = 1
+        self.cooling = False
+        self.temp = 20.
+        self.temp_setpoint = -45.
+        self.led = 'on'
+
+        self._register(r'interface (\d)', self._interface)
+        self._register(r'binning (on|off)', self._set_binning)
+        self._register(r'led (on|off)', self._set_led)
+        self._register(r'temp reset', lambda: ['0'])
+        self._register(r'temp (on|off)', self._set_cooling)
+        self._register(r'temp (-?\d+)', self._set_setpoint)
+        self._register(r'temp', self._get_temp)
+        self._register(r'protection reset', lambda: ['0'])
+        self._register(r'gain (\d+)', self._set_gain)
+        self._register(r'gain', lambda: [str(self.gain)])
+        self._register(r'synchro (on|off)', self._set_synchro)
+        self._register(r'fps (\d+)', self._set_fps)
+        self._register(r'fps', lambda: [str(int(self.fps))])
+
+    def _format_reply(self, payload: List[str]) -> str:  # type: ignore
+        return f'\r\n<{len(payload)}>[' + ']['.join(payload) + ']'
+
+    def _format_unknown(self, cmd: str) -> str:
+        logg.warning(f'OCAM2KEmulator: unknown command "{cmd}"')
+        return '\r\n<1>[-1]'
+
+    def _interface(self, val: str) -> List[str]:
+        self.verbose = val != '0'
+        return ['0']
+
+    def _set_binning(self, val: str) -> List[str]:
+        self.binning = val == 'on'
+        self.fps = min(self.fps, self.MAX_FPS[self.binning])
+        if 'binning_trips_synchro' in self.quirks:
+            self.synchro = False
+        return ['0']
+
+    def _set_led(self, val: str) -> List[str]:
+        self.led = val
+        return ['0']
+
+    def _set_cooling(self, val: str) -> List[str]:
+        self.cooling = val == 'on'
+        return ['0']
+
+    def _set_setpoint(self, temp: str) -> List[str]:
+        self.temp_setpoint = float(temp)
+        return ['0']
+
+    def _get_temp(self) -> List[str]:
+        if self.cooling:
+            self.temp = self.temp_setpoint
+        # Expected: [-45.2][23][13][24][0.1][9][12][-450][1][10594]
+        return [
+                f'{self.temp:.1f}', '23', '13', '24', '0.1', '9', '12',
+                str(int(self.temp_setpoint * 10)),
+                str(int(self.cooling)), '10594'
+        ]
+
+    def _set_gain(self, gain: str) -> List[str]:
+        self.gain = max(1, min(600, int(gain)))
+        return [str(self.gain)]
+
+    def _set_synchro(self, val: str) -> List[str]:
+        self.synchro = val == 'on'
+        return ['0']
+
+    def _set_fps(self, fps: str) -> List[str]:
+        fps_val = float(fps)
+        if fps_val == 0:  # 0 sets maxfps
+            fps_val = self.MAX_FPS[self.binning]
+        if self.synchro or fps_val > self.MAX_FPS[self.binning]:
+            return ['-1', str(int(self.fps))]  # Retcode + value
+        self.fps = fps_val
+        self._notify_fps(self.fps)
+        return [str(int(self.fps))]
+
+
+class NUVUEmulator(SerialEmulator):
+    '''
+        NUVU: answers are payload lines, then "OK", then a prompt.
+        Config dictionaries are exposed by "ld <n>", readout modes by "ls".
+
+        The get/set commands that NUVU reads from the config dictionary
+        (GetTempCCDCmd, EMSetRawGainCmd...) are made up for the emulator.
+    '''
+
+    QUIRKS = {
+            'slow_ld': 'loading a readout mode takes LD_TIME',
+    }
+
+    LD_TIME = 1.0
+
+    RO_MODES = ['EM_20MHz_10MHz', 'EM_10MHz_10MHz', 'CONV_1MHz_10MHz']
+
+    N_SEQ_REGISTERS = 15
+
+    def __init__(self, latency: float = 0.01,
+                 quirks: Op[Set[str]] = None) -> None:
+        super().__init__(latency, quirks)
+
+        self.ro_mode = 0
+        self.seq_registers = [0] * self.N_SEQ_REGISTERS
+        self.binning = 1
+        self.exposure = 0.  # ms
+        self.waiting = 0.  # ms
+        self.shutter_mode = 0
+        self.ext_shutter_mode = 0
+        self.ext_shutter_delay = 0.
+        self.ext_shutter = 0
+        self.shutter_polarity = 1
+        self.fire_polarity = 1
+        self.trigger = (0, 1)
+        self.ccd_temp_setpoint = -60.
+        self.em_raw_gain = 0
+        self.em_cal_gain = 1.
+        self.analog_gain = 1
+        self.analog_offset = 0
+        self.acquiring = False
+
+        self._register(r'ld', lambda: [str(self.ro_mode)])
+        self._register(r'ld (\d+)', self._load_mode)
+        self._register(r'ls', self._list_modes)
+        self._register(r'dsv (\d+)', self._dump_seq_registers)
+        self._register(r'ssv (\d+) (\d+)', self._set_seq_register)
+        self._register(r'cdsbinmode (\d+)', self._set_binning)
+        self._register(r'rsrt', lambda: ['0.5'])
+        self._register(r'se', lambda: [f'{self.exposure}'])
+        self._register(r'se ([-+.e\d]+)', self._set_float('exposure'))
+        self._register(r'sw', lambda: [f'{self.waiting}'])
+        self._register(r'sw ([-+.e\d]+)', self._set_float('waiting'))
+        self._register(r'sesm', lambda: [f'{self.ext_shutter_mode}'])
+        self._register(r'sesm (-?\d+)', self._set_int('ext_shutter_mode'))
+        self._register(r'ssd', lambda: [f'{self.ext_shutter_delay}'])
+        self._register(r'ssd ([-+.e\d]+)', self._set_float('ext_shutter_delay'))
+        self._register(r'ssm', lambda: [f'{self.shutter_mode}'])
+        self._register(r'ssm (-?\d+)', self._set_int('shutter_mode'))
+        self._register(r'sesp', lambda: [f'{self.ext_shutter}'])
+        self._register(r'sesp (-?\d+)', self._set_int('ext_shutter'))
+        self._register(r'ssp', lambda: [f'{self.shutter_polarity}'])
+        self._register(r'ssp (-?\d+)', self._set_int('shutter_polarity'))
+        self._register(r'sfp', lambda: [f'{self.fire_polarity}'])
+        self._register(r'sfp (-?\d+)', self._set_int('fire_polarity'))
+        self._register(r'stm', lambda: [f'{self.trigger[0]}'])
+        self._register(r'stm (-?\d+) (\d+)', self._set_trigger)
+        self._register(r'ss', self._get_status)
+        self._register(r'tcg 0', lambda: ['0:25.00'])
+        self._register(r'tcg 1', lambda: [f'1:{self.ccd_temp_setpoint:.2f}'])
+        self._register(r'tsg 1', lambda: [f'1:{self.ccd_temp_setpoint:.2f}'])
+        self._register(r'tss 1 ([-+.\d]+)', self._set_ccd_temp)
+        self._register(r'dgg 4', self._get_em_raw_gain)
+        self._register(r'dgs 4 (\d+)', self._set_em_raw_gain)
+        self._register(r'cdsgain', lambda: [f'Gain 1:{self.analog_gain}'])
+        self._register(r'cdsgain 1 (\d+)', self._set_analog_gain)
+        self._register(r'cdsoffset',
+                       lambda: [f'CDS offset:{self.analog_offset}'])
+        self._register(r'cdsoffset (-?\d+)', self._set_analog_offset)
+        self._register(r'seg', self._get_em_cal_gain)
+        self._register(r'seg ([-+.e\d]+)', self._set_em_cal_gain)
+        self._register(r're (-?\d+)', self._start_acquisition)
+        self._register(r'abort', self._abort)
+
+    def _format_reply(self, payload: List[str]) -> str:  # type: ignore
+        return '\r\n'.join(payload + ['OK', '>'])
+
+    def _format_unknown(self, cmd: str) -> str:
+        logg.warning(f'NUVUEmulator: unknown command "{cmd}"')
+        return '\r\n'.join(['Unknown command', 'ERROR', '>'])
+
+    def _config_dict(self) -> Dict[str, str]:
+        return {
+                'CCDPartNumber': 'CCD220 (emulated)',
+                'ReadoutMode': self.RO_MODES[self.ro_mode],
+                'GetTempCtrlCmd': 'tcg 0',
+                'GetTempCCDCmd': 'tcg 1',
+                'GetSetTempCCDCmd': 'tsg 1',
+                'SetTempCCDCmd': 'tss 1 %.1f',
+                'TempCCDRange': '-100,20',
+                'EMGetRawGainCmd': 'dgg 4',
+                'EMSetRawGainCmd': 'dgs 4 %d',
+                'EMRawGainRange': '0,4095',
+                'AnalogicGetGainCmd': 'cdsgain',
+                'AnalogicSetGainCmd': 'cdsgain 1 %d',
+                'AnalogicGainRange': '1,2',
+                'AnalogicGetOffsetCmd': 'cdsoffset',
+                'AnalogicSetOffsetCmd': 'cdsoffset %d',
+                'AnalogicOffsetRange': '-4000,4000',
+                'EmGainCalibrationTemperatureRange': '-85,-40',
+        }
+
+    def _load_mode(self, mode: str) -> List[str]:
+        if int(mode) >= len(self.RO_MODES):
+            return ['Invalid readout mode']
+        if 'slow_ld' in self.quirks:
+            time.sleep(self.LD_TIME)
+        self.ro_mode = int(mode)
+        return [f'{k}:{v}' for k, v in self._config_dict().items()]
+
+    def _list_modes(self) -> List[str]:
+        return [
+                f'{ii}:{mode} (emulated)'
+                for ii, mode in enumerate(self.RO_MODES)
+        ]
+
+    def _dump_seq_registers(self, n: str) -> List[str]:
+        return [f'{ii}:{self.seq_registers[ii]}' for ii in range(int(n))]
+
+    def _set_seq_register(self, idx: str, val: str) -> List[str]:
+        self.seq_registers[int(idx)] = int(val)
+        return [f'{idx}:{val}']
+
+    def _set_binning(self, binning: str) -> List[str]:
+        self.binning = int(binning)
+        return [f'CDS binning mode:{self.binning}']
+
+    def _set_float(self, attr: str) -> HandlerType:
+
+        def setter(val: str) -> List[str]:
+            setattr(self, attr, float(val))
+            return [f'{getattr(self, attr)}']
+
+        return setter
+
+    def _set_int(self, attr: str) -> HandlerType:
+
+        def setter(val: str) -> List[str]:
+            setattr(self, attr, int(val))
+            return [f'Value:{getattr(self, attr)}']
+
+        return setter
+
+    def _set_trigger(self, mode: str, nimages: str) -> List[str]:
+        self.trigger = (int(mode), int(nimages))
+        return [f'Trigger mode:{mode}']
+
+    def _get_status(self) -> List[str]:
+        temps = [self.ccd_temp_setpoint, 25., 30., 40., 20.]
+        return ['T:' + ','.join(f'{t:.2f}' for t in temps)]
+
+    def _set_ccd_temp(self, temp: str) -> List[str]:
+        self.ccd_temp_setpoint = float(temp)
+        return [f'1:{self.ccd_temp_setpoint:.2f}']
+
+    def _get_em_raw_gain(self) -> List[str]:
+        return [f'4:{self.em_raw_gain} raw EM gain']
+
+    def _set_em_raw_gain(self, gain: str) -> List[str]:
+        self.em_raw_gain = int(gain)
+        return self._get_em_raw_gain()
+
+    def _set_analog_gain(self, gain: str) -> List[str]:
+        self.analog_gain = int(gain)
+        return [f'Gain 1:{self.analog_gain}']
+
+    def _set_analog_offset(self, offset: str) -> List[str]:
+        self.analog_offset = int(offset)
+        return [f'CDS offset:{self.analog_offset}']
+
+    def _get_em_cal_gain(self) -> List[str]:
+        return [f'emgain:{self.em_cal_gain:.2f},1.00,5000.00']
+
+    def _set_em_cal_gain(self, gain: str) -> List[str]:
+        self.em_cal_gain = max(1., min(5000., float(gain)))
+        return self._get_em_cal_gain()
+
+    def _start_acquisition(self, n: str) -> List[str]:
+        self.acquiring = True
+        if self.exposure + self.waiting > 0.:
+            self._notify_fps(1e3 / (self.exposure + self.waiting))
+        return ['Acquisition started']
+
+    def _abort(self) -> List[str]:
+        self.acquiring = False
+        return ['Acquisition aborted']
+
+
+EMULATORS: Dict[str, type] = {
+        'cred1': CRED1Emulator,
+        'cred2': CRED2Emulator,
+        'ocam2k': OCAM2KEmulator,
+        'nuvu': NUVUEmulator,
+}
+
+
+def emulator_from_env(cam_name: str, model: Op[str]) -> Op[SerialEmulator]:
+    '''
+        Returns an emulator if the environment requests one and
+        the camera model has one, None otherwise.
+    '''
+    if not os.environ.get(ENV_EMULATE):
+        return None
+
+    if model is None or model not in EMULATORS:
+        logg.error(f'{cam_name}: no serial emulator for model {model}')
+        return None
+
+    latency = float(os.environ.get(ENV_EMULATE_LATENCY, '0.01'))
+    quirks = {
+            q.strip()
+            for q in os.environ.get(ENV_EMULATE_QUIRKS, '').split(',')
+            if q.strip()
+    }
+    logg.warning(f'{cam_name}: serial emulation {model} '
+                 f'(latency {latency} s, quirks {quirks})')
+
+    return EMULATORS[model](latency=latency, quirks=quirks)
@@ -0,0 +1,162 @@
+'''
+    Serial protocol record / replay, for offline benchmarking
+
+    RecordingSerial wraps an EdtInterfaceSerial and logs every send_command
+    exchange (command, response, timeout, start time, duration) to a JSON-lines
+    file - gzipped if the file name ends in .gz.
+
+    ReplaySerial serves the responses from such a file, with the recorded
+    latencies scaled by an arbitrary factor (0 for instantaneous answers).
+
+    Both are picked up by EDTCamera.init_framegrab_backend from the environment:
+        CAMSTACK_SERIAL_RECORD=<dir>         record into <dir>/<camname>_serial.jsonl.gz
+        CAMSTACK_SERIAL_REPLAY=<file>        replay from <file> - no EDT hardware needed
+        CAMSTACK_SERIAL_REPLAY_SCALE=<float> latency scaling factor [default: 1.0]
+'''
+from typing import Any, Deque, Dict, IO, List, Optional as Op, Tuple
+
+import os
+import gzip
+import json
+import time
+import threading
+import collections
+import logging as logg
+
+ENV_RECORD = 'CAMSTACK_SERIAL_RECORD'
+ENV_REPLAY = 'CAMSTACK_SERIAL_REPLAY'
+ENV_REPLAY_SCALE = 'CAMSTACK_SERIAL_REPLAY_SCALE'
+
+
+def _open_text(path: str, mode: str) -> IO[str]:
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't')  # type: ignore
+    return open(path, mode)
+
+
+class RecordingSerial:
+    '''
+        Transparent wrapper around an EdtInterfaceSerial.
+        Anything other than send_command is forwarded untouched.
+    '''
+
+    def __init__(self, serial_iface: Any, record_file: str) -> None:
+        self.serial_iface = serial_iface
+        self.record_file = record_file
+
+        self._lock = threading.Lock()
+        self._t_origin = time.monotonic()
+        self._file = _open_text(record_file, 'a')
+
+    def send_command(self, cmd: str, base_timeout: float = 100.) -> str:
+        t_start = time.monotonic()
+        res = self.serial_iface.send_command(cmd, base_timeout=base_timeout)
+        t_end = time.monotonic()
+
+        line = json.dumps(
+                {
+                        't': round(t_start - self._t_origin, 6),
+                        'dt': round(t_end - t_start, 6),
+                        'to': base_timeout,
+                        'cmd': cmd,
+                        'res': res,
+                }, separators=(',', ':'))
+        with self._lock:
+            self._file.write(line + '\n')
+            self._file.flush()
+
+        return res
+
+    def close(self) -> None:
+        with self._lock:
+            self._file.close()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.serial_iface, name)
+
+
+def load_recording(record_file: str) -> List[Dict[str, Any]]:
+    with _open_text(record_file, 'r') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+class ReplaySerial:
+    '''
+        Stub with the EdtInterfaceSerial send_command signature.
+
+        Responses are served per command, in the order they were recorded.
+        When the recorded answers to a command are exhausted, the last one
+        is repeated. Unknown commands get an empty answer (that's what a
+        serial timeout looks like) - or raise if strict.
+    '''
+
+    def __init__(self, record_file: str, latency_scale: float = 1.0,
+                 strict: bool = False) -> None:
+
+        self.record_file = record_file
+        self.latency_scale = latency_scale
+        self.strict = strict
+
+        self._lock = threading.Lock()
+        self._answers: Dict[str, Deque[Tuple[str, float]]] = \
+                collections.defaultdict(collections.deque)
+        for entry in load_recording(record_file):
+            self._answers[entry['cmd']].append((entry['res'], entry['dt']))
+
+        self.n_served = 0
+        self.n_unknown = 0
+
+    def send_command(self, cmd: str, base_timeout: float = 100.) -> str:
+        with self._lock:
+            queue = self._answers.get(cmd)
+            if not queue:
+                self.n_unknown += 1
+                logg.warning(f'ReplaySerial: no recorded answer for "{cmd}"')
+                if self.strict:
+                    raise KeyError(f'ReplaySerial: unrecorded command "{cmd}"')
+                # Mimic a timeout, but don't actually wait for it.
+                return ''
+
+            if len(queue) > 1:
+                res, dt = queue.popleft()
+            else:
+                res, dt = queue[0]
+            self.n_served += 1
+
+        if self.latency_scale > 0.:
+            time.sleep(dt * self.latency_scale)
+
+        return res
+
+    def close(self) -> None:
+        pass
+
+
+def offline_serial_from_env(cam_name: str) -> Op[Any]:
+    '''
+        Returns a hardware-free serial stand-in if the environment requests
+        one, None otherwise (i.e. open the actual EDT serial).
+    '''
+    replay_file = os.environ.get(ENV_REPLAY)
+    if replay_file:
+        scale = float(os.environ.get(ENV_REPLAY_SCALE, '1.0'))
+        logg.warning(f'{cam_name}: serial replay from {replay_file} '
+                     f'(latency x{scale})')
+        return ReplaySerial(replay_file, latency_scale=scale)
+
+    return None
+
+
+def wrap_recording_from_env(cam_name: str, serial_iface: Any) -> Any:
+    '''
+        Wrap the serial into a RecordingSerial if the environment requests it.
+    '''
+    record_dir = os.environ.get(ENV_RECORD)
+    if not record_dir:
+        return serial_iface
+
+    os.makedirs(record_dir, exist_ok=True)
+    record_file = f'{record_dir}/{cam_name}_serial.jsonl.gz'
+    logg.warning(f'{cam_name}: recording serial exchanges in {record_file}')
+
+    return RecordingSerial(serial_iface, record_file)
@@ -0,0 +1,149 @@
+'''
+    In-place and ring buffer (cube) output for the python frame takers
+
+    SHMFrameWriter: the producer writes (copies, unpacks...) the frame
+    directly into the data buffer of the stream SHM, then the write is
+    posted - the same sequence as set_data, without the intermediate array
+    and its copy:
+
+        with writer.frame(t_us) as dest:
+            unpacker(raw, out=dest)
+
+    SHMRingWriter: the stream SHM is a (depth, rows, cols) cube; frames are
+    written in turn into its slices, so that a consumer that falls behind by
+    less than depth frames loses nothing.
+
+    Published with every frame:
+        - md.cnt1 of the stream: index of the last slice written (milk
+          circular buffer convention, 0 for a single frame), md.cnt0: total
+          frame count.
+    Ring mode only:
+        - <stream>_ring SHM, (depth, 5) int64: for each slice, the frame
+          counter (1-based), then the timestamp (us, CLOCK_REALTIME),
+          monotonic timestamp (us), camera frame ID and camera timestamp
+          (us) of the frame it holds (-1: n/a) - see META_COLUMNS.
+          A consumer reads slices whose counter is above the last it has
+          processed, in counter order; a gap means frames were lost.
+        - _RINGDEP keyword: ring depth.
+
+    Takers get the ring mode with -z <depth> (see
+    BaseCamera._ring_cmdline_option).
+'''
+from typing import Iterator, Optional as Op, Tuple
+
+import contextlib
+import logging as logg
+
+import numpy as np
+
+from pyMilk.interfacing.shm import SHM
+from pyMilk.interfacing.shm_functions import creashmim
+
+# Of the <stream>_ring SHM. The last four: frame_pipeline.FrameInfo
+META_COLUMNS = ('count', 't_us', 't_mono_us', 'frame_id', 'hw_time_us')
+
+
+class SHMFrameWriter:
+    '''
+        In-place writes into a single frame stream SHM.
+    '''
+
+    def __init__(self, shm: SHM, frame_shape: Tuple[int, ...], dtype: type,
+                 depth: int = 1) -> None:
+
+        self.shm = shm
+        self.depth = depth
+        self.index = -1  # Last slice written
+        self.count = 0  # Frames written
+
+        # If the bindings at hand don't allow in-place writes, we keep a
+        # local buffer and publish it whole with set_data. For a ring, that
+        # copies depth frames into the SHM for every frame, i.e. depth times
+        # the memory bandwidth of a plain stream - and a consumer woken up
+        # mid-copy may see any slice torn, not just the newest.
+        self._inplace = True
+        self._buf_shape = (depth, *frame_shape)
+        self._dtype = dtype
+        self._local: Op[np.ndarray] = None  # Fallback only
+
+    @contextlib.contextmanager
+    def frame(self, t_us: int, t_mono_us: int = -1, frame_id: int = -1,
+              hw_time_us: int = -1) -> Iterator[np.ndarray]:
+        '''
+            Yields the buffer of the next frame, to be filled in the block.
+            Posted upon exit of the block - not if it raises.
+            The times and IDs only go into the ring meta.
+        '''
+        index = (self.index + 1) % self.depth
+
+        image = None
+        if self._inplace:
+            try:
+                image = self.shm.IMAGE
+                view = np.asarray(image).reshape(self._buf_shape)
+                if view.dtype != self._dtype:
+                    raise TypeError(f'SHM dtype {view.dtype}')
+            except (AttributeError, TypeError, ValueError) as exc:
+                logg.warning(f'SHMFrameWriter: no in-place writes ({exc}) - '
+                             'publishing with set_data.')
+                self._inplace = False
+                local = np.array(self.shm.get_data(reform=True),
+                                 dtype=self._dtype)
+                self._local = local.reshape(self._buf_shape)
+
+        if self._inplace:
+            image.md.write = 1
+            try:
+                yield view[index]
+                image.md.cnt1 = index
+                image.md.cnt0 += 1
+            finally:
+                image.md.write = 0
+            image.sempost(-1)  # All semaphores
+        else:
+            assert self._local is not None
+            yield self._local[index]
+            self.shm.set_data(self._local[0] if self.depth ==
+                              1 else self._local)
+
+        self.index = index
+        self.count += 1
+        self._posted((t_us, t_mono_us, frame_id, hw_time_us))
+
+    def _posted(self, stamps: Tuple[int, int, int, int]) -> None:
+        pass
+
+    def write(self, frame: np.ndarray, t_us: int) -> int:
+        '''
+            Copies frame. Returns the index of the slice written.
+        '''
+        with self.frame(t_us) as dest:
+            np.copyto(dest, frame, casting='unsafe')
+        return self.index
+
+
+class SHMRingWriter(SHMFrameWriter):
+
+    def __init__(self, stream_name: str, frame_shape: Tuple[int, ...],
+                 dtype: type, depth: int, attempt_reuse: bool = False,
+                 nb_kw: int = 50) -> None:
+
+        if depth < 2:
+            raise ValueError(f'Ring depth must be >= 2 (got {depth})')
+
+        shm = creashmim(stream_name, (depth, *frame_shape), dtype, nb_kw=nb_kw,
+                        attempt_reuse=attempt_reuse)
+        shm.update_keyword('_RINGDEP', depth)
+
+        super().__init__(shm, frame_shape, dtype, depth=depth)
+
+        meta_shape = (depth, len(META_COLUMNS))
+        self.meta = np.zeros(meta_shape, dtype=np.int64)
+        self.meta_shm = creashmim(stream_name + '_ring', meta_shape, np.int64,
+                                  nb_kw=0, attempt_reuse=attempt_reuse)
+        self.meta_shm.set_data(self.meta)
+
+    def _posted(self, stamps: Tuple[int, int, int, int]) -> None:
+        # After the slice: a consumer that sees the counter finds the frame.
+        self.meta[self.index] = (self.count, *stamps)
+        self.meta_shm.set_data(self.meta)
@@ -1,8 +1,12 @@
-from typing import List
+from typing import Iterator, List, Optional as Op, Sequence, Tuple, Union
 
 import enum
+import time
+import threading
+import contextlib
 from dataclasses import dataclass
 
+import numpy as np
 import pygame.constants as pgm_ct
 
 
@@ -26,3 +30,196 @@ class Shortcut:
     def __hash__(self) -> int:
         # I want to be able to dictionary them :D
         return (self.key, self.modifier_mask).__hash__()
+
+
+def make_cmap_lut(cmap, n_entries: int) -> np.ndarray:
+    '''
+    (n_entries, 4) uint8 RGBX lookup table of a matplotlib colormap
+    (X is the alpha, unused). 4 bytes per entry: one uint32 per pixel.
+    Entry k is the color of [k / n, (k + 1) / n[, sampled at its center.
+    '''
+    samples = (np.arange(n_entries) + 0.5) / n_entries
+    return np.ascontiguousarray(cmap(samples, bytes=True))
+
+
+def _subsample(data: np.ndarray, max_samples: Op[int]) -> np.ndarray:
+    '''
+    Regular strided view of data, of max_samples pixels or less.
+    '''
+    if max_samples is None or data.size <= max_samples:
+        return data
+    step = int(np.ceil((data.size / max_samples)**(1 / data.ndim)))
+    return data[(np.s_[::step], ) * data.ndim]
+
+
+def _hist_percentile(data: np.ndarray, q: np.ndarray) -> np.ndarray:
+    '''
+    np.percentile (linear interpolation) of unsigned integer data,
+    from its bincount histogram. Exact.
+    '''
+    cdf = np.cumsum(np.bincount(data.ravel()))
+    n = cdf[-1]
+    rank = q / 100. * (n - 1)
+    lo = np.floor(rank)
+    # Value of 0-based rank r: first value whose cdf is above r.
+    v_lo = np.searchsorted(cdf, lo, side='right')
+    v_hi = np.searchsorted(cdf, np.minimum(lo + 1, n - 1), side='right')
+    return v_lo + (v_hi - v_lo) * (rank - lo)
+
+
+def fast_percentile(data: np.ndarray, q: Union[float, Sequence[float]],
+                    max_samples: Op[int] = 1 << 18) -> Union[float, np.ndarray]:
+    '''
+    Percentile(s) q (in %) for autoscaling, without sorting the full frame.
+    Frames above max_samples pixels are subsampled (None: all pixels).
+    Unsigned 8/16 bit data: from a bincount histogram - so many q cost the
+    same as one. Otherwise: np.percentile of the sample.
+    '''
+    sample = _subsample(data, max_samples)
+    q_arr = np.asarray(q, dtype=np.float64)
+
+    if sample.dtype.kind == 'u' and sample.dtype.itemsize <= 2:
+        ret = _hist_percentile(sample, q_arr)
+    else:
+        ret = np.percentile(sample, q_arr)
+
+    if q_arr.ndim == 0:
+        return float(ret)
+    return ret
+
+
+class PercentileTracker:
+    '''
+    fast_percentile of a stream of frames, exponentially smoothed over
+    frames: subsampling noise and frame-to-frame jitter don't make the
+    display flicker.
+    smoothing: weight of the past, 0 for none.
+    Call reset() when the data changes in nature (crop, subtraction...).
+    '''
+
+    def __init__(self, q: float, smoothing: float = 0.8,
+                 max_samples: Op[int] = 1 << 18) -> None:
+        self.q = q
+        self.smoothing = smoothing
+        self.max_samples = max_samples
+        self.value: Op[float] = None
+
+    def reset(self) -> None:
+        self.value = None
+
+    def update(self, data: np.ndarray) -> float:
+        new = fast_percentile(data, self.q, self.max_samples)
+        if self.value is None:
+            self.value = new
+        else:
+            self.value = self.smoothing * self.value + (1 - self.smoothing) * new
+        if data.dtype.kind in 'iu':
+            # Integer data: steady clip values, so that the display tables
+            # aren't rebuilt upon insignificant changes.
+            return float(round(self.value))
+        return self.value
+
+
+@dataclass
+class FrameStats:
+    '''
+    Pixel statistics of a frame, see frame_stats
+    '''
+    min: float = 0.
+    max: float = 0.
+    mean: float = 0.
+    sum: float = 0.
+    n_pix: int = 0
+    hist: Op[np.ndarray] = None  # Count per value - unsigned 8/16 bit only
+    timestamp: float = 0.  # time.time() of the computation
+
+
+STATS_CHUNK_BYTES = 1 << 19  # Rows per chunk: stays in L2 between reductions
+
+
+def frame_stats(data: np.ndarray, with_hist: bool = False) -> FrameStats:
+    '''
+    min, max, sum and mean (and the histogram, if asked and the data is
+    unsigned 8/16 bit) of a 2D frame, in a single pass over chunks of rows:
+    each chunk is read from memory once for all the reductions.
+    '''
+    stats = FrameStats(n_pix=data.size, timestamp=time.time())
+    if data.size == 0:
+        return stats
+
+    acc_type = np.int64 if data.dtype.kind in 'iub' else np.float64
+    if with_hist and data.dtype.kind == 'u' and data.dtype.itemsize <= 2:
+        stats.hist = np.zeros(1 << (8 * data.dtype.itemsize), dtype=np.int64)
+
+    rows = max(1, STATS_CHUNK_BYTES // max(1, data[0].nbytes))
+    mins, maxs = [], []
+    total = acc_type(0)
+    for r in range(0, data.shape[0], rows):
+        chunk = data[r:r + rows]
+        mins += [chunk.min()]
+        maxs += [chunk.max()]
+        total += chunk.sum(dtype=acc_type)
+        if stats.hist is not None:
+            stats.hist += np.bincount(chunk.ravel(), minlength=len(stats.hist))
+
+    stats.min, stats.max = min(mins), max(maxs)
+    stats.sum = total
+    stats.mean = total / data.size
+    return stats
+
+
+class LatestFrameBuffer:
+    '''
+    Double buffer with latest-frame semantics, between the processing
+    (producer) and the display (consumer) - possibly two threads.
+
+    The producer fills back(), then publish() swaps it to the front. A frame
+    published before the consumer read the previous one replaces it: the
+    previous one is counted as skipped. The consumer reads the front within
+    latest(), which holds off the swaps meanwhile.
+    '''
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._front: Op[np.ndarray] = None
+        self._back: Op[np.ndarray] = None
+        self._fresh = False  # Front published and not read yet
+
+        self.n_published = 0
+        self.n_read = 0
+        self.n_skipped = 0
+
+    def back(self, shape: Tuple[int, ...],
+             dtype: type = np.uint8) -> np.ndarray:
+        '''
+        Producer only. Reallocated upon shape changes only.
+        '''
+        if (self._back is None or self._back.shape != shape or
+                    self._back.dtype != dtype):
+            self._back = np.zeros(shape, dtype=dtype)
+        return self._back
+
+    def publish(self) -> np.ndarray:
+        '''
+        Producer only. Returns the new front - the back just filled.
+        '''
+        with self._lock:
+            if self._fresh:
+                self.n_skipped += 1
+            self._front, self._back = self._back, self._front
+            self._fresh = True
+            self.n_published += 1
+            return self._front
+
+    @contextlib.contextmanager
+    def latest(self) -> Iterator[Op[np.ndarray]]:
+        '''
+        Consumer: the front if published since the last call, else None.
+        Not to be kept past the with block.
+        '''
+        with self._lock:
+            front = self._front if self._fresh else None
+            if front is not None:
+                self._fresh = False
+                self.n_read += 1
+            yield front
@@ -8,6 +8,9 @@ if TYPE_CHECKING:  # this type hint would cause a circular import
     from .plugin_arch import BasePlugin
 
 import os
+import time
+import threading
+import logging as logg
 
 _CORES = os.sched_getaffinity(0)  # AMD fix
 import pygame.constants as pgmc
@@ -38,6 +41,10 @@ class GenericViewerBackend:
     COLORMAPS_B = [cm.gray, cm.seismic, cm.Spectral]
 
     COLORMAPS = COLORMAPS_A
+    CMAP_LUT_SIZE = 4096  # Entries of the RGB lookup tables of the colormaps
+    AUTOCLIP_PERCENTILE = 0.8  # Low clip of the nonlinear modes, %
+    STATS_PERIOD = 0.5  # sec., refresh of the full frame stats when cropped
+    FRAME_WAIT_TIMEOUT = 0.1  # sec., processing thread: reprocess if no new frame
 
     CROP_CENTER_SPOT: Op[Tuple[float, float]] = None
     MAX_ZOOM_LEVEL = 4  # Power of 2, 4 is 16x, 3 is 8x
@@ -59,15 +66,27 @@ class GenericViewerBackend:
         self.data_debias: Op[np.ndarray] = None  # Cropped
         self.data_zmapped: Op[np.ndarray] = None  # Apply Z scaling
         self.data_rgbimg: Op[np.ndarray] = None  # Apply colormap / convert to RGB
+        self.data_rgbximg: Op[np.ndarray] = None  # Same, RGBX contiguous - data_rgbimg is a view
         self.data_output: Op[np.ndarray] = None  # Interpolate to frontend display size
+        # Processed frames, for the display: data_rgbximg is its back until published
+        self.output_buffer = buts.LatestFrameBuffer()
+
+        # Persistent buffers of the stages above, see _buffer
+        self._buffers: Dict[str, np.ndarray] = {}
 
         self.data_for_sub_dark: Op[np.ndarray] = None
         self.data_for_sub_ref: Op[np.ndarray] = None
+
+        ### Stats - for plugins and labels alike
+        self.frame_stats = buts.FrameStats()  # Raw uncropped, every STATS_PERIOD
+        self.crop_stats = buts.FrameStats()  # Debiased crop, every frame
         #yapf: enable
 
         ### Clipping for pipeline
         self.low_clip: Op[float] = None
         self.high_clip: Op[float] = None
+        # Per-frame autoclip of the nonlinear modes
+        self.low_clip_tracker = buts.PercentileTracker(self.AUTOCLIP_PERCENTILE)
 
         ### Various flags
         self.flag_subref_on: bool = False
@@ -77,6 +96,17 @@ class GenericViewerBackend:
         self.flag_non_linear: int = 0
 
         ### COLORING
+        # Compiled once - coloring is then a lookup.
+        self.cmap_luts = [
+                buts.make_cmap_lut(cmap, self.CMAP_LUT_SIZE)
+                for cmap in self.COLORMAPS
+        ]
+        self._lut_index: Op[np.ndarray] = None  # LUT index buffer
+        # data_rgbximg, a uint32 per pixel
+        self._rgbx_u32: Op[np.ndarray] = None
+        # uint16 frames: raw value -> RGBX, and its (m, M, scaling, cmap) key
+        self._int_lut: Op[np.ndarray] = None
+        self._int_lut_key: Op[Tuple] = None
         self.cmap_id = 1
         self.toggle_cmap(self.cmap_id)  # Select startup CM
 
@@ -116,6 +146,14 @@ class GenericViewerBackend:
 
         self.SHORTCUTS.update(this_shortcuts)
 
+        ### Processing thread - see start_processing_thread
+        # Held by the pipeline and the shortcuts: settings change between frames.
+        self.pipeline_lock = threading.Lock()
+        self.processing_thread: Op[threading.Thread] = None
+        self.processing_error: Op[BaseException] = None
+        self._stop_processing = threading.Event()
+        self.n_processed = 0
+
     def register_frontend(self, frontend: GenericViewerFrontend) -> None:
 
         self.frontend_obj = frontend
@@ -149,6 +187,8 @@ class GenericViewerBackend:
         else:
             self.cmap_id = which
         self.cmap = self.COLORMAPS[self.cmap_id]
+        self.cmap_lut = self.cmap_luts[self.cmap_id]
+        self._cmap_lut_u32 = self.cmap_lut.view(np.uint32).ravel()
 
     def toggle_sub_dark(self, state: Op[bool] = None):
         if state is None:
@@ -158,6 +198,7 @@ class GenericViewerBackend:
             self.flag_subref_on = False
         if not state:
             self.flag_subdark_on = False
+        self.low_clip_tracker.reset()
 
     def toggle_sub_ref(self, state: Op[bool] = None):
         if state is None:
@@ -167,12 +208,14 @@ class GenericViewerBackend:
             self.flag_subdark_on = False
         if not state:
             self.flag_subref_on = False
+        self.low_clip_tracker.reset()
 
     def toggle_scaling(self, value: Op[int] = None) -> None:
         if value is None:
             self.flag_non_linear = (self.flag_non_linear + 1) % 3
         else:
             self.flag_non_linear = value
+        self.low_clip_tracker.reset()
 
     def toggle_crop(self, which: Op[int] = None) -> None:
         if which is None:
@@ -199,6 +242,7 @@ class GenericViewerBackend:
                               halfside[1])):int(round(cc_temp + halfside[1]))]
         else:
             self.crop_slice = np.s_[:, :]
+        self.low_clip_tracker.reset()
 
     def steer_crop(self, direction: int) -> None:
         assert self.CROP_CENTER_SPOT
@@ -230,35 +274,109 @@ class GenericViewerBackend:
     def toggle_averaging(self) -> None:
         self.flag_averaging = not self.flag_averaging
         self.count_averaging = 0
+        self.low_clip_tracker.reset()
 
     def set_clipping_values(self, low: float, high: float) -> None:
         self.low_clip = low
         self.high_clip = high
 
+    def start_processing_thread(self) -> None:
+        '''
+        Acquisition and processing in the background: every new SHM frame is
+        run through data_iter and published to self.output_buffer, for the
+        frontend to pick up the latest at its own pace.
+        '''
+        self._stop_processing.clear()
+        self.processing_thread = threading.Thread(target=self._processing_loop,
+                                                  daemon=True)
+        self.processing_thread.start()
+
+    def stop_processing_thread(self) -> None:
+        self._stop_processing.set()
+        if self.processing_thread is not None:
+            self.processing_thread.join()
+            self.processing_thread = None
+
+    def _processing_loop(self) -> None:
+        while not self._stop_processing.is_set():
+            try:
+                # Wait on the SHM semaphore. Flushes stale posts: latest frame.
+                self.input_shm.get_data(check=True,
+                                        timeout=self.FRAME_WAIT_TIMEOUT,
+                                        copy=False)
+            except Exception:  # Timeout
+                # No new frame: reprocess anyway, so that settings apply.
+                pass
+
+            try:
+                with self.pipeline_lock:
+                    self.data_iter()
+            except Exception as exc:
+                logg.error(f'Viewer processing thread: {exc}')
+                self.processing_error = exc
+                return
+
     def data_iter(self) -> None:
         self._data_grab()
         self._data_referencing()
         self._data_crop()
-        self._data_zscaling()
-        self._data_coloring()
+        assert self.data_debias is not None
+        if self.data_debias.dtype == np.uint16:
+            self._data_int_coloring()
+        else:
+            self._data_zscaling()
+            self._data_coloring()
 
         self._inloop_plugin_action()
 
+        # Swap to the display side - the views follow.
+        self.data_rgbximg = self.output_buffer.publish()
+        self.data_rgbimg = self.data_rgbximg[:, :, :3]
+        self.n_processed += 1
+
         self.flag_data_init = True  # Data is now initialized!
 
+    def _buffer(self, name: str, shape: Tuple[int, ...],
+                dtype: type = np.float32) -> np.ndarray:
+        '''
+        Persistent buffer of a pipeline stage, for in-place (out=) operations.
+        Only reallocated when its shape (SHM shape, crop) or dtype changes.
+        '''
+        buf = self._buffers.get(name)
+        if buf is None or buf.shape != shape or buf.dtype != dtype:
+            buf = self._buffers[name] = np.empty(shape, dtype=dtype)
+        return buf
+
     def _data_grab(self) -> None:
         '''
         SHM -> self.data_raw_uncrop
         '''
-        if self.flag_averaging and self.flag_data_init:
-            assert self.data_raw_uncrop is not None  # from self.flag_data_init
+        # No copy: we copy (and cast) into our own buffer right away.
+        data = self.input_shm.get_data(copy=False)
+
+        if data.dtype == np.uint16 and not (self.flag_averaging or
+                                            self.flag_subref_on or
+                                            self.flag_subdark_on):
+            # Stays uint16: see _data_int_coloring
+            raw = self._buffer('raw_int', data.shape, np.uint16)
+        else:
+            raw = self._buffer('raw_float', data.shape, np.float32)
 
+        if (self.flag_averaging and self.flag_data_init and
+                    self.count_averaging > 0 and raw is self.data_raw_uncrop):
             nn = self.count_averaging
-            self.data_raw_uncrop = self.data_raw_uncrop * (
-                    nn / (nn + 1)) + self.input_shm.get_data() / (nn + 1)
-            self.count_averaging += 1
+            frame = self._buffer('averaging', data.shape, np.float32)
+            np.copyto(frame, data, casting='unsafe')
+            frame *= 1 / (nn + 1)
+            raw *= nn / (nn + 1)
+            raw += frame
         else:
-            self.data_raw_uncrop = self.input_shm.get_data().astype(np.float32)
+            np.copyto(raw, data, casting='unsafe')
+
+        if self.flag_averaging:
+            self.count_averaging += 1
+
+        self.data_raw_uncrop = raw
 
     def _data_referencing(self) -> None:
         '''
@@ -269,11 +387,16 @@ class GenericViewerBackend:
         assert self.data_raw_uncrop is not None
 
         if self.flag_subref_on:
-            self.data_debias_uncrop = self.data_raw_uncrop - self.data_for_sub_ref
+            sub = self.data_for_sub_ref
         elif self.flag_subdark_on:
-            self.data_debias_uncrop = self.data_raw_uncrop - self.data_for_sub_dark
+            sub = self.data_for_sub_dark
         else:
             self.data_debias_uncrop = self.data_raw_uncrop
+            return
+
+        debias = self._buffer('debias', self.data_raw_uncrop.shape, np.float32)
+        np.subtract(self.data_raw_uncrop, sub, out=debias)
+        self.data_debias_uncrop = debias
 
     def _data_crop(self) -> None:
         '''
@@ -285,20 +408,79 @@ class GenericViewerBackend:
         assert self.data_raw_uncrop is not None
         assert self.data_debias_uncrop is not None
 
-        self.data_min = self.data_raw_uncrop[1:, 1:].min()
-        self.data_max = self.data_raw_uncrop[1:, 1:].max()
-        self.data_mean = np.mean(self.data_raw_uncrop[1:])
-
         self.data_debias = self.data_debias_uncrop[self.crop_slice]
 
+        # Every frame: needed by the z-scaling.
+        self.crop_stats = buts.frame_stats(self.data_debias[1:, 1:])
+
+        if (self.crop_lvl_id == 0 and
+                    self.data_debias_uncrop is self.data_raw_uncrop):
+            # Same pixels, nothing more to compute.
+            self.frame_stats = self.crop_stats
+        elif (not self.flag_data_init or
+              time.time() - self.frame_stats.timestamp > self.STATS_PERIOD):
+            self.frame_stats = buts.frame_stats(self.data_raw_uncrop[1:, 1:])
+
+    # Former per-frame attributes, kept for plugins and scripts.
+    # Raw uncropped frame: refreshed every STATS_PERIOD.
+    @property
+    def data_min(self) -> float:
+        return self.frame_stats.min
+
+    @property
+    def data_max(self) -> float:
+        return self.frame_stats.max
+
+    @property
+    def data_mean(self) -> float:
+        return self.frame_stats.mean
+
+    # Debiased crop: every frame.
+    @property
+    def data_plot_min(self) -> float:
+        return self.crop_stats.min
+
+    @property
+    def data_plot_max(self) -> float:
+        return self.crop_stats.max
+
     def _data_zscaling(self) -> None:
         '''
         self.data_debias -> self.data_zmapped
         '''
         assert self.data_debias is not None
 
-        self.data_plot_min = self.data_debias[1:, 1:].min()
-        self.data_plot_max = self.data_debias[1:, 1:].max()
+        m, M, clipped = self._zscale_bounds()
+
+        data = self._buffer('zmapped', self.data_debias.shape, np.float32)
+        if clipped:
+            np.clip(self.data_debias, m, M, out=data)
+        else:
+            np.copyto(data, self.data_debias)
+
+        # In place, as self._zscale_op(m)
+        if self.flag_non_linear == buts.ZScaleEnum.ROOT3:
+            data -= m
+            np.power(data, 0.3, out=data)
+        elif self.flag_non_linear == buts.ZScaleEnum.LOG:
+            data -= m
+            data += 1
+            np.log10(data, out=data)
+
+        op = self._zscale_op(m)
+        m, M = op(np.float64(m)), op(np.float64(M))
+
+        data -= m
+        with np.errstate(divide='ignore', invalid='ignore'):
+            np.divide(data, M - m, out=data)
+
+        self.data_zmapped = data
+
+    def _zscale_bounds(self) -> Tuple[float, float, bool]:
+        '''
+        From self.crop_stats - returns (m, M, clipping on)
+        '''
+        assert self.data_debias is not None
 
         # Temp variables to distinguish per-frame autoclip (nonlinear modes)
         # Against persistent, user-set clipping
@@ -306,44 +488,94 @@ class GenericViewerBackend:
 
         if low_clip is None and self.flag_non_linear != buts.ZScaleEnum.LIN:
             # Clip to the 80-th percentile (for log modes by default
-            low_clip = np.percentile(self.data_debias[1:, 1:], 0.8)
+            low_clip = self.low_clip_tracker.update(self.data_debias[1:, 1:])
 
         if low_clip:
             m = low_clip
         else:
-            m = self.data_plot_min
+            m = self.crop_stats.min
 
         if high_clip:
             M = high_clip
         else:
-            M = self.data_plot_max
+            M = self.crop_stats.max
 
-        if low_clip or high_clip:
-            data = np.clip(self.data_debias, m, M)
-        else:
-            data = self.data_debias.copy()
+        # As python floats: crop_stats holds numpy scalars of the frame dtype,
+        # and e.g. M - m + 1 wraps around in uint16.
+        return float(m), float(M), bool(low_clip or high_clip)
 
+    def _zscale_op(self, m: float) -> Callable:
         if self.flag_non_linear == buts.ZScaleEnum.LIN:  # linear
-            op = lambda x: x
+            return lambda x: x
         elif self.flag_non_linear == buts.ZScaleEnum.ROOT3:  # pow .33
-            op = lambda x: (x - m)**0.3
+            return lambda x: (x - m)**0.3
         elif self.flag_non_linear == buts.ZScaleEnum.LOG:  # log
-            op = lambda x: np.log10(x - m + 1)
+            return lambda x: np.log10(x - m + 1)
         else:
             raise AssertionError(
                     f"self.flag_non_linear {self.flag_non_linear} is invalid")
 
-        data = op(data)
-        m, M = op(m), op(M)
-
-        self.data_zmapped = (data - m) / (M - m)
-
     def _data_coloring(self) -> None:
         '''
         self.data_zmapped -> self.data_rgbimg
         '''
-        # Coloring with cmap, 0-255 uint8, discard alpha channel
-        self.data_rgbimg = self.cmap(self.data_zmapped, bytes=True)[:, :, :-1]
+        assert self.data_zmapped is not None
+
+        self._alloc_rgb_buffers(self.data_zmapped.shape)
+
+        # Quantize [0, 1] into LUT entries, as the colormap call would.
+        # Out of range (NaNs of a flat frame included) is clipped by take.
+        with np.errstate(invalid='ignore'):
+            np.multiply(self.data_zmapped, len(self.cmap_lut),
+                        out=self._lut_index, casting='unsafe')
+        np.take(self._cmap_lut_u32, self._lut_index, out=self._rgbx_u32,
+                mode='clip')
+
+    def _alloc_rgb_buffers(self, shape: Tuple[int, ...]) -> None:
+        # (Re)allocated upon crop changes only
+        self._lut_index = self._buffer('lut_index', shape, np.intp)
+        # Colored straight into the back of the output double buffer.
+        self.data_rgbximg = self.output_buffer.back(shape + (4, ))
+        self._rgbx_u32 = self.data_rgbximg.view(np.uint32)[:, :, 0]
+        self.data_rgbimg = self.data_rgbximg[:, :, :3]
+
+    def _data_int_coloring(self) -> None:
+        '''
+        self.data_debias (uint16) -> self.data_rgbimg
+
+        Integer fast path, without dark / ref subtraction nor averaging:
+        clip, z-scaling and colormap are compiled into a table of the 65536
+        raw values, rebuilt only when one of them changes. Mapping a frame
+        is then a single gather, instead of three float passes.
+        self.data_zmapped is not computed.
+        '''
+        assert self.data_debias is not None
+
+        m, M, _ = self._zscale_bounds()
+
+        key = (m, M, self.flag_non_linear, self.cmap_id)
+        if key != self._int_lut_key:
+            self._int_lut = self._make_int_lut(m, M)
+            self._int_lut_key = key
+        self.data_zmapped = None
+
+        self._alloc_rgb_buffers(self.data_debias.shape)
+        # take would convert the indices to intp in a temporary: do it here.
+        np.copyto(self._lut_index, self.data_debias)
+        np.take(self._int_lut, self._lut_index, out=self._rgbx_u32, mode='clip')
+
+    def _make_int_lut(self, m: float, M: float) -> np.ndarray:
+        '''
+        uint32 RGBX of every uint16 value, as _data_zscaling and
+        _data_coloring would map it.
+        '''
+        # Always clipped: out-of-range values end on the colormap ends anyway.
+        values = np.clip(np.arange(1 << 16, dtype=np.float64), m, M)
+        op = self._zscale_op(m)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            zmapped = (op(values) - op(m)) / (op(M) - op(m))
+            index = (zmapped * len(self.cmap_lut)).astype(np.intp)
+        return np.take(self._cmap_lut_u32, index, mode='clip')
 
     def process_shortcut(self, mods: int, key: int) -> None:
         '''
@@ -359,8 +591,9 @@ class GenericViewerBackend:
         this_shortcut = buts.Shortcut(key=key, modifier_mask=mods)
 
         if this_shortcut in self.SHORTCUTS:
-            # Call the mapped callable
-            self.SHORTCUTS[this_shortcut]()
+            # Call the mapped callable - not in the middle of a frame.
+            with self.pipeline_lock:
+                self.SHORTCUTS[this_shortcut]()
 
 
 class FirstViewerBackend(GenericViewerBackend):
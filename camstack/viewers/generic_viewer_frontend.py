@@ -29,7 +29,6 @@ from . import frontend_utils as futs
 from . import plugins, image_stacking_plugins
 
 import numpy as np
-from PIL import Image
 
 
 class GenericViewerFrontend:
@@ -41,6 +40,9 @@ class GenericViewerFrontend:
 
     CARTOON_FILE: Op[str] = None
 
+    # Backend pipeline in its own thread, the loop only displays its latest frame
+    BACKGROUND_PROCESSING = True
+
     def __init__(self, system_zoom: int, fps: int,
                  display_base_size: Tuple[int, int],
                  fonts_zoom: Op[int] = None) -> None:
@@ -63,8 +65,16 @@ class GenericViewerFrontend:
         # Data area width x height, after window scale
         self.data_disp_size = (self.data_disp_basesize[0] * self.system_zoom,
                                self.data_disp_basesize[1] * self.system_zoom)
-        self.data_blit_staging = np.zeros((*self.data_disp_size, 3),
-                                          dtype=np.uint8)
+        # RGBX, one uint32 per pixel - data_blit_staging is the RGB view
+        self.data_blit_staging_rgbx = np.zeros((*self.data_disp_size, 4),
+                                               dtype=np.uint8)
+        self.data_blit_staging = self.data_blit_staging_rgbx[:, :, :3]
+        self._staging_u32 = self.data_blit_staging_rgbx.view(np.uint32)[:, :, 0]
+        # Rescaling of the backend frames, see _prepare_resize
+        self._resize_src_shape: Op[Tuple[int, ...]] = None
+        self._resize_index: Op[np.ndarray] = None
+        self._resize_target: Op[np.ndarray] = None
+        self._resized_u32: Op[np.ndarray] = None
         # Total window size
         self.pygame_win_size = (self.data_disp_size[0], self.data_disp_size[1] +
                                 self.BOTTOM_PX_PAD * self.system_zoom)
@@ -207,8 +217,8 @@ class GenericViewerFrontend:
         self.lbl_cropzone.render(tuple(self.backend_obj.input_shm.get_crop()),
                                  blit_onto=self.pg_screen)
         self.lbl_times.render((tint, fps, ndr), blit_onto=self.pg_screen)
-        self.lbl_t_minmax.render((tint * ndr, self.backend_obj.data_min,
-                                  self.backend_obj.data_max),
+        stats = self.backend_obj.frame_stats
+        self.lbl_t_minmax.render((tint * ndr, stats.min, stats.max),
                                  blit_onto=self.pg_screen)
 
         self.pg_updated_rects += [
@@ -232,11 +242,16 @@ class GenericViewerFrontend:
         '''
         Post-init loop entry point
 
+        - Starts the backend processing thread (BACKGROUND_PROCESSING)
         - Calls self.loop_iter()
         - Updates display
         - Calls self.process_pygame_events and propagates quitting.
         - Timer click
         '''
+        assert self.backend_obj
+
+        if self.BACKGROUND_PROCESSING:
+            self.backend_obj.start_processing_thread()
         try:
             while True:
                 self.loop_iter()
@@ -247,6 +262,15 @@ class GenericViewerFrontend:
         except KeyboardInterrupt:
             pygame.quit()
             print('Abort loop on KeyboardInterrupt')
+        finally:
+            self.backend_obj.stop_processing_thread()
+            self.print_frame_counts()
+
+    def print_frame_counts(self) -> None:
+        assert self.backend_obj
+        out_buf = self.backend_obj.output_buffer
+        print(f'Frames processed: {self.backend_obj.n_processed}, '
+              f'displayed: {out_buf.n_read}, skipped: {out_buf.n_skipped}')
 
     def process_pygame_events(self) -> bool:
         '''
@@ -270,64 +294,84 @@ class GenericViewerFrontend:
 
         return False
 
-    def loop_iter(self) -> None:
-        assert self.backend_obj
-
-        self.pg_updated_rects = []
-
-        self.backend_obj.data_iter()
-
-        data_output = self.backend_obj.data_rgbimg
-        assert data_output is not None  # backend is init, data_output is not None
-
-        img = Image.fromarray(data_output)
-
-        # Rescale and pad if necessary - using PIL is much faster than scipy.ndimage
-        # Embedding the system zoom through PIL is also more efficient than doing it in numpy
-        if data_output.shape[:2] != self.data_disp_basesize:
-            row_fac = data_output.shape[0] / self.data_disp_basesize[0]
-            col_fac = data_output.shape[1] / self.data_disp_basesize[1]
+    def _prepare_resize(self, src_shape: Tuple[int, ...]) -> None:
+        '''
+        Nearest-neighbor rescaling of backend frames of src_shape into the
+        staging buffer, as a flat gather index. Upon crop changes only.
+        '''
+        rows, cols = self.data_disp_size
+        if src_shape[:2] != self.data_disp_basesize:
+            row_fac = src_shape[0] / self.data_disp_basesize[0]
+            col_fac = src_shape[1] / self.data_disp_basesize[1]
 
             if abs(row_fac / col_fac - 1) < 0.05:
                 # Rescale both to size, no pad, even if that means a little distortion
-                self.data_blit_staging = np.asarray(
-                        img.resize(self.data_disp_size[::-1], Image.NEAREST))
-
+                pass
             elif row_fac > col_fac:
                 # Rescale based on rows, pad columns
-                csize = self.system_zoom *\
-                                int(round(data_output.shape[1] / row_fac))
-                cskip = (self.data_disp_size[1] - csize) // 2
-                self.data_blit_staging[:, cskip:-cskip, :] = \
-                    np.asarray(img.resize((csize, self.data_disp_size[0]),
-                                    Image.NEAREST))
-                self.data_blit_staging[:, :cskip, :] = 0
-                # This is gonna be trouble with odd sizes, but we should be OK.
-                self.data_blit_staging[:, -cskip:, :] = 0
-
-            elif col_fac >= row_fac:
-                # Rescale based on columns, pad rows
-                rsize = self.system_zoom *\
-                    int(round(data_output.shape[0] / col_fac))
-                rskip = (self.data_disp_size[0] - rsize) // 2
-                self.data_blit_staging[rskip:-rskip, :, :] = \
-                    np.asarray(img.resize((self.data_disp_size[1], rsize),
-                                   Image.NEAREST))
-                self.data_blit_staging[:rskip, :, :] = 0
-                self.data_blit_staging[-rskip:, :, :] = 0
+                cols = self.system_zoom * int(round(src_shape[1] / row_fac))
             else:
-                raise ValueError("row_fac / col_fac calculation messed up.")
+                # Rescale based on columns, pad rows
+                rows = self.system_zoom * int(round(src_shape[0] / col_fac))
+
+        rskip = (self.data_disp_size[0] - rows) // 2
+        cskip = (self.data_disp_size[1] - cols) // 2
+        self.data_blit_staging_rgbx[:] = 0  # Padding, never written again
+        self._resize_target = self._staging_u32[rskip:rskip + rows,
+                                                cskip:cskip + cols]
+        if self._resize_target.flags.c_contiguous:
+            self._resized_u32 = self._resize_target
+        else:
+            self._resized_u32 = np.zeros((rows, cols), dtype=np.uint32)
+
+        # Source pixel under the center of each target pixel, as PIL's NEAREST
+        src_r = ((np.arange(rows) + 0.5) *
+                 (src_shape[0] / rows)).astype(np.intp)
+        src_c = ((np.arange(cols) + 0.5) *
+                 (src_shape[1] / cols)).astype(np.intp)
+        self._resize_index = src_r[:, None] * src_shape[1] + src_c[None, :]
+        self._resize_src_shape = src_shape
+
+    def _stage_frame(self, data_rgbx: np.ndarray) -> None:
+        if data_rgbx.shape != self._resize_src_shape:
+            self._prepare_resize(data_rgbx.shape)
+        assert self._resize_index is not None
+        assert self._resized_u32 is not None
+
+        # Rescale (and pad): a single gather of whole RGBX pixels,
+        # into persistent buffers - no allocation.
+        src = data_rgbx.view(np.uint32).ravel()
+        np.take(src, self._resize_index, out=self._resized_u32, mode='clip')
+        if self._resized_u32 is not self._resize_target:
+            np.copyto(self._resize_target, self._resized_u32)
+
+    def loop_iter(self) -> None:
+        assert self.backend_obj
+
+        self.pg_updated_rects = []
+
+        if self.backend_obj.processing_error is not None:
+            raise RuntimeError('Viewer processing thread failed: '
+                               f'{self.backend_obj.processing_error}')
+
+        if self.backend_obj.processing_thread is None:
+            self.backend_obj.data_iter()
 
-        else:  # Data is the native display size.
-            self.data_blit_staging = np.asarray(
-                    img.resize((self.data_disp_size[::-1]), Image.NEAREST))
+        with self.backend_obj.output_buffer.latest() as data_rgbx:
+            # None: no new frame since the last loop, the staging is current.
+            if data_rgbx is not None:
+                self._stage_frame(data_rgbx)
 
         pygame.surfarray.blit_array(self.pg_datasurface, self.data_blit_staging)
 
-        # Drawing for toggled modes
-        self._inloop_plugin_modes()
-        # Manage labels
-        self._inloop_update_labels()
+        # Plugins and labels read the backend state: none before the first
+        # frame, and not in the middle of one (same lock as the shortcuts).
+        if self.backend_obj.flag_data_init:
+            with self.backend_obj.pipeline_lock:
+                # Drawing for toggled modes
+                self._inloop_plugin_modes()
+                # Manage labels
+                self._inloop_update_labels()
 
         # Finally
         self.pg_screen.blit(self.pg_datasurface, self.pg_data_rect)
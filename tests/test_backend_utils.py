@@ -0,0 +1,129 @@
+'''
+    Viewer backend helpers: percentiles, frame statistics, frame buffer.
+'''
+import numpy as np
+import pytest
+
+from camstack.viewers import backend_utils as buts
+
+Q = [0., 1., 10., 50., 99., 99.5, 100.]
+
+
+@pytest.mark.parametrize('dtype', [np.uint8, np.uint16])
+def test_fast_percentile_exact_for_uint(dtype):
+    rng = np.random.default_rng(0)
+    high = 200 if dtype == np.uint8 else 5000
+    data = rng.integers(0, high, (64, 48)).astype(dtype)
+
+    np.testing.assert_allclose(buts.fast_percentile(data, Q, None),
+                               np.percentile(data, Q))
+    assert buts.fast_percentile(data, 50., None) == np.percentile(data, 50.)
+
+
+def test_fast_percentile_constant_frame():
+    data = np.full((10, 10), 7, dtype=np.uint16)
+    np.testing.assert_array_equal(buts.fast_percentile(data, Q), 7.)
+
+
+def test_fast_percentile_float():
+    rng = np.random.default_rng(1)
+    data = rng.normal(0., 1., (64, 48)).astype(np.float32)
+    np.testing.assert_allclose(buts.fast_percentile(data, Q, None),
+                               np.percentile(data, Q), rtol=1e-6)
+
+
+def test_fast_percentile_subsampled():
+    rng = np.random.default_rng(2)
+    data = rng.integers(0, 1000, (512, 512)).astype(np.uint16)
+    # 1/16 of the pixels: within 1% of the range, not exact.
+    approx = buts.fast_percentile(data, [1., 50., 99.], max_samples=1 << 14)
+    np.testing.assert_allclose(approx, np.percentile(data, [1., 50., 99.]),
+                               atol=10.)
+
+
+def test_percentile_tracker_smoothing():
+    tracker = buts.PercentileTracker(50., smoothing=0.5, max_samples=None)
+    assert tracker.update(np.full((4, 4), 100., dtype=np.float32)) == 100.
+    assert tracker.update(np.full((4, 4), 200., dtype=np.float32)) == 150.
+
+    tracker.reset()
+    assert tracker.update(np.full((4, 4), 200., dtype=np.float32)) == 200.
+
+
+def test_percentile_tracker_integer_rounding():
+    tracker = buts.PercentileTracker(50., smoothing=0.8, max_samples=None)
+    tracker.update(np.full((4, 4), 100, dtype=np.uint16))
+    value = tracker.update(np.full((4, 4), 101, dtype=np.uint16))
+    assert value == 100.  # 100.2, rounded
+    assert isinstance(value, float)
+
+
+@pytest.mark.parametrize('dtype', [np.uint16, np.int32, np.float32])
+def test_frame_stats(dtype, monkeypatch):
+    # Small chunks: several of them, and a partial last one.
+    monkeypatch.setattr(buts, 'STATS_CHUNK_BYTES', 3 * 50 * 4)
+    rng = np.random.default_rng(3)
+    data = rng.integers(0, 4000, (37, 50)).astype(dtype)
+
+    stats = buts.frame_stats(data)
+    assert stats.min == data.min()
+    assert stats.max == data.max()
+    assert stats.sum == data.sum(dtype=np.float64)
+    assert stats.mean == pytest.approx(data.mean(dtype=np.float64))
+    assert stats.n_pix == data.size
+    assert stats.hist is None
+
+
+def test_frame_stats_hist(monkeypatch):
+    monkeypatch.setattr(buts, 'STATS_CHUNK_BYTES', 1024)
+    rng = np.random.default_rng(4)
+    data = rng.integers(0, 256, (40, 30)).astype(np.uint8)
+
+    stats = buts.frame_stats(data, with_hist=True)
+    assert stats.hist is not None
+    assert len(stats.hist) == 256
+    np.testing.assert_array_equal(stats.hist,
+                                  np.bincount(data.ravel(), minlength=256))
+
+    # No histogram of float data
+    assert buts.frame_stats(data.astype(np.float32), True).hist is None
+
+
+def test_frame_stats_no_overflow():
+    data = np.full((100, 100), 65535, dtype=np.uint16)
+    assert buts.frame_stats(data).sum == 65535 * 10000
+
+
+def test_latest_frame_buffer():
+    buf = buts.LatestFrameBuffer()
+    with buf.latest() as front:
+        assert front is None  # Nothing published yet
+
+    back = buf.back((4, 4))
+    back[:] = 1
+    assert buf.publish() is back
+    with buf.latest() as front:
+        assert front is back
+    with buf.latest() as front:
+        assert front is None  # Already read
+
+    # Two buffers, swapped: no allocation once both exist.
+    second = buf.back((4, 4))
+    assert second is not back
+    buf.publish()
+    assert buf.back((4, 4)) is back
+
+    assert buf.back((4, 5)) is not back  # Shape change
+
+
+def test_latest_frame_buffer_skips():
+    buf = buts.LatestFrameBuffer()
+    for value in range(3):
+        buf.back((2, 2))[:] = value
+        buf.publish()
+    with buf.latest() as front:
+        assert (front == 2).all()
+
+    assert buf.n_published == 3
+    assert buf.n_skipped == 2
+    assert buf.n_read == 1
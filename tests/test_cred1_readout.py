@@ -0,0 +1,107 @@
+'''
+    CRED1 readout state machine: readout_transition, and set_NDR against the
+    emulated serial protocol.
+'''
+import threading
+
+import pytest
+
+from camstack.cams.cred1 import CRED1, ROMODES, readout_transition
+from camstack.core.serial_emulators import CRED1Emulator
+
+
+@pytest.mark.parametrize('current, NDR, cmds', [
+        (None, 1, ['set nbreadworeset 1', 'set mode globalresetsingle']),
+        ((ROMODES.cds, 2), 2, []),
+        ((ROMODES.cds, 2), 1,
+         ['set nbreadworeset 1', 'set mode globalresetsingle']),
+        ((ROMODES.bursts, 3), 8, ['set nbreadworeset 8']),
+        ((ROMODES.bursts, 8), 2,
+         ['set nbreadworeset 2', 'set mode globalresetcds']),
+        ((ROMODES.single, 2), 2, ['set mode globalresetcds']),
+])
+def test_readout_transition(current, NDR, cmds):
+    assert readout_transition(current, NDR) == cmds
+
+
+def test_readout_modes():
+    modes = [ROMODES.for_NDR(n) for n in (1, 2, 3, 20)]
+    assert modes == [
+            ROMODES.single, ROMODES.cds, ROMODES.bursts, ROMODES.bursts
+    ]
+
+
+class StuckModeEmulator(CRED1Emulator):
+    '''
+        Acknowledges "set mode" - and keeps the current one.
+    '''
+
+    def _set_mode(self, mode: str) -> str:
+        if 'mode_resets_gain' in self.quirks:
+            self.gain = 1
+        return 'OK'
+
+
+class CurrentMode:
+    fps = 100.
+
+
+def make_cred1(emulator: CRED1Emulator) -> CRED1:
+    '''
+        Just what set_NDR needs, without a framegrabber.
+    '''
+    cam = object.__new__(CRED1)
+    cam.edt_iface = emulator
+    cam._serial_lock = threading.Lock()
+    cam.cooldown = None
+    cam._start_pending = False
+    cam.camera_shm = None
+    cam.current_mode = CurrentMode
+    cam._ro_state = None
+    cam._gain = None
+    cam.NDR = None
+    cam._set_formatted_keyword = lambda *args: None
+    return cam
+
+
+def test_set_NDR_restores_gain():
+    emulator = CRED1Emulator(latency=0., quirks={'mode_resets_gain'})
+    emulator.gain = 5
+    cam = make_cred1(emulator)
+
+    assert cam.set_NDR(1) == 1
+    assert (emulator.readout_mode, emulator.ndr) == (ROMODES.single, 1)
+    assert emulator.gain == 5
+    assert cam._ro_state == (ROMODES.single, 1)
+
+    cam.set_NDR(6)
+    assert (emulator.readout_mode, emulator.ndr) == (ROMODES.bursts, 6)
+    assert cam._ro_state == (ROMODES.bursts, 6)
+
+
+def test_set_NDR_resends_after_external_change():
+    emulator = CRED1Emulator(latency=0.)
+    cam = make_cred1(emulator)
+    cam.set_NDR(1)
+
+    # Behind our back
+    emulator.readout_mode = ROMODES.cds
+    assert cam.set_NDR(1) == 1
+    assert emulator.readout_mode == ROMODES.single
+
+
+def test_set_NDR_raises_on_mismatch():
+    emulator = StuckModeEmulator(latency=0., quirks={'mode_resets_gain'})
+    cam = make_cred1(emulator)
+
+    with pytest.raises(AssertionError):
+        cam.set_NDR(1)
+    # Nothing cached is trusted afterwards
+    assert cam._ro_state is None
+    assert cam._gain is None
+
+
+@pytest.mark.parametrize('NDR', [0, 2.])
+def test_set_NDR_illegal(NDR):
+    with pytest.raises(AssertionError):
+        make_cred1(CRED1Emulator(latency=0.)).set_NDR(NDR)
@@ -0,0 +1,154 @@
+'''
+    DCAMCoalescer: batching rules, coalescing across threads, failures.
+'''
+from typing import Any, Dict, List
+
+import time
+import threading
+
+import pytest
+
+from camstack.core.dcam_mailbox import DCAMCoalescer
+
+GET = DCAMCoalescer.GET_FLAG
+
+
+def get(prop: int) -> str:
+    return f'{prop | GET:08x}'
+
+
+def put(prop: int) -> str:
+    return f'{prop:08x}'
+
+
+def keys(batch) -> List[str]:
+    return [key for key, _, _ in batch]
+
+
+def wait_until(cond, timeout: float = 2.) -> None:
+    deadline = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def pending(*keys: str):
+    return [(key, 0., None) for key in keys]
+
+
+@pytest.fixture
+def coalescer() -> DCAMCoalescer:
+    return DCAMCoalescer(lambda request: request, window=0.)
+
+
+def test_cut_distinct_props(coalescer):
+    todo = pending(put(1), get(2), put(3))
+    assert coalescer._cut(todo) == (todo, [])
+
+
+def test_cut_gets_merge(coalescer):
+    todo = pending(get(1), get(1), put(2))
+    assert coalescer._cut(todo) == (todo, [])
+
+
+@pytest.mark.parametrize('first, second', [(put(1), put(1)), (put(1), get(1)),
+                                           (get(1), put(1))])
+def test_cut_keeps_order(coalescer, first, second):
+    todo = pending(put(2), first, get(3), second, put(4))
+    batch, rest = coalescer._cut(todo)
+    assert keys(batch) == [put(2), first, get(3)]
+    assert keys(rest) == [second, put(4)]
+
+
+def test_cut_empty(coalescer):
+    assert coalescer._cut([]) == ([], [])
+
+
+def test_coalescing_across_threads():
+    requests: List[Dict[str, Any]] = []
+    release = threading.Event()
+
+    def transact(request: Dict[str, Any]) -> Dict[str, Any]:
+        requests.append(dict(request))
+        release.wait(2.)  # Let the others pile up
+        return {key: val * 10 for key, val in request.items()}
+
+    coalescer = DCAMCoalescer(transact, window=0.)
+    results: Dict[int, List[Any]] = {}
+
+    def worker(prop: int) -> None:
+        results[prop] = coalescer.submit([(put(prop), float(prop))])
+
+    threads = [threading.Thread(target=worker, args=(p, )) for p in range(8)]
+    threads[0].start()
+    wait_until(lambda: requests)
+    for thread in threads[1:]:
+        thread.start()
+    wait_until(lambda: len(coalescer._pending) == 7)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == {p: [p * 10.] for p in range(8)}
+    # The leader's own, then all the others at once.
+    assert coalescer.n_transactions == len(requests) == 2
+    assert coalescer.n_requests == 8
+
+
+def test_transaction_error_fails_batch():
+
+    def transact(request: Dict[str, Any]) -> Dict[str, Any]:
+        raise TimeoutError('no answer')
+
+    coalescer = DCAMCoalescer(transact, window=0.)
+    with pytest.raises(TimeoutError):
+        coalescer.submit([(put(1), 1.)])
+    assert not coalescer._leader_active
+
+
+def test_missing_answer():
+    coalescer = DCAMCoalescer(lambda request: {}, window=0.)
+    with pytest.raises(KeyError):
+        coalescer.submit([(get(1), 0.)])
+
+
+def test_leader_interrupted_fails_waiters():
+    entered = threading.Event()
+    release = threading.Event()
+
+    def transact(request: Dict[str, Any]) -> Dict[str, Any]:
+        entered.set()
+        release.wait(2.)
+        raise KeyboardInterrupt
+
+    coalescer = DCAMCoalescer(transact, window=0.)
+    errors: List[BaseException] = []
+
+    def leader() -> None:
+        try:
+            coalescer.submit([(put(1), 1.)])
+        except BaseException as exc:
+            errors.append(exc)
+
+    lead_thread = threading.Thread(target=leader)
+    lead_thread.start()
+    entered.wait(2.)
+
+    def waiter() -> None:
+        try:
+            coalescer.submit([(put(2), 2.)])
+        except BaseException as exc:
+            errors.append(exc)
+
+    wait_thread = threading.Thread(target=waiter)
+    wait_thread.start()
+    wait_until(lambda: coalescer._pending)
+    release.set()
+    lead_thread.join(2.)
+    wait_thread.join(2.)
+
+    # Nobody left hanging
+    assert not lead_thread.is_alive() and not wait_thread.is_alive()
+    assert len(errors) == 2
+    assert all(isinstance(exc, KeyboardInterrupt) for exc in errors)
+    assert not coalescer._leader_active
@@ -0,0 +1,205 @@
+'''
+    DCAMMailbox against a fake take process, which answers the mailbox
+    protocol the way hwacq-dcamtake is expected to (see the docstring of
+    camstack.core.dcam_mailbox).
+'''
+from typing import Any, Dict, List
+
+import time
+import threading
+
+import numpy as np
+import pytest
+
+from camstack.core import dcam_mailbox as mbx
+from camstack.core.dcam_mailbox import DCAMMailbox
+
+GET_FLAG = 0x80000000
+
+
+class FakeControlSHM:
+    '''
+        The <stream>_params_fb SHM: keywords, and a semaphore posted by
+        set_data.
+    '''
+
+    def __init__(self) -> None:
+        self._kws: Dict[str, Any] = {}
+        self._data = np.zeros((1, ), dtype=np.int16)
+        self._cv = threading.Condition()
+        self._posts = 0
+
+    def get_keywords(self) -> Dict[str, Any]:
+        with self._cv:
+            return dict(self._kws)
+
+    def reset_keywords(self, kws: Dict[str, Any]) -> None:
+        with self._cv:
+            self._kws = dict(kws)
+
+    def get_data(self, check: bool = False, checkSemAndFlush: bool = True,
+                 timeout: float = None) -> np.ndarray:
+        if check:
+            with self._cv:
+                if checkSemAndFlush:
+                    self._posts = 0
+                if not self._cv.wait_for(lambda: self._posts > 0, timeout):
+                    raise TimeoutError
+                self._posts -= 1
+        return self._data.copy()
+
+    def set_data(self, data: np.ndarray) -> None:
+        with self._cv:
+            self._data = np.array(data)
+            self._posts += 1
+            self._cv.notify_all()
+
+
+class FakeTaker:
+    '''
+        Polls the mailbox between "frames", as the take process does.
+    '''
+
+    def __init__(self, shm: FakeControlSHM, version: int) -> None:
+        self.shm = shm
+        self.version = version
+        self.props: Dict[int, float] = {}
+        self.commands: List[int] = []
+
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+        # Upon startup: advertise the protocol version
+        kws = shm.get_keywords()
+        kws[mbx.KW_VERSION] = version
+        shm.reset_keywords(kws)
+
+    def __enter__(self) -> 'FakeTaker':
+        self._thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(0.001):
+            kws = self.shm.get_keywords()
+            if (mbx.KW_REQ not in kws or
+                        kws[mbx.KW_REQ] == kws.get(mbx.KW_ACK)):
+                continue
+
+            for key in list(kws):
+                if key.startswith('_'):
+                    continue
+                hexkey = int(key, 16)
+                prop = hexkey & ~GET_FLAG
+                if not hexkey & GET_FLAG:
+                    self.props[prop] = kws[key]
+                kws[key] = self.props.get(prop, 0.)
+
+            self.commands += [kws.get(mbx.KW_CMD, mbx.CMD_NONE)]
+            kws[mbx.KW_VERSION] = self.version
+            kws[mbx.KW_ACK] = kws[mbx.KW_REQ]
+            self.shm.reset_keywords(kws)
+            self.shm.set_data(self.shm.get_data())
+
+
+@pytest.fixture
+def shm() -> FakeControlSHM:
+    return FakeControlSHM()
+
+
+def test_probe_and_transact(shm):
+    mailbox = DCAMMailbox(shm, timeout=2.)
+    with FakeTaker(shm, version=2) as taker:
+        assert mailbox.probe()
+        assert mailbox.version == 2
+
+        answer = mailbox.transact({'00000010': 3.0})
+        assert answer['00000010'] == 3.0
+        answer = mailbox.transact({f'{0x10 | GET_FLAG:08x}': 0.})
+        assert answer[f'{0x10 | GET_FLAG:08x}'] == 3.0
+        assert taker.props == {0x10: 3.0}
+
+    assert mailbox.seq == 3  # Probe + 2 requests
+    assert mailbox.n_transactions == 2
+
+
+def test_client_never_writes_version(shm):
+    mailbox = DCAMMailbox(shm, timeout=0.05)
+    mailbox.supported = True
+    with pytest.raises(TimeoutError):
+        mailbox.transact({'00000010': 1.0})
+    assert mbx.KW_VERSION not in shm.get_keywords()
+
+
+def test_seq_wraparound(shm):
+    shm.reset_keywords({mbx.KW_ACK: mbx.SEQ_WRAP - 1})
+    mailbox = DCAMMailbox(shm, timeout=2.)
+    with FakeTaker(shm, version=1):
+        assert mailbox.probe()
+        assert mailbox.seq == mbx.SEQ_WRAP
+
+        mailbox.transact({'00000010': 1.0})
+        assert mailbox.seq == 1
+        assert shm.get_keywords()[mbx.KW_ACK] == 1
+
+
+def test_stale_version_not_trusted(shm):
+    # Left over by a dead take process: nobody answers.
+    shm.reset_keywords({mbx.KW_VERSION: 2, '00000010': 1.0})
+    mailbox = DCAMMailbox(shm, timeout=0.1)
+
+    assert not mailbox.probe()
+    assert not mailbox.can_abort()
+
+
+def test_reset_clears_version_only(shm):
+    mailbox = DCAMMailbox(shm, timeout=2.)
+    with FakeTaker(shm, version=2):
+        assert mailbox.probe()
+
+    mailbox.reset()
+    assert not mailbox.supported
+    assert not mailbox.can_abort()
+    kws = shm.get_keywords()
+    assert mbx.KW_VERSION not in kws
+    assert mbx.KW_ACK in kws  # Startup parameters and sequence are kept
+
+
+def test_transaction_latency(shm):
+    mailbox = DCAMMailbox(shm, timeout=2.)
+    with FakeTaker(shm, version=1):
+        mailbox.probe()
+        t_start = time.monotonic()
+        mailbox.transact({'00000010': 1.0})
+        assert time.monotonic() - t_start < 0.5
+
+
+def test_abort_command(shm):
+    mailbox = DCAMMailbox(shm, timeout=2.)
+    with FakeTaker(shm, version=2) as taker:
+        assert mailbox.probe()
+        assert mailbox.can_abort()
+        answer = mailbox.transact({'00000010': 0.1}, command=mbx.CMD_ABORT,
+                                  timeout=0.5)
+        assert answer['00000010'] == 0.1
+    assert taker.commands[-1] == mbx.CMD_ABORT
+
+
+def test_no_abort_for_version_1(shm):
+    mailbox = DCAMMailbox(shm, timeout=2.)
+    with FakeTaker(shm, version=1) as taker:
+        assert mailbox.probe()
+        assert not mailbox.can_abort()
+        with pytest.raises(AssertionError):
+            mailbox.transact({'00000010': 0.1}, command=mbx.CMD_ABORT)
+    assert mbx.CMD_ABORT not in taker.commands
+
+
+def test_no_abort_for_legacy(shm):
+    mailbox = DCAMMailbox(shm, timeout=2.)
+    assert not mailbox.probe()  # Nothing advertised
+    with pytest.raises(AssertionError):
+        mailbox.transact({'00000010': 0.1}, command=mbx.CMD_ABORT)
@@ -0,0 +1,111 @@
+'''
+    FLICropEngine: register computation, and apply() against the emulated
+    CRED1 serial protocol.
+'''
+from typing import List
+
+import pytest
+
+from camstack.cams.fli_cropping import FLICropEngine, FLICropState
+from camstack.core.serial_emulators import CRED1Emulator
+
+
+class Link:
+    '''
+        send_command of the camera classes: the answer without the prompt.
+        Records the set commands, and can swallow some.
+    '''
+
+    def __init__(self, emulator: CRED1Emulator) -> None:
+        self.emulator = emulator
+        self.sent: List[str] = []
+        self.n_swallow = 0
+
+    def __call__(self, cmd: str) -> str:
+        if cmd.startswith('set'):
+            self.sent += [cmd]
+            if self.n_swallow > 0:
+                self.n_swallow -= 1
+                return ''
+        answer = self.emulator.send_command(cmd)
+        return answer[:-len(self.emulator.PROMPT)]
+
+
+@pytest.fixture
+def emulator() -> CRED1Emulator:
+    return CRED1Emulator(latency=0.)
+
+
+@pytest.fixture
+def link(emulator) -> Link:
+    return Link(emulator)
+
+
+def cred1_engine(link: Link) -> FLICropEngine:
+    return FLICropEngine(link, col_block=32, index_base=1, poll_interval=0.001,
+                         timeout=0.5)
+
+
+def test_target_state_cred1(link):
+    engine = cred1_engine(link)
+    state = engine.target_state(64, 191, 10, 137)
+    assert state == FLICropState(True, (3, 6), (11, 138))
+    assert engine.pixels_from_state(state) == (64, 191, 10, 137)
+
+
+def test_target_state_cred2(link):
+    engine = FLICropEngine(link)
+    state = engine.target_state(5, 100, 0, 511, on=False)
+    assert state == FLICropState(False, (5, 100), (0, 511))
+    assert engine.pixels_from_state(state) == (5, 100, 0, 511)
+
+
+@pytest.mark.parametrize('x0, x1', [(16, 191), (64, 190), (0, 0)])
+def test_target_state_unaligned(link, x0, x1):
+    with pytest.raises(AssertionError):
+        cred1_engine(link).target_state(x0, x1, 0, 255)
+
+
+def test_apply_sends_diff_only(emulator, link):
+    engine = cred1_engine(link)
+    assert engine.apply(64, 191, 0, 255) == (64, 191, 0, 255)
+    # Rows were already full frame
+    assert link.sent == ['set cropping on', 'set cropping columns 3-6']
+    assert emulator.cropping and emulator.crop_cols == (3, 6)
+
+    link.sent = []
+    assert engine.apply(64, 191, 0, 255) == (64, 191, 0, 255)
+    assert link.sent == []  # Nothing to do
+
+    engine.apply(64, 191, 0, 127, on=None)
+    assert link.sent == ['set cropping rows 1-128']
+
+
+def test_apply_waits_for_readback(emulator, link):
+    emulator.quirks.add('crop_settle')
+    emulator.CROP_SETTLE_TIME = 0.05
+    engine = cred1_engine(link)
+
+    assert engine.apply(0, 127, 0, 63) == (0, 127, 0, 63)
+    assert len(link.sent) == 3  # No re-send
+
+
+def test_apply_resends_swallowed(emulator, link):
+    engine = cred1_engine(link)
+    engine.timeout = 0.05
+    link.n_swallow = 1
+
+    assert engine.apply(0, 127, 0, 255) == (0, 127, 0, 255)
+    # Second round: only what the readback still lacks
+    assert link.sent == [
+            'set cropping on', 'set cropping columns 1-4', 'set cropping on'
+    ]
+
+
+def test_apply_fails(emulator, link):
+    engine = cred1_engine(link)
+    engine.timeout = 0.02
+    link.n_swallow = 100
+
+    with pytest.raises(AssertionError):
+        engine.apply(0, 127, 0, 255)
@@ -0,0 +1,91 @@
+'''
+    FramePacer on a fake clock: deadlines, overruns, statistics.
+'''
+import pytest
+
+from camstack.core import frame_pacer
+from camstack.core.frame_pacer import FramePacer
+
+MS = 1_000_000  # ns
+
+
+class FakeClock:
+    '''
+        Stands for the time module. Each read advances by tick_ns (the busy
+        wait); sleeps overshoot by oversleep_ns.
+    '''
+
+    def __init__(self, tick_ns: int = 1000, oversleep_ns: int = 0) -> None:
+        self.now_ns = 0
+        self.tick_ns = tick_ns
+        self.oversleep_ns = oversleep_ns
+        self.sleeps = []
+
+    def monotonic_ns(self) -> int:
+        self.now_ns += self.tick_ns
+        return self.now_ns
+
+    def sleep(self, sec: float) -> None:
+        self.sleeps += [sec]
+        self.now_ns += int(sec * 1e9) + self.oversleep_ns
+
+
+@pytest.fixture
+def clock(monkeypatch) -> FakeClock:
+    clock = FakeClock()
+    monkeypatch.setattr(frame_pacer, 'time', clock)
+    return clock
+
+
+def test_absolute_deadlines(clock):
+    pacer = FramePacer(10 * MS, spin_margin_ns=MS)
+    pacer.wait()  # Immediate: the first deadline is the construction time
+    pacer.reset_stats()
+    t0 = pacer.deadline_ns
+    for k in range(1, 6):
+        pacer.wait()
+        # Slow frame processing doesn't shift the schedule.
+        clock.now_ns += 3 * MS
+        assert pacer.deadline_ns == t0 + k * 10 * MS
+
+    assert pacer.n_overruns == 0
+    # Slept until the spin margin, busy waited the rest.
+    assert all(s * 1e9 < 10 * MS for s in clock.sleeps)
+    mean, rms, max_late = pacer.stats_us()
+    assert max_late <= clock.tick_ns * 1e-3
+    assert 0 <= mean <= rms <= max_late
+
+
+def test_oversleep_without_spin(clock):
+    clock.oversleep_ns = 50_000
+    pacer = FramePacer(10 * MS, spin_margin_ns=0)
+    pacer.wait()  # Immediate
+    late = pacer.wait()
+    assert late >= 50_000
+    assert pacer.stats_us()[2] == pytest.approx(late * 1e-3)
+
+
+def test_overrun_restarts_schedule(clock):
+    pacer = FramePacer(10 * MS, spin_margin_ns=0)
+    pacer.wait()
+    clock.now_ns += 35 * MS  # Missed 3 deadlines
+    late = pacer.wait()
+
+    assert late > 10 * MS
+    assert pacer.n_overruns == 1
+    # No burst: the next deadline is a period from now.
+    assert pacer.deadline_ns == clock.now_ns + 10 * MS
+
+
+def test_set_period_and_reset_stats(clock):
+    pacer = FramePacer(10 * MS, spin_margin_ns=0)
+    pacer.wait()
+    first = pacer.deadline_ns
+    pacer.set_period(5 * MS)
+    pacer.wait()
+    assert pacer.deadline_ns == first + 5 * MS
+
+    assert pacer.n_frames == 2
+    pacer.reset_stats()
+    assert pacer.n_frames == 0
+    assert pacer.stats_us() == (0., 0., 0.)
@@ -0,0 +1,71 @@
+'''
+    PixelUnpacker against the reference packing, for every format.
+'''
+import numpy as np
+import pytest
+
+from camstack.core.pixel_unpack import (DATA_BITS, UNPACKERS, PixelUnpacker,
+                                        _pack_reference)
+
+SHAPE = (12, 20)
+
+
+def random_frame(fmt: str, shape=SHAPE, seed: int = 0) -> np.ndarray:
+    bits = DATA_BITS.get(fmt, UNPACKERS[fmt][1])
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 1 << bits, shape, dtype=np.uint16)
+
+
+@pytest.mark.parametrize('fmt', list(UNPACKERS))
+def test_roundtrip(fmt):
+    pixels = random_frame(fmt)
+    # Extremes, in the last group too (unpacked separately).
+    pixels[0, :4] = 0
+    pixels[-1, -4:] = (1 << DATA_BITS.get(fmt, UNPACKERS[fmt][1])) - 1
+
+    unpacker = PixelUnpacker(fmt, SHAPE)
+    raw = _pack_reference(pixels, fmt)
+    assert raw.size == unpacker.n_bytes
+    np.testing.assert_array_equal(unpacker(raw), pixels)
+
+
+@pytest.mark.parametrize('fmt', list(UNPACKERS))
+def test_persistent_buffer_reused(fmt):
+    unpacker = PixelUnpacker(fmt, SHAPE)
+    first = unpacker(_pack_reference(random_frame(fmt, seed=1), fmt))
+    pixels = random_frame(fmt, seed=2)
+    second = unpacker(_pack_reference(pixels, fmt))
+    assert second is first
+    np.testing.assert_array_equal(second, pixels)
+
+
+@pytest.mark.parametrize('fmt', list(UNPACKERS))
+def test_msb_align(fmt):
+    pixels = random_frame(fmt)
+    unpacker = PixelUnpacker(fmt, SHAPE, msb_align=True)
+    data_bits = DATA_BITS.get(fmt, UNPACKERS[fmt][1])
+    np.testing.assert_array_equal(unpacker(_pack_reference(pixels, fmt)),
+                                  pixels << (16 - data_bits))
+
+
+def test_out_and_longer_raw():
+    fmt = 'Mono12p'
+    pixels = random_frame(fmt)
+    # Driver buffers may be padded past the frame.
+    raw = np.concatenate([
+            _pack_reference(pixels, fmt),
+            np.full(64, 0xff, dtype=np.uint8)
+    ])
+
+    unpacker = PixelUnpacker(fmt, SHAPE)
+    out = np.zeros(SHAPE, dtype=np.uint16)
+    assert unpacker(raw, out=out) is out
+    np.testing.assert_array_equal(out, pixels)
+    assert not unpacker.out.any()  # Untouched
+
+
+def test_unsupported():
+    with pytest.raises(ValueError):
+        PixelUnpacker('Mono14p', SHAPE)
+    with pytest.raises(ValueError):
+        PixelUnpacker('Mono10p', (3, 3))  # Not whole groups of 4
@@ -0,0 +1,175 @@
+'''
+    Serial emulators: answer formats, state, quirks and environment setup.
+'''
+import time
+
+import pytest
+
+from camstack.core import serial_emulators as emu
+
+
+@pytest.fixture(params=[emu.CRED1Emulator, emu.CRED2Emulator])
+def fli(request) -> emu._FLIEmulator:
+    return request.param(latency=0.)
+
+
+def test_fli_format(fli):
+    assert fli.send_command('set led on') == 'OK\r\nfli-cli>'
+    assert fli.send_command('  nbreadworeset raw ') == f'{fli.ndr}\r\nfli-cli>'
+    assert fli.send_command('bogus').startswith('Unknown command')
+    assert fli.n_commands == 3
+
+
+def test_fli_fps_clamped_and_notified(fli):
+    notified = []
+    fli.fps_callback = notified.append
+
+    fli.send_command('set fps 1e9')
+    assert fli.fps == fli.max_fps()
+    assert notified == [fli.fps]
+    fps = float(fli.send_command('fps raw')[:-len(fli.PROMPT)])
+    assert fps == pytest.approx(fli.max_fps())
+
+
+def test_fli_fps_callback_errors_contained(fli):
+
+    def failing(fps: float) -> None:
+        raise RuntimeError
+
+    fli.fps_callback = failing
+    assert fli.send_command('set fps 10').startswith('OK')
+
+
+def test_cred1_cropping():
+    cam = emu.CRED1Emulator(latency=0.)
+    assert cam.send_command('cropping raw') == 'off:1-10:1-256\r\nfli-cli>'
+    full_fps = cam.max_fps()
+
+    cam.send_command('set cropping columns 3-4')
+    cam.send_command('set cropping rows 1-64')
+    cam.send_command('set cropping on')
+    assert cam.send_command('cropping raw') == 'on:3-4:1-64\r\nfli-cli>'
+    assert cam._crop_size() == (64, 64)
+    assert cam.max_fps() > full_fps
+
+
+def test_crop_settle_quirk():
+    cam = emu.CRED1Emulator(latency=0., quirks={'crop_settle'})
+    cam.CROP_SETTLE_TIME = 0.05
+    cam.send_command('set cropping columns 3-4')
+    assert cam.send_command('cropping raw').startswith('off:1-10')
+
+    time.sleep(0.06)
+    assert cam.send_command('cropping raw').startswith('off:3-4')
+
+
+def test_cred1_mode_resets_gain_quirk():
+    plain = emu.CRED1Emulator(latency=0.)
+    quirky = emu.CRED1Emulator(latency=0., quirks={'mode_resets_gain'})
+    for cam in (plain, quirky):
+        cam.send_command('set gain 10')
+        cam.send_command('set mode globalresetsingle')
+        assert cam.readout_mode == 'globalresetsingle'
+    assert plain.gain == 10
+    assert quirky.gain == 1
+
+    assert plain.send_command('set mode bogus').startswith('Unknown mode')
+    plain.send_command('set gain 100')
+    assert plain.gain == plain.max_gain
+
+
+def test_cred1_cold_start_quirk():
+    cam = emu.CRED1Emulator(latency=0., quirks={'cold_start'})
+    cam.COOLDOWN_TIME = 0.
+    assert cam.send_command('status raw').startswith('ready')
+    temp = cam.send_command('temp cryostat diode raw')[:-len(cam.PROMPT)]
+    assert float(temp) == 290.
+
+    cam.send_command('set cooling on')
+    assert cam.send_command('status raw').startswith('operational')
+    assert emu.CRED1Emulator(latency=0.).status == 'operational'
+
+
+def test_ndr_fps_rescale_quirk():
+    cam = emu.CRED2Emulator(latency=0., quirks={'ndr_fps_rescale'})
+    cam.send_command('set fps 100')
+    cam.send_command('set nbreadworeset 2')
+    assert cam.ndr == 2
+    assert cam.fps == cam.max_fps()
+
+
+def test_cred2_tint_follows_fps():
+    cam = emu.CRED2Emulator(latency=0.)
+    cam.send_command('set fps 100')
+    cam.send_command('set tint 1')
+    assert cam.tint == cam.max_tint()
+    cam.send_command('set fps 200')
+    assert cam.tint < 1. / 200
+    assert cam.send_command('set sensibility bogus').startswith('Unknown')
+
+
+def test_unknown_quirk_warns(caplog):
+    emu.CRED1Emulator(latency=0., quirks={'no_such_quirk'})
+    assert 'no_such_quirk' in caplog.text
+
+
+def test_ocam2k():
+    cam = emu.OCAM2KEmulator(latency=0.)
+    assert cam.send_command('fps') == '\r\n<1>[2000]'
+    assert cam.send_command('fps 3000') == '\r\n<2>[-1][2000]'  # Unbinned
+    cam.send_command('binning on')
+    assert cam.send_command('fps 3000') == '\r\n<1>[3000]'
+    assert cam.send_command('bogus') == '\r\n<1>[-1]'
+
+    temps = cam.send_command('temp')
+    assert temps.startswith('\r\n<10>[20.0]')
+
+
+def test_ocam2k_binning_trips_synchro_quirk():
+    cam = emu.OCAM2KEmulator(latency=0., quirks={'binning_trips_synchro'})
+    cam.send_command('synchro on')
+    cam.send_command('binning on')
+    assert not cam.synchro
+
+
+def test_nuvu():
+    cam = emu.NUVUEmulator(latency=0.)
+    assert cam.send_command('ld') == '0\r\nOK\r\n>'
+    config = cam.send_command('ld 2').split('\r\n')
+    assert config[-2:] == ['OK', '>']
+    assert 'ReadoutMode:CONV_1MHz_10MHz' in config
+    assert cam.send_command('ld 9').startswith('Invalid readout mode')
+
+    assert cam.send_command('seg 1e6').startswith('emgain:5000.00')
+    assert cam.send_command('bogus').split('\r\n') == [
+            'Unknown command', 'ERROR', '>'
+    ]
+
+
+def test_nuvu_acquisition_fps():
+    cam = emu.NUVUEmulator(latency=0.)
+    notified = []
+    cam.fps_callback = notified.append
+    cam.send_command('se 8')
+    cam.send_command('sw 2')
+    cam.send_command('re -1')
+    assert cam.acquiring
+    assert notified == [100.]
+    cam.send_command('abort')
+    assert not cam.acquiring
+
+
+def test_emulator_from_env(monkeypatch):
+    monkeypatch.delenv(emu.ENV_EMULATE, raising=False)
+    assert emu.emulator_from_env('cam', 'cred1') is None
+
+    monkeypatch.setenv(emu.ENV_EMULATE, '1')
+    monkeypatch.setenv(emu.ENV_EMULATE_LATENCY, '0.002')
+    monkeypatch.setenv(emu.ENV_EMULATE_QUIRKS, 'crop_settle, mode_resets_gain')
+    cam = emu.emulator_from_env('cam', 'cred1')
+    assert isinstance(cam, emu.CRED1Emulator)
+    assert cam.latency == 0.002
+    assert cam.quirks == {'crop_settle', 'mode_resets_gain'}
+
+    assert emu.emulator_from_env('cam', 'no_such_model') is None
+    assert emu.emulator_from_env('cam', None) is None
@@ -0,0 +1,99 @@
+'''
+    SHMFrameWriter: in-place write / post sequence, and the set_data fallback.
+'''
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+from camstack.core.shm_ring import SHMFrameWriter
+
+SHAPE = (4, 6)
+
+
+class FakeImage:
+    '''
+        pyMilk Image: the data buffer, the metadata, the semaphores.
+    '''
+
+    def __init__(self, data: np.ndarray) -> None:
+        self.data = data
+        self.md = SimpleNamespace(write=0, cnt0=0, cnt1=0)
+        self.posts = []  # md.write at each sempost
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        return self.data
+
+    def sempost(self, index: int) -> None:
+        assert index == -1
+        self.posts += [self.md.write]
+
+
+class FakeSHM:
+
+    def __init__(self, shape, dtype, inplace: bool = True) -> None:
+        self.data = np.zeros(shape, dtype=dtype)
+        if inplace:
+            self.IMAGE = FakeImage(self.data)
+        self.n_set = 0
+
+    def get_data(self, reform: bool = True) -> np.ndarray:
+        return self.data.copy()
+
+    def set_data(self, data: np.ndarray) -> None:
+        self.data[:] = data
+        self.n_set += 1
+
+
+def test_inplace_write_sequence():
+    shm = FakeSHM(SHAPE, np.uint16)
+    writer = SHMFrameWriter(shm, SHAPE, np.uint16)
+    image = shm.IMAGE
+
+    with writer.frame(t_us=1) as dest:
+        assert image.md.write == 1  # Flagged during the fill
+        assert np.shares_memory(dest, shm.data)
+        dest[:] = 7
+
+    assert (shm.data == 7).all()
+    assert image.md.write == 0
+    assert image.posts == [0]  # Posted once, after the write flag is reset
+    assert (image.md.cnt0, image.md.cnt1) == (1, 0)
+    assert shm.n_set == 0
+
+
+def test_inplace_ring_slices():
+    shape = (3, *SHAPE)
+    shm = FakeSHM(shape, np.float32)
+    writer = SHMFrameWriter(shm, SHAPE, np.float32, depth=3)
+
+    for k in range(5):
+        assert writer.write(np.full(SHAPE, k), t_us=k) == k % 3
+        assert shm.IMAGE.md.cnt1 == k % 3
+
+    np.testing.assert_array_equal(shm.data[:, 0, 0], [3, 4, 2])
+    assert shm.IMAGE.md.cnt0 == writer.count == 5
+
+
+def test_failed_fill_not_posted():
+    shm = FakeSHM(SHAPE, np.uint16)
+    writer = SHMFrameWriter(shm, SHAPE, np.uint16)
+
+    with pytest.raises(RuntimeError):
+        with writer.frame(t_us=1):
+            raise RuntimeError
+    assert shm.IMAGE.md.write == 0
+    assert shm.IMAGE.posts == []
+    assert writer.count == 0
+
+
+@pytest.mark.parametrize('inplace', [False, True])
+def test_fallback_set_data(inplace):
+    # No IMAGE, or an IMAGE of an unexpected dtype
+    shm = FakeSHM(SHAPE, np.float32, inplace=inplace)
+    writer = SHMFrameWriter(shm, SHAPE, np.uint16)
+
+    writer.write(np.full(SHAPE, 3), t_us=1)
+    writer.write(np.full(SHAPE, 4), t_us=2)
+    assert shm.n_set == 2
+    assert (shm.data == 4).all()
@@ -36,6 +36,7 @@ from scxkw.redisutil.typed_db import Redis
 from pyMilk.interfacing.isio_shmlib import SHM
 
 import camstack.viewers.viewer_common as cvc
+from camstack.viewers.backend_utils import fast_percentile
 
 home = os.getenv('HOME')  # Expected /home/scexao
 conf_dir = home + "/conf/apapane_aux/"
@@ -126,11 +127,11 @@ def arr2im(arr, vmin=0., vmax=10000.0, pwr=1.0, subt_ref=False, lin_scale=True,
                          cen_cols[1] - quart_size:cen_cols[1] +
                          quart_size]].astype(np.float32)
 
-    lmin = np.percentile(arr2, 0.1)
+    lmin = fast_percentile(arr2, 0.1)
     arr2 -= lmin
     mask = arr2 > 0
     arr2 *= mask
-    lmax = np.percentile(arr2, 99.95)
+    lmax = fast_percentile(arr2, 99.95)
     mask = arr2 < lmax
     arr2 *= mask
     arr2 += (1 - mask) * lmax
@@ -1764,7 +1765,8 @@ while True:  # the main game loop
                         time.sleep(2)
                         temp, isat = get_img_data(bias, badpixmap)
                         temp *= badpixmap
-                        isat = np.percentile(temp[1:-1, 1:-1], 99.995)
+                        isat = fast_percentile(temp[1:-1, 1:-1], 99.995,
+                                               max_samples=None)
                         temp -= bias
                         imax = np.max(temp)
                         #print imax, isat, tindex
@@ -1778,7 +1780,8 @@ while True:  # the main game loop
                         time.sleep(2)
                         temp, isat = get_img_data(bias, badpixmap)
                         temp *= badpixmap
-                        isat = np.percentile(temp[1:-1, 1:-1], 99.995)
+                        isat = fast_percentile(temp[1:-1, 1:-1], 99.995,
+                                               max_samples=None)
                         temp -= bias
                         imax = np.max(temp)
                         #print imax, isat, tindex
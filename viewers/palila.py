@@ -53,6 +53,7 @@ from scxkw.redisutil.typed_db import Redis
 from pyMilk.interfacing.isio_shmlib import SHM
 
 import camstack.viewers.viewer_common as cvc
+from camstack.viewers.backend_utils import fast_percentile
 
 home = os.getenv('HOME')  # Expected /home/scexao
 conf_dir = home + "/conf/palila_aux/"
@@ -127,7 +128,7 @@ def arr2im(arr, vmin=0., vmax=10000.0, pwr=1.0, subt_ref=False, lin_scale=True,
         arr2 = arr.astype(np.float32)
 
     if not lin_scale:
-        lmin = np.percentile(arr2, 0.8)
+        lmin = fast_percentile(arr2, 0.8)
         arr2 -= lmin
         mask = arr2 > 0
         arr2 *= mask
@@ -1930,7 +1931,8 @@ while True:  # the main game loop
                         time.sleep(2)
                         temp, isat = get_img_data(bias, badpixmap)
                         temp *= badpixmap
-                        isat = np.percentile(temp[1:-1, 1:-1], 99.995)
+                        isat = fast_percentile(temp[1:-1, 1:-1], 99.995,
+                                               max_samples=None)
                         temp -= bias
                         imax = np.max(temp)
                         #print imax, isat, tindex
@@ -1944,7 +1946,8 @@ while True:  # the main game loop
                         time.sleep(2)
                         temp, isat = get_img_data(bias, badpixmap)
                         temp *= badpixmap
-                        isat = np.percentile(temp[1:-1, 1:-1], 99.995)
+                        isat = fast_percentile(temp[1:-1, 1:-1], 99.995,
+                                               max_samples=None)
                         temp -= bias
                         imax = np.max(temp)
                         #print imax, isat, tindex
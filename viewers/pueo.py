@@ -30,6 +30,7 @@ import datetime as dt
 from astropy.io import fits as pf
 from pyMilk.interfacing.isio_shmlib import SHM
 import camstack.viewers.viewer_common as cvc
+from camstack.viewers.backend_utils import fast_percentile
 
 MILK_SHM_DIR = os.environ['MILK_SHM_DIR']
 home = os.getenv('HOME')
@@ -276,7 +277,7 @@ while True:  # the main game loop
     # read image
     temp = get_img_data()
     #temp = np.squeeze(np.mean(temp, axis=0))
-    isat = np.percentile(temp, 99.995)
+    isat = fast_percentile(temp, 99.995)
     if subt_bias:
         temp -= bias
     if average == True:
@@ -311,7 +312,7 @@ while True:  # the main game loop
         diffyb = m.pow(abs(diffy), 0.5) * 30 * zoom * m.sqrt(2) * diffy / diffr
 
     imax = np.max(temp2)
-    imin = np.percentile(temp2, 0.5)
+    imin = fast_percentile(temp2, 0.5)
     temp2b = temp2 - imin
     temp2b *= temp2b > 0
     if subt_ref: